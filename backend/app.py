@@ -2,10 +2,14 @@ from fastapi import FastAPI, HTTPException, Query, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from db_control import models, schemas, crud, connect
-from routers import minutes, summary, chat
+from routers import minutes, summary, chat, upload
+from utils import embedding_cache
 import os
+import asyncio
+import worker
 from dotenv import load_dotenv
 from utils.auth import get_current_user_id  #あとで消す
+from utils.upload import UploadSizeLimitMiddleware
 import logging
 
 # ロギングの設定
@@ -22,6 +26,10 @@ load_dotenv()
 # フロントエンドのURLを環境変数から取得
 frontend_url = os.getenv("FRONTEND_URL", "http://localhost:3000")  # デフォルトをローカル開発環境に設定
 
+# 一括アップロードのサイズ上限を、ボディ全体を受信する前に検証する
+# （CORSのヘッダーを413の応答にも付けるため、CORSより先に追加して内側に置く）
+app.add_middleware(UploadSizeLimitMiddleware, paths=["/api/upload_video"])
+
 # CORSの設定
 app.add_middleware(
     CORSMiddleware,
@@ -34,15 +42,41 @@ app.add_middleware(
 # DB初期化
 models.Base.metadata.create_all(bind=connect.engine)
 
+# 動画処理のジョブは、APIとは別プロセスのワーカー（python worker.py）が処理する
+# 1プロセスで動かす開発環境では、EMBEDDED_WORKER=true を設定するとAPIプロセス内でジョブワーカーを起動する
+# （APIを複数プロセスで起動する場合は、プロセスごとにワーカーが起動するため設定しない）
+EMBEDDED_WORKER = os.getenv("EMBEDDED_WORKER", "false").lower() == "true"
+worker_stop_event = None
+worker_task = None
+
+@app.on_event("startup")
+async def start_embedded_worker():
+    global worker_stop_event, worker_task
+    if EMBEDDED_WORKER:
+        worker_stop_event = asyncio.Event()
+        worker_task = asyncio.create_task(worker.run_worker(worker_stop_event))
+
+@app.on_event("shutdown")
+async def stop_embedded_worker():
+    if worker_task:
+        worker_stop_event.set()
+        await worker_task
+
 # ルーターを追加
 app.include_router(minutes.router)
 app.include_router(summary.router)
 app.include_router(chat.router)
+app.include_router(upload.router)
 
 @app.get("/")
 def root():
     return {"message": "Welcome to the Minutes API"}
 
+@app.get("/api/embedding_cache_stats")
+def embedding_cache_stats(user_id: str = Depends(get_current_user_id)):
+    """ベクトル化キャッシュのヒット数・ミス数（このプロセスで起動してからの累計）を返す"""
+    return embedding_cache.get_stats()
+
 @app.get("/test-user-id") #あとで消す
 def test_user_id(user_id: str = Depends(get_current_user_id)):
     return {"user_id": user_id}
\ No newline at end of file
@@ -0,0 +1,59 @@
+"""
+類似度検索のベンチマーク（python benchmark_similarity.py）
+
+チャンク数100・1,000・10,000件について、チャンクごとに類似度を計算する従来の方法と、
+SimilarityIndex（行列積1回とargpartition）による検索の1回あたりの時間を比較する
+"""
+from types import SimpleNamespace
+from utils.similarity import SimilarityIndex
+from db_control.vector_codec import encode_vector
+import time
+import numpy as np
+
+DIMENSIONS = 1536
+CHUNK_COUNTS = [100, 1_000, 10_000]
+QUERY_BATCH_SIZE = 16
+
+def _measure(function, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat * 1000
+
+def _loop_search(query, chunks_with_embeddings, vectors, threshold, max_results):
+    # 従来の方法（チャンクごとに類似度を計算し、全件を並べ替える）
+    similarities = []
+    for (chunk, embedding), vector in zip(chunks_with_embeddings, vectors):
+        similarity = float(np.dot(query, vector) / (np.linalg.norm(query) * np.linalg.norm(vector)))
+        if similarity >= threshold:
+            similarities.append((chunk, embedding, similarity))
+    similarities.sort(key=lambda x: x[2], reverse=True)
+    return similarities[:max_results]
+
+def main():
+    rng = np.random.default_rng(0)
+    print(f"{'チャンク数':>10} {'従来(ms)':>10} {'構築(ms)':>10} {'検索(ms)':>10} {f'{QUERY_BATCH_SIZE}件一括(ms)':>14}")
+    for count in CHUNK_COUNTS:
+        vectors = rng.standard_normal((count, DIMENSIONS)).astype(np.float32)
+        chunks_with_embeddings = [
+            (SimpleNamespace(id=i), SimpleNamespace(vector=encode_vector(vector), embedding=None))
+            for i, vector in enumerate(vectors)
+        ]
+        query = vectors[count // 2] + rng.standard_normal(DIMENSIONS).astype(np.float32) * 0.1
+        queries = np.vstack([query] * QUERY_BATCH_SIZE)
+
+        repeat = max(1, 1000 // count)
+        loop_ms = _measure(lambda: _loop_search(query, chunks_with_embeddings, vectors, 0.0, 5), repeat)
+        build_ms = _measure(lambda: SimilarityIndex.from_chunks(chunks_with_embeddings), repeat)
+        index = SimilarityIndex.from_chunks(chunks_with_embeddings)
+        search_ms = _measure(lambda: index.search(query, 0.0, 5), repeat * 10)
+        batch_ms = _measure(lambda: index.search_batch(queries, 0.0, 5), repeat * 10)
+
+        expected = [chunk.id for chunk, _, _ in _loop_search(query, chunks_with_embeddings, vectors, 0.0, 5)]
+        actual = [index.items[row][0].id for row, _ in index.search(query, 0.0, 5)]
+        assert expected == actual, f"検索結果が一致しません: {expected} != {actual}"
+
+        print(f"{count:>10} {loop_ms:>10.2f} {build_ms:>10.2f} {search_ms:>10.3f} {batch_ms:>14.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,8 @@ from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
 import os
 from db_control.models import Base
+from db_control.migrate import run_migrations
+from db_control import pgvector
 
 load_dotenv()
 
@@ -18,6 +20,10 @@ engine = create_engine(
 
 # テーブル作成（すでに存在するテーブルはスキップされる）
 Base.metadata.create_all(bind=engine)
+# 既存テーブルへのカラム追加
+run_migrations(engine)
+# pgvectorが使える場合は、データベース側での近傍検索を用意する
+pgvector.setup(engine)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
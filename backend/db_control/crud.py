@@ -1,11 +1,11 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import func, or_, and_, literal
 from sqlalchemy.exc import IntegrityError
-from . import models, schemas
+from . import models, schemas, vector_codec, pgvector
 import os
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 import logging
-from typing import List, Tuple, Optional
+from typing import List, Tuple, Optional, Dict, Sequence
 
 logger = logging.getLogger(__name__)
 
@@ -22,13 +22,14 @@ async def create_minutes(db: Session, user_id: str, filename: str = None) -> int
     db.refresh(db_minutes)
     return db_minutes.id
 
-async def create_video(db: Session, minutes_id: int, video_url: str = None) -> int:
+async def create_video(db: Session, minutes_id: int, video_url: str = None, status: str = "queued", content_hash: str = None) -> int:
     db_video = models.Video(
         minutes_id=minutes_id,
         video_url=video_url,
-        image_url=None,  # サムネイル画像はしばらく使用しない
-        status="queued",
-        progress=0
+        image_url=None,  # サムネイル画像は処理中に生成して設定する
+        status=status,
+        progress=0,
+        content_hash=content_hash
     )
     db.add(db_video)
     db.commit()
@@ -43,39 +44,60 @@ async def update_video_status(db: Session, minutes_id: int, status: str, progres
             video.progress = progress
         db.commit()
 
-async def create_transcript(db: Session, video_id: int, content: str) -> int:
+async def create_transcript(db: Session, video_id: int, content: str, is_complete: bool = True) -> int:
     db_transcript = models.Transcript(
         video_id=video_id,
         content=content,
         is_summaried=False,
-        is_embedded=False
+        is_embedded=False,
+        is_complete=is_complete
     )
     db.add(db_transcript)
     db.commit()
     db.refresh(db_transcript)
     return db_transcript.id
 
-async def create_transcript_chunk(db: Session, transcript_id: int, chunk_index: int, content: str) -> int:
+async def create_transcript_chunk(db: Session, transcript_id: int, chunk_index: int, content: str, char_start: int = None) -> int:
     db_chunk = models.TranscriptChunk(
         transcript_id=transcript_id,
         chunk_index=chunk_index,
-        content=content
+        content=content,
+        char_start=char_start,
+        char_end=char_start + len(content) if char_start is not None else None
     )
     db.add(db_chunk)
     db.commit()
     db.refresh(db_chunk)
     return db_chunk.id
 
-async def create_vector_embedding(db: Session, chunk_id: int, embedding: str) -> int:
+async def create_vector_embedding(db: Session, chunk_id: int, embedding: Sequence[float]) -> int:
     db_embedding = models.VectorEmbedding(
         chunk_id=chunk_id,
-        embedding=embedding
+        vector=vector_codec.encode_vector(embedding)
     )
     db.add(db_embedding)
+    db.flush()
+    pgvector.sync_chunks(db, [chunk_id])
     db.commit()
     db.refresh(db_embedding)
     return db_embedding.id
 
+async def create_vector_embeddings(db: Session, embeddings: List[Tuple[int, Sequence[float]]]) -> None:
+    """
+    複数のチャンクのベクトルをまとめて保存する（バイナリに変換して保存する）
+    
+    Args:
+        db (Session): データベースセッション
+        embeddings (List[Tuple[int, Sequence[float]]]): (チャンクID, ベクトル) のリスト
+    """
+    db.add_all([
+        models.VectorEmbedding(chunk_id=chunk_id, vector=vector_codec.encode_vector(embedding))
+        for chunk_id, embedding in embeddings
+    ])
+    db.flush()
+    pgvector.sync_chunks(db, [chunk_id for chunk_id, _ in embeddings])
+    db.commit()
+
 def get_minutes(db: Session, minutes_id: int):
     minutes = db.query(models.Minutes).filter(models.Minutes.id == minutes_id).first()
     if minutes:
@@ -102,19 +124,154 @@ async def update_video_progress(db: Session, minutes_id: int, progress: int) ->
     Returns:
         bool: 更新が成功したかどうか
     """
-    try:
-        video = db.query(models.Video).filter(models.Video.minutes_id == minutes_id).first()
-        if not video:
-            return False
+    return set_video_progress(db, minutes_id, progress)
+
+def set_video_progress(db: Session, minutes_id: int, progress: int) -> bool:
+    """
+    動画の処理進捗を1回のUPDATE文で更新する（行を読み込まない）
+    
+    Args:
+        db (Session): データベースセッション
+        minutes_id (int): 議事録ID
+        progress (int): 進捗状況（0-100）
         
-        video.progress = progress
+    Returns:
+        bool: 更新が成功したかどうか
+    """
+    try:
+        updated = db.query(models.Video).filter(models.Video.minutes_id == minutes_id).update(
+            {"progress": progress},
+            synchronize_session=False
+        )
         db.commit()
-        return True
+        return updated > 0
     except Exception as e:
         db.rollback()
         print(f"進捗更新中にエラーが発生: {str(e)}")
         return False
 
+async def update_transcript_content(db: Session, transcript_id: int, content: str, is_complete: bool = False) -> None:
+    """
+    文字起こしの内容を更新する（処理中は完了したセグメントまでの内容で上書きしていく）
+    
+    Args:
+        db (Session): データベースセッション
+        transcript_id (int): 文字起こしID
+        content (str): 文字起こしの内容
+        is_complete (bool): 文字起こしが最後まで完了したかどうか
+    """
+    db.query(models.Transcript).filter(models.Transcript.id == transcript_id).update(
+        {"content": content, "is_complete": is_complete},
+        synchronize_session=False
+    )
+    db.commit()
+
+def get_transcript_state(db: Session, video_id: int) -> Optional[Tuple[int, bool]]:
+    """
+    文字起こしのIDと完了フラグを取得する（内容は読み込まない）
+    
+    Returns:
+        Optional[Tuple[int, bool]]: (文字起こしID, 完了したかどうか)。文字起こしがない場合はNone
+    """
+    row = db.query(models.Transcript.id, models.Transcript.is_complete).filter(
+        models.Transcript.video_id == video_id
+    ).first()
+    return (row.id, row.is_complete) if row else None
+
+def save_transcript_segments(db: Session, transcript_id: int, first_seq: int, segments: List[Tuple[int, int, int, int]]) -> int:
+    """
+    文字起こしセグメントの再生位置と文字位置をまとめて登録する
+    
+    Args:
+        db (Session): データベースセッション
+        transcript_id (int): 文字起こしID
+        first_seq (int): 最初のセグメントの通し番号
+        segments (List[Tuple[int, int, int, int]]): (開始ミリ秒, 終了ミリ秒, 開始文字位置, 終了文字位置) のリスト（時刻順）
+        
+    Returns:
+        int: 次のセグメントの通し番号
+    """
+    db.bulk_insert_mappings(models.TranscriptSegment, [
+        {
+            "transcript_id": transcript_id,
+            "seq": first_seq + i,
+            "start_ms": start_ms,
+            "end_ms": end_ms,
+            "char_start": char_start,
+            "char_end": char_end
+        }
+        for i, (start_ms, end_ms, char_start, char_end) in enumerate(segments)
+    ])
+    db.commit()
+    return first_seq + len(segments)
+
+def delete_transcript_segments(db: Session, transcript_id: int) -> None:
+    """文字起こしセグメントを削除する（途中まで登録された文字起こしを先頭から登録し直す場合に使う）"""
+    db.query(models.TranscriptSegment).filter(
+        models.TranscriptSegment.transcript_id == transcript_id
+    ).delete(synchronize_session=False)
+    db.commit()
+
+def get_transcript_segment_at(db: Session, transcript_id: int, time_ms: int) -> Optional[models.TranscriptSegment]:
+    """
+    指定した再生位置で話されているセグメントを取得する
+    
+    (transcript_id, start_ms)のインデックスで、開始時刻が指定位置以前の最後のセグメントを1件だけ引く。
+    先頭のセグメントより前の位置を指定した場合は先頭のセグメントを返す
+    
+    Args:
+        db (Session): データベースセッション
+        transcript_id (int): 文字起こしID
+        time_ms (int): 動画の先頭からの再生位置（ミリ秒）
+        
+    Returns:
+        Optional[models.TranscriptSegment]: セグメント。タイムスタンプがない場合はNone
+    """
+    query = db.query(models.TranscriptSegment).filter(models.TranscriptSegment.transcript_id == transcript_id)
+    segment = query.filter(
+        models.TranscriptSegment.start_ms <= time_ms
+    ).order_by(models.TranscriptSegment.start_ms.desc()).first()
+    if segment:
+        return segment
+    return query.order_by(models.TranscriptSegment.start_ms.asc()).first()
+
+def get_chunk_time_range(db: Session, chunk: models.TranscriptChunk) -> Optional[Tuple[int, int]]:
+    """
+    チャンクに対応する再生範囲を取得する
+    
+    (transcript_id, char_start)のインデックスで、チャンクの先頭と末尾を含むセグメントをそれぞれ1件だけ引く
+    
+    Args:
+        db (Session): データベースセッション
+        chunk (models.TranscriptChunk): チャンク
+        
+    Returns:
+        Optional[Tuple[int, int]]: (開始ミリ秒, 終了ミリ秒)。文字位置やタイムスタンプがない場合はNone
+    """
+    if chunk.char_start is None or chunk.char_end is None:
+        return None
+    query = db.query(models.TranscriptSegment).filter(models.TranscriptSegment.transcript_id == chunk.transcript_id)
+    first = query.filter(
+        models.TranscriptSegment.char_start <= chunk.char_start
+    ).order_by(models.TranscriptSegment.char_start.desc()).first()
+    if not first:
+        first = query.order_by(models.TranscriptSegment.char_start.asc()).first()
+    last = query.filter(
+        models.TranscriptSegment.char_start < chunk.char_end
+    ).order_by(models.TranscriptSegment.char_start.desc()).first()
+    if not first or not last:
+        return None
+    return first.start_ms, max(first.end_ms, last.end_ms)
+
+def get_chunk_at_position(db: Session, transcript_id: int, char_position: int) -> Optional[models.TranscriptChunk]:
+    """
+    文字起こし全体の中の文字位置を含むチャンクを取得する（(transcript_id, char_start)のインデックスで1件だけ引く）
+    """
+    return db.query(models.TranscriptChunk).filter(
+        models.TranscriptChunk.transcript_id == transcript_id,
+        models.TranscriptChunk.char_start <= char_position
+    ).order_by(models.TranscriptChunk.char_start.desc()).first()
+
 async def update_transcript_embedded(db: Session, transcript_id: int) -> bool:
     """
     文字起こしデータの埋め込み完了フラグを更新する
@@ -394,6 +551,44 @@ def get_transcript_chunks_with_embeddings(db: Session, transcript_id: int):
         models.TranscriptChunk.chunk_index
     ).all()
 
+def get_transcript_embedding_version(db: Session, transcript_id: int) -> Tuple[int, Optional[int]]:
+    """
+    文字起こしのベクトルの件数と最大のIDを取得する（類似度検索のインデックスが最新かの確認に使う）
+    
+    Args:
+        db (Session): データベースセッション
+        transcript_id (int): 文字起こしID
+        
+    Returns:
+        Tuple[int, Optional[int]]: (ベクトルの件数, ベクトルIDの最大値)
+    """
+    count, max_id = db.query(
+        func.count(models.VectorEmbedding.id),
+        func.max(models.VectorEmbedding.id)
+    ).join(
+        models.TranscriptChunk,
+        models.TranscriptChunk.id == models.VectorEmbedding.chunk_id
+    ).filter(
+        models.TranscriptChunk.transcript_id == transcript_id
+    ).one()
+    return count, max_id
+
+def get_transcript_chunks_by_ids(db: Session, chunk_ids: List[int]) -> Dict[int, models.TranscriptChunk]:
+    """
+    チャンクIDのリストからチャンクを取得する
+    
+    Args:
+        db (Session): データベースセッション
+        chunk_ids (List[int]): チャンクIDのリスト
+        
+    Returns:
+        Dict[int, TranscriptChunk]: チャンクIDをキーとするチャンクの辞書
+    """
+    if not chunk_ids:
+        return {}
+    chunks = db.query(models.TranscriptChunk).filter(models.TranscriptChunk.id.in_(chunk_ids)).all()
+    return {chunk.id: chunk for chunk in chunks}
+
 def create_reference(db: Session, chat_message_id: int, transcript_chunk_id: int, rank: int):
     """
     参照情報を作成する
@@ -478,3 +673,749 @@ def get_video_by_id(db: Session, video_id: int) -> Optional[models.Video]:
         Optional[models.Video]: 動画オブジェクト（存在しない場合はNone）
     """
     return db.query(models.Video).filter(models.Video.id == video_id).first()
+
+
+async def create_upload_session(
+    db: Session,
+    upload_id: str,
+    minutes_id: int,
+    user_id: str,
+    filename: str,
+    total_size: int,
+    part_size: int,
+    total_parts: int
+) -> models.UploadSession:
+    """
+    アップロードセッションを作成する
+    
+    Args:
+        db (Session): データベースセッション
+        upload_id (str): アップロードID
+        minutes_id (int): 議事録ID
+        user_id (str): ユーザーID
+        filename (str): 元のファイル名
+        total_size (int): ファイル全体のサイズ（バイト）
+        part_size (int): 1パートあたりのサイズ（バイト）
+        total_parts (int): パート数
+        
+    Returns:
+        models.UploadSession: 作成されたアップロードセッション
+    """
+    upload_session = models.UploadSession(
+        id=upload_id,
+        minutes_id=minutes_id,
+        user_id=user_id,
+        filename=filename,
+        total_size=total_size,
+        part_size=part_size,
+        total_parts=total_parts,
+        status="uploading"
+    )
+    db.add(upload_session)
+    db.commit()
+    db.refresh(upload_session)
+    return upload_session
+
+def get_upload_session(db: Session, upload_id: str) -> Optional[models.UploadSession]:
+    """
+    アップロードIDからアップロードセッションを取得する
+    """
+    return db.query(models.UploadSession).filter(models.UploadSession.id == upload_id).first()
+
+def get_upload_parts(db: Session, upload_id: str) -> List[models.UploadPart]:
+    """
+    アップロードセッションで受信済みのパートを取得する（パート番号昇順）
+    """
+    return db.query(models.UploadPart).filter(
+        models.UploadPart.upload_id == upload_id
+    ).order_by(models.UploadPart.part_number).all()
+
+async def save_upload_part(db: Session, upload_id: str, part_number: int, size: int) -> models.UploadPart:
+    """
+    受信したパートを記録する。同じパートが再送された場合はサイズを上書きする
+    
+    Args:
+        db (Session): データベースセッション
+        upload_id (str): アップロードID
+        part_number (int): パート番号
+        size (int): パートのサイズ（バイト）
+        
+    Returns:
+        models.UploadPart: 記録されたパート
+    """
+    def _find():
+        return db.query(models.UploadPart).filter(
+            models.UploadPart.upload_id == upload_id,
+            models.UploadPart.part_number == part_number
+        ).first()
+
+    part = _find()
+    if part:
+        part.size = size
+        db.commit()
+        return part
+
+    try:
+        part = models.UploadPart(upload_id=upload_id, part_number=part_number, size=size)
+        db.add(part)
+        db.commit()
+        db.refresh(part)
+        return part
+    except IntegrityError:
+        # 同じパートが並行して送信された場合は後勝ちで上書き
+        db.rollback()
+        part = _find()
+        part.size = size
+        db.commit()
+        return part
+
+async def update_upload_session_status(db: Session, upload_id: str, status: str) -> bool:
+    """
+    アップロードセッションのステータスを更新する
+    """
+    upload_session = get_upload_session(db, upload_id)
+    if not upload_session:
+        return False
+    upload_session.status = status
+    db.commit()
+    return True
+
+def claim_upload_session(db: Session, upload_id: str, from_status: str, to_status: str) -> bool:
+    """
+    アップロードセッションのステータスが from_status の場合のみ to_status に更新する
+    
+    確認と更新を1つの条件付きUPDATEで行うため、同じセッションの完了が同時に要求されても1件だけが成功する
+    
+    Returns:
+        bool: 更新できた場合True（他のリクエストが先に更新していた場合False）
+    """
+    updated = db.query(models.UploadSession).filter(
+        models.UploadSession.id == upload_id,
+        models.UploadSession.status == from_status
+    ).update({models.UploadSession.status: to_status}, synchronize_session=False)
+    db.commit()
+    return updated == 1
+
+
+def claim_video_upload(db: Session, minutes_id: int, video_url: str) -> bool:
+    """
+    動画のステータスが"uploading"の場合のみ"queued"に更新し、アップロード先のブロブを記録する
+    
+    確認と更新を1つの条件付きUPDATEで行うため、同じ動画の直接アップロードの完了が同時に要求されても1件だけが成功する
+    
+    Returns:
+        bool: 更新できた場合True（他のリクエストが先に更新していた場合False）
+    """
+    updated = db.query(models.Video).filter(
+        models.Video.minutes_id == minutes_id,
+        models.Video.status == "uploading"
+    ).update({models.Video.status: "queued", models.Video.video_url: video_url}, synchronize_session=False)
+    db.commit()
+    return updated == 1
+
+
+async def enqueue_processing_job(db: Session, minutes_id: int, file_path: Optional[str], max_attempts: int = 3) -> int:
+    """
+    動画処理ジョブをキューに登録する
+    
+    Args:
+        db (Session): データベースセッション
+        minutes_id (int): 議事録ID
+        file_path (Optional[str]): アップロードされた一時ファイルのパス（直接アップロードの場合はNone）
+        max_attempts (int): 最大試行回数
+        
+    Returns:
+        int: ジョブID
+    """
+    job = models.ProcessingJob(
+        minutes_id=minutes_id,
+        file_path=file_path,
+        status="queued",
+        attempts=0,
+        max_attempts=max_attempts,
+        available_at=datetime.now(timezone.utc)
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    logger.info(f"処理ジョブを登録しました: job_id={job.id}, minutes_id={minutes_id}")
+    return job.id
+
+def claim_processing_job(db: Session, worker_id: str, lease_seconds: int) -> Optional[models.ProcessingJob]:
+    """
+    実行可能なジョブを1件取得してリースする
+    
+    SELECT ... FOR UPDATE SKIP LOCKED で取得するため、複数のワーカーが同時に呼び出しても
+    同じジョブを取得することはない。リース期限が切れた実行中ジョブ（ワーカーの停止・クラッシュ）も
+    再取得の対象とし、最大試行回数に達している場合はfailedにする。
+    
+    Args:
+        db (Session): データベースセッション
+        worker_id (str): ワーカーID
+        lease_seconds (int): リース期間（秒）
+        
+    Returns:
+        Optional[models.ProcessingJob]: 取得したジョブ（なければNone）
+    """
+    while True:
+        now = datetime.now(timezone.utc)
+        job = db.query(models.ProcessingJob).filter(
+            or_(
+                and_(
+                    models.ProcessingJob.status == "queued",
+                    models.ProcessingJob.available_at <= now
+                ),
+                and_(
+                    models.ProcessingJob.status == "running",
+                    models.ProcessingJob.lease_expires_at < now
+                )
+            )
+        ).order_by(
+            models.ProcessingJob.id
+        ).with_for_update(skip_locked=True).first()
+
+        if not job:
+            db.rollback()  # ロックを解放
+            return None
+
+        if job.status == "running":
+            logger.warning(f"リース切れのジョブを再取得します: job_id={job.id}, locked_by={job.locked_by}")
+            if job.attempts >= job.max_attempts:
+                _mark_processing_job_failed(db, job, "リース期限切れ（ワーカー停止の可能性）")
+                db.commit()
+                continue
+
+        job.status = "running"
+        job.locked_by = worker_id
+        job.attempts += 1
+        job.heartbeat_at = now
+        job.lease_expires_at = now + timedelta(seconds=lease_seconds)
+        db.commit()
+        db.refresh(job)
+        return job
+
+def heartbeat_processing_job(db: Session, job_id: int, worker_id: str, lease_seconds: int) -> bool:
+    """
+    ジョブのリースを延長する
+    
+    Returns:
+        bool: 延長できたかどうか（Falseの場合は他のワーカーにリースを奪われている）
+    """
+    now = datetime.now(timezone.utc)
+    updated = db.query(models.ProcessingJob).filter(
+        models.ProcessingJob.id == job_id,
+        models.ProcessingJob.locked_by == worker_id,
+        models.ProcessingJob.status == "running"
+    ).update({
+        models.ProcessingJob.heartbeat_at: now,
+        models.ProcessingJob.lease_expires_at: now + timedelta(seconds=lease_seconds)
+    }, synchronize_session=False)
+    db.commit()
+    return updated == 1
+
+def complete_processing_job(db: Session, job_id: int, worker_id: str) -> None:
+    """
+    ジョブを完了にする
+    """
+    db.query(models.ProcessingJob).filter(
+        models.ProcessingJob.id == job_id,
+        models.ProcessingJob.locked_by == worker_id
+    ).update({
+        models.ProcessingJob.status: "completed",
+        models.ProcessingJob.locked_by: None,
+        models.ProcessingJob.lease_expires_at: None
+    }, synchronize_session=False)
+    db.commit()
+
+def fail_processing_job(db: Session, job_id: int, worker_id: str, error: str, retry_delay_seconds: int, retry: bool = True) -> bool:
+    """
+    ジョブの失敗を記録する。試行回数が残っていれば再試行待ちに戻す
+    
+    retryがFalseの場合（再試行しても成功しないエラー）は、試行回数に関わらずfailedで確定する
+    
+    Returns:
+        bool: 再試行されるかどうか（Falseの場合はfailedで確定）
+    """
+    job = db.query(models.ProcessingJob).filter(
+        models.ProcessingJob.id == job_id,
+        models.ProcessingJob.locked_by == worker_id
+    ).with_for_update().first()
+    if not job:
+        db.rollback()
+        return False
+
+    if retry and job.attempts < job.max_attempts:
+        job.status = "queued"
+        job.locked_by = None
+        job.lease_expires_at = None
+        job.last_error = error
+        job.available_at = datetime.now(timezone.utc) + timedelta(seconds=retry_delay_seconds)
+        video = get_video(db, job.minutes_id)
+        if video:
+            video.status = "queued"
+        db.commit()
+        return True
+
+    _mark_processing_job_failed(db, job, error)
+    db.commit()
+    return False
+
+def release_processing_job(db: Session, job_id: int, worker_id: str) -> None:
+    """
+    ワーカー停止時に実行中のジョブをキューに戻す（試行回数には数えない）
+    """
+    job = db.query(models.ProcessingJob).filter(
+        models.ProcessingJob.id == job_id,
+        models.ProcessingJob.locked_by == worker_id
+    ).with_for_update().first()
+    if not job:
+        db.rollback()
+        return
+    job.status = "queued"
+    job.locked_by = None
+    job.lease_expires_at = None
+    job.attempts = max(job.attempts - 1, 0)
+    job.available_at = datetime.now(timezone.utc)
+    video = get_video(db, job.minutes_id)
+    if video:
+        video.status = "queued"
+    db.commit()
+
+def _mark_processing_job_failed(db: Session, job: models.ProcessingJob, error: str) -> None:
+    job.status = "failed"
+    job.locked_by = None
+    job.lease_expires_at = None
+    job.last_error = error
+    # エラー発生時の進捗は保持（最後に更新された進捗を維持）
+    video = get_video(db, job.minutes_id)
+    if video:
+        video.status = "failed"
+
+
+async def update_video_content_hash(db: Session, minutes_id: int, content_hash: str) -> None:
+    """
+    動画ファイルのSHA-256を記録する
+    """
+    video = get_video(db, minutes_id)
+    if video:
+        video.content_hash = content_hash
+        db.commit()
+
+async def update_video_image_url(db: Session, video_id: int, image_url: str) -> None:
+    """
+    動画のサムネイル画像のブロブ名を記録する
+    """
+    video = get_video_by_id(db, video_id)
+    if video:
+        video.image_url = image_url
+        db.commit()
+
+def get_completed_video_by_content_hash(db: Session, content_hash: str, exclude_video_id: int) -> Optional[models.Video]:
+    """
+    同じ内容の動画のうち、文字起こしとベクトル化まで完了しているものを取得する
+    
+    Args:
+        db (Session): データベースセッション
+        content_hash (str): 動画ファイルのSHA-256
+        exclude_video_id (int): 除外する動画ID（処理中の動画自身）
+        
+    Returns:
+        Optional[models.Video]: 処理済みの動画（なければNone）
+    """
+    return db.query(models.Video).join(
+        models.Transcript,
+        models.Transcript.video_id == models.Video.id
+    ).filter(
+        models.Video.content_hash == content_hash,
+        models.Video.status == "completed",
+        models.Video.id != exclude_video_id,
+        models.Transcript.is_embedded == True
+    ).order_by(
+        models.Video.id
+    ).first()
+
+async def clone_processed_video(db: Session, source_video: models.Video, target_video: models.Video) -> int:
+    """
+    処理済みの動画の文字起こし・チャンク・ベクトル埋め込み・タイムスタンプを別の動画に複製する
+    
+    同じ動画ファイルが再アップロードされた場合に、圧縮・文字起こし・ベクトル化を省略するために使う。
+    1トランザクションでまとめて登録する。
+    複製先の動画がBlobにアップロード済みの場合は、そのBlobを参照したままにする（参照されないBlobを残さない）。
+    
+    Args:
+        db (Session): データベースセッション
+        source_video (models.Video): 複製元の動画
+        target_video (models.Video): 複製先の動画
+        
+    Returns:
+        int: 作成された文字起こしID
+    """
+    try:
+        source_transcript = get_transcript_by_video_id(db, source_video.id)
+
+        transcript = models.Transcript(
+            video_id=target_video.id,
+            content=source_transcript.content,
+            is_summaried=False,
+            is_embedded=True
+        )
+        db.add(transcript)
+        db.flush()
+
+        chunks_with_embeddings = db.query(
+            models.TranscriptChunk,
+            models.VectorEmbedding
+        ).outerjoin(
+            models.VectorEmbedding,
+            models.TranscriptChunk.id == models.VectorEmbedding.chunk_id
+        ).filter(
+            models.TranscriptChunk.transcript_id == source_transcript.id
+        ).order_by(
+            models.TranscriptChunk.chunk_index
+        ).all()
+
+        chunk_map = {}
+        for source_chunk, _ in chunks_with_embeddings:
+            if source_chunk.id in chunk_map:
+                continue
+            new_chunk = models.TranscriptChunk(
+                transcript_id=transcript.id,
+                chunk_index=source_chunk.chunk_index,
+                content=source_chunk.content,
+                char_start=source_chunk.char_start,
+                char_end=source_chunk.char_end
+            )
+            db.add(new_chunk)
+            chunk_map[source_chunk.id] = new_chunk
+        db.flush()
+
+        db.add_all([
+            models.VectorEmbedding(
+                chunk_id=chunk_map[source_chunk.id].id,
+                embedding=source_embedding.embedding,
+                vector=source_embedding.vector
+            )
+            for source_chunk, source_embedding in chunks_with_embeddings
+            if source_embedding is not None
+        ])
+        db.flush()
+        pgvector.sync_chunks(db, [new_chunk.id for new_chunk in chunk_map.values()])
+
+        db.execute(
+            models.TranscriptSegment.__table__.insert().from_select(
+                ["transcript_id", "seq", "start_ms", "end_ms", "char_start", "char_end"],
+                db.query(
+                    literal(transcript.id),
+                    models.TranscriptSegment.seq,
+                    models.TranscriptSegment.start_ms,
+                    models.TranscriptSegment.end_ms,
+                    models.TranscriptSegment.char_start,
+                    models.TranscriptSegment.char_end
+                ).filter(
+                    models.TranscriptSegment.transcript_id == source_transcript.id
+                )
+            )
+        )
+
+        # 複製先の動画がBlobにアップロード済み（直接アップロードなど）であればそれを参照し、
+        # 未アップロードの場合のみ複製元のBlob上の動画を共有する（再アップロード不要）
+        if not target_video.video_url:
+            target_video.video_url = source_video.video_url
+        target_video.image_url = source_video.image_url
+        db.commit()
+        return transcript.id
+    except Exception as e:
+        db.rollback()
+        logger.error(f"処理済み動画の複製中にエラーが発生しました: {str(e)}")
+        raise
+
+
+def get_checkpoints(db: Session, video_id: int, stage: str) -> Dict[int, str]:
+    """
+    動画処理のステージのチェックポイントを取得する
+    
+    Args:
+        db (Session): データベースセッション
+        video_id (int): 動画ID
+        stage (str): ステージ名
+        
+    Returns:
+        Dict[int, str]: 単位（step）ごとのデータ
+    """
+    checkpoints = db.query(models.ProcessingCheckpoint).filter(
+        models.ProcessingCheckpoint.video_id == video_id,
+        models.ProcessingCheckpoint.stage == stage
+    ).all()
+    return {checkpoint.step: checkpoint.data for checkpoint in checkpoints}
+
+async def save_checkpoint(db: Session, video_id: int, stage: str, step: int, data: Optional[str]) -> None:
+    """
+    動画処理のステージ（またはその一部）の完了を記録する。既に記録されている場合は上書きする
+    
+    Args:
+        db (Session): データベースセッション
+        video_id (int): 動画ID
+        stage (str): ステージ名
+        step (int): ステージ内の単位（セグメント番号など）
+        data (Optional[str]): ステージの結果
+    """
+    def _find():
+        return db.query(models.ProcessingCheckpoint).filter(
+            models.ProcessingCheckpoint.video_id == video_id,
+            models.ProcessingCheckpoint.stage == stage,
+            models.ProcessingCheckpoint.step == step
+        ).first()
+
+    checkpoint = _find()
+    if checkpoint:
+        checkpoint.data = data
+        db.commit()
+        return
+
+    try:
+        db.add(models.ProcessingCheckpoint(video_id=video_id, stage=stage, step=step, data=data))
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        checkpoint = _find()
+        checkpoint.data = data
+        db.commit()
+
+def delete_checkpoints(db: Session, video_id: int) -> None:
+    """
+    動画処理の完了後にチェックポイントを削除する
+    """
+    db.query(models.ProcessingCheckpoint).filter(
+        models.ProcessingCheckpoint.video_id == video_id
+    ).delete(synchronize_session=False)
+    db.commit()
+
+def get_transcription_cache(db: Session, cache_key: str) -> Optional[str]:
+    """
+    文字起こしキャッシュを取得し、最終利用日時を更新する
+    
+    Args:
+        db (Session): データベースセッション
+        cache_key (str): キャッシュキー
+        
+    Returns:
+        Optional[str]: 文字起こし結果（JSON）。キャッシュがない場合はNone
+    """
+    entry = db.query(models.TranscriptionCache).filter(models.TranscriptionCache.cache_key == cache_key).first()
+    if not entry:
+        return None
+    entry.last_used_at = datetime.now(timezone.utc)
+    db.commit()
+    return entry.result
+
+def save_transcription_cache(db: Session, cache_key: str, model: str, deployment: str, result: str) -> None:
+    """
+    文字起こしキャッシュを登録する（同じキーが同時に登録された場合は先に登録されたものを残す）
+    
+    Args:
+        db (Session): データベースセッション
+        cache_key (str): キャッシュキー
+        model (str): モデル名
+        deployment (str): デプロイメント名
+        result (str): 文字起こし結果（JSON）
+    """
+    try:
+        db.add(models.TranscriptionCache(cache_key=cache_key, model=model, deployment=deployment, result=result))
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+
+def evict_transcription_cache(db: Session, ttl_days: int, max_entries: int) -> int:
+    """
+    期限切れの文字起こしキャッシュと、件数の上限を超えた分のキャッシュ（最終利用日時が古いもの）を削除する
+    
+    Args:
+        db (Session): データベースセッション
+        ttl_days (int): 最後に利用されてからの保持期間（日）
+        max_entries (int): 保持する最大件数
+        
+    Returns:
+        int: 削除した件数
+    """
+    expired_before = datetime.now(timezone.utc) - timedelta(days=ttl_days)
+    deleted = db.query(models.TranscriptionCache).filter(
+        models.TranscriptionCache.last_used_at < expired_before
+    ).delete(synchronize_session=False)
+
+    excess = db.query(func.count(models.TranscriptionCache.id)).scalar() - max_entries
+    if excess > 0:
+        oldest_ids = [
+            row.id for row in db.query(models.TranscriptionCache.id).order_by(
+                models.TranscriptionCache.last_used_at.asc()
+            ).limit(excess).all()
+        ]
+        deleted += db.query(models.TranscriptionCache).filter(
+            models.TranscriptionCache.id.in_(oldest_ids)
+        ).delete(synchronize_session=False)
+    db.commit()
+    return deleted
+
+def get_embedding_caches(db: Session, cache_keys: List[str], touch_interval_seconds: int = 0) -> Dict[str, bytes]:
+    """
+    ベクトル化キャッシュをまとめて取得し、最終利用日時を更新する
+    
+    最終利用日時の更新は、前回の更新からtouch_interval_seconds以上経過したキャッシュのみ行う
+    （よく使われるキャッシュを取得するたびに書き込まないようにする）
+    
+    Args:
+        db (Session): データベースセッション
+        cache_keys (List[str]): キャッシュキーのリスト
+        touch_interval_seconds (int): 最終利用日時を更新する間隔（秒）
+        
+    Returns:
+        Dict[str, bytes]: キャッシュキーごとのベクトル（バイナリ）。キャッシュがないキーは含まない
+    """
+    if not cache_keys:
+        return {}
+    entries = db.query(models.EmbeddingCache).filter(models.EmbeddingCache.cache_key.in_(cache_keys)).all()
+    # コミットで属性が破棄される前に取り出しておく
+    vectors = {entry.cache_key: entry.vector for entry in entries}
+    if entries:
+        now = datetime.now(timezone.utc)
+        touched = db.query(models.EmbeddingCache).filter(
+            models.EmbeddingCache.id.in_([entry.id for entry in entries]),
+            models.EmbeddingCache.last_used_at < now - timedelta(seconds=touch_interval_seconds)
+        ).update({models.EmbeddingCache.last_used_at: now}, synchronize_session=False)
+        if touched:
+            db.commit()
+        else:
+            db.rollback()
+    return vectors
+
+def save_embedding_caches(db: Session, deployment: str, vectors: Dict[str, Sequence[float]]) -> None:
+    """
+    ベクトル化キャッシュをまとめて登録する（同じキーが同時に登録された場合は先に登録されたものを残す）
+    
+    Args:
+        db (Session): データベースセッション
+        deployment (str): デプロイメント名
+        vectors (Dict[str, Sequence[float]]): キャッシュキーごとのベクトル
+    """
+    entries = [
+        models.EmbeddingCache(cache_key=cache_key, deployment=deployment, vector=vector_codec.encode_vector(vector))
+        for cache_key, vector in vectors.items()
+    ]
+    try:
+        db.add_all(entries)
+        db.commit()
+    except IntegrityError:
+        # 他のジョブが先に登録したキーがある場合は、1件ずつ登録し直す
+        db.rollback()
+        for cache_key, vector in vectors.items():
+            try:
+                db.add(models.EmbeddingCache(cache_key=cache_key, deployment=deployment, vector=vector_codec.encode_vector(vector)))
+                db.commit()
+            except IntegrityError:
+                db.rollback()
+
+def evict_embedding_cache(db: Session, ttl_days: int, max_entries: int) -> int:
+    """
+    期限切れのベクトル化キャッシュと、件数の上限を超えた分のキャッシュ（最終利用日時が古いもの）を削除する
+    
+    Args:
+        db (Session): データベースセッション
+        ttl_days (int): 最後に利用されてからの保持期間（日）
+        max_entries (int): 保持する最大件数
+        
+    Returns:
+        int: 削除した件数
+    """
+    expired_before = datetime.now(timezone.utc) - timedelta(days=ttl_days)
+    deleted = db.query(models.EmbeddingCache).filter(
+        models.EmbeddingCache.last_used_at < expired_before
+    ).delete(synchronize_session=False)
+
+    excess = db.query(func.count(models.EmbeddingCache.id)).scalar() - max_entries
+    if excess > 0:
+        oldest_ids = [
+            row.id for row in db.query(models.EmbeddingCache.id).order_by(
+                models.EmbeddingCache.last_used_at.asc()
+            ).limit(excess).all()
+        ]
+        deleted += db.query(models.EmbeddingCache).filter(
+            models.EmbeddingCache.id.in_(oldest_ids)
+        ).delete(synchronize_session=False)
+    db.commit()
+    return deleted
+
+def get_transcript_chunk_states(db: Session, transcript_id: int) -> Dict[int, Tuple[int, bool]]:
+    """
+    文字起こしの保存済みチャンクと、ベクトル化済みかどうかを取得する
+    
+    Args:
+        db (Session): データベースセッション
+        transcript_id (int): 文字起こしID
+        
+    Returns:
+        Dict[int, Tuple[int, bool]]: チャンク番号ごとの（チャンクID, ベクトル化済みか）
+    """
+    rows = db.query(
+        models.TranscriptChunk.chunk_index,
+        models.TranscriptChunk.id,
+        models.VectorEmbedding.id
+    ).outerjoin(
+        models.VectorEmbedding,
+        models.TranscriptChunk.id == models.VectorEmbedding.chunk_id
+    ).filter(
+        models.TranscriptChunk.transcript_id == transcript_id
+    ).all()
+    return {chunk_index: (chunk_id, embedding_id is not None) for chunk_index, chunk_id, embedding_id in rows}
+
+def get_active_jobs(db: Session) -> List[Tuple[int, Optional[str]]]:
+    """
+    処理中・処理待ちのジョブの議事録IDと、参照するアップロードファイルのパスを取得する
+    
+    Args:
+        db (Session): データベースセッション
+        
+    Returns:
+        List[Tuple[int, Optional[str]]]: (議事録ID, ファイルパス) のリスト
+    """
+    rows = db.query(models.ProcessingJob.minutes_id, models.ProcessingJob.file_path).filter(
+        models.ProcessingJob.status.in_(["queued", "running"])
+    ).all()
+    return [(minutes_id, file_path) for minutes_id, file_path in rows]
+
+def requeue_orphaned_videos(db: Session) -> int:
+    """
+    "processing"のまま処理ジョブが存在しない動画（ジョブキュー導入前の処理や、異常終了したプロセスの処理）を
+    再開用のジョブとしてキューに登録する。Blobへのアップロード前に止まった動画は元のファイルがないためfailedにする
+    
+    Args:
+        db (Session): データベースセッション
+        
+    Returns:
+        int: 再登録したジョブ数
+    """
+    active_jobs = db.query(models.ProcessingJob.minutes_id).filter(
+        models.ProcessingJob.status.in_(["queued", "running"])
+    )
+    orphaned_videos = db.query(models.Video).filter(
+        models.Video.status == "processing",
+        ~models.Video.minutes_id.in_(active_jobs)
+    ).all()
+
+    requeued = 0
+    for video in orphaned_videos:
+        if video.video_url:
+            db.add(models.ProcessingJob(
+                minutes_id=video.minutes_id,
+                file_path=None,
+                status="queued",
+                attempts=0,
+                max_attempts=3,
+                available_at=datetime.now(timezone.utc)
+            ))
+            video.status = "queued"
+            requeued += 1
+            logger.warning(f"処理が中断された動画を再開します: minutes_id={video.minutes_id}")
+        else:
+            video.status = "failed"
+            logger.error(f"処理が中断された動画を再開できません（動画未アップロード）: minutes_id={video.minutes_id}")
+    db.commit()
+    return requeued
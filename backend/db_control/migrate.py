@@ -0,0 +1,84 @@
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+from db_control.vector_codec import encode_vector
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# create_allは既存テーブルへのカラム追加を行わないため、追加したカラムはここに登録する
+# (テーブル名, カラム名, カラム定義)
+COLUMN_MIGRATIONS = [
+    ("video", "content_hash", "VARCHAR(64)"),
+    ("transcript", "is_complete", "BOOLEAN NOT NULL DEFAULT TRUE"),
+    ("transcript_chunk", "char_start", "INTEGER"),
+    ("transcript_chunk", "char_end", "INTEGER"),
+    ("vector_embedding", "vector", "BYTEA"),
+]
+
+# JSON文字列のベクトルをバイナリに変換する際の1回あたりの行数
+VECTOR_BACKFILL_BATCH_SIZE = 500
+
+# 追加したカラムに対するインデックス
+INDEX_MIGRATIONS = [
+    "CREATE INDEX IF NOT EXISTS ix_video_content_hash ON video (content_hash)",
+    "CREATE INDEX IF NOT EXISTS ix_transcript_chunk_char_start ON transcript_chunk (transcript_id, char_start)",
+]
+
+def run_migrations(engine: Engine) -> None:
+    """
+    既存のテーブルに不足しているカラムとインデックスを追加し、移行前の形式のデータを変換する（何度実行してもよい）
+
+    Args:
+        engine (Engine): データベースエンジン
+    """
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    with engine.begin() as conn:
+        for table_name, column_name, column_type in COLUMN_MIGRATIONS:
+            if table_name not in existing_tables:
+                continue
+            columns = {column["name"] for column in inspector.get_columns(table_name)}
+            if column_name in columns:
+                continue
+            conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type}"))
+            logger.info(f"カラムを追加しました: {table_name}.{column_name}")
+        for statement in INDEX_MIGRATIONS:
+            conn.execute(text(statement))
+
+    if "vector_embedding" in existing_tables:
+        backfill_vector_embeddings(engine)
+
+def backfill_vector_embeddings(engine: Engine, batch_size: int = VECTOR_BACKFILL_BATCH_SIZE) -> int:
+    """
+    JSON文字列で保存されたベクトルをバイナリ（vectorカラム）に変換し、JSON文字列を削除する
+
+    一定の行数ごとにコミットするため、途中で止まっても次回の起動時に続きから変換する
+
+    Args:
+        engine (Engine): データベースエンジン
+        batch_size (int): 1回に変換する行数
+
+    Returns:
+        int: 変換した行数
+    """
+    converted = 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(
+                text(
+                    "SELECT id, embedding FROM vector_embedding "
+                    "WHERE vector IS NULL AND embedding IS NOT NULL ORDER BY id LIMIT :limit"
+                ),
+                {"limit": batch_size}
+            ).all()
+            if not rows:
+                break
+            conn.execute(
+                text("UPDATE vector_embedding SET vector = :vector, embedding = NULL WHERE id = :id"),
+                [{"id": row.id, "vector": encode_vector(json.loads(row.embedding))} for row in rows]
+            )
+        converted += len(rows)
+    if converted:
+        logger.info(f"ベクトルをバイナリに変換しました: {converted}件")
+    return converted
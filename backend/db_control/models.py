@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Boolean, Float, DateTime, Enum, Numeric, Text, UniqueConstraint
+from sqlalchemy import Column, Integer, BigInteger, String, ForeignKey, Boolean, Float, DateTime, Enum, Numeric, Text, UniqueConstraint, Index, LargeBinary
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func
@@ -20,6 +20,7 @@ class Minutes(Base):
 
     videos = relationship("Video", back_populates="minutes")
     chat_session = relationship("ChatSession", back_populates="minutes")
+    upload_sessions = relationship("UploadSession", back_populates="minutes")
 
 # 動画（video）テーブル：議事録に紐づくアップロード動画の情報を格納
 class Video(Base):
@@ -27,16 +28,112 @@ class Video(Base):
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     minutes_id = Column(Integer, ForeignKey("minutes.id"), nullable=False)
-    video_url = Column(String, nullable=False)
+    video_url = Column(String)  # Blobへのアップロード完了までは未設定
     image_url = Column(String)
     status = Column(String, nullable=False)
     progress = Column(Integer, default=0)
     recorded_at = Column(DateTime)
+    content_hash = Column(String(64), index=True)  # 動画ファイルのSHA-256（同一ファイルの再処理を省くために使用）
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     minutes = relationship("Minutes", back_populates="videos")
     transcript = relationship("Transcript", back_populates="video", uselist=False)
 
+# アップロードセッション（upload_session）テーブル：分割・再開可能なアップロードの状態を格納
+class UploadSession(Base):
+    __tablename__ = "upload_session"
+
+    id = Column(String, primary_key=True)  # uuid
+    minutes_id = Column(Integer, ForeignKey("minutes.id"), nullable=False)
+    user_id = Column(String, nullable=False)
+    filename = Column(String, nullable=False)
+    total_size = Column(BigInteger, nullable=False)
+    part_size = Column(Integer, nullable=False)
+    total_parts = Column(Integer, nullable=False)
+    status = Column(String, nullable=False)  # uploading / completed
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    minutes = relationship("Minutes", back_populates="upload_sessions")
+    parts = relationship("UploadPart", back_populates="upload_session")
+
+# アップロードパート（upload_part）テーブル：アップロードセッションで受信済みのパートを格納
+class UploadPart(Base):
+    __tablename__ = "upload_part"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    upload_id = Column(String, ForeignKey("upload_session.id"), nullable=False)
+    part_number = Column(Integer, nullable=False)
+    size = Column(BigInteger, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    upload_session = relationship("UploadSession", back_populates="parts")
+
+    # 同じパート番号は1セッションにつき1件のみ
+    __table_args__ = (
+        UniqueConstraint('upload_id', 'part_number', name='uix_upload_part'),
+    )
+
+# 処理ジョブ（processing_job）テーブル：動画処理ジョブのキューとリース情報を格納
+class ProcessingJob(Base):
+    __tablename__ = "processing_job"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    minutes_id = Column(Integer, ForeignKey("minutes.id"), nullable=False, index=True)
+    file_path = Column(String)  # アップロードされた一時ファイル（直接Blobにアップロードされた場合はNone）
+    status = Column(String, nullable=False, index=True)  # queued / running / completed / failed
+    attempts = Column(Integer, default=0, nullable=False)
+    max_attempts = Column(Integer, default=3, nullable=False)
+    locked_by = Column(String)  # 処理中のワーカーID
+    lease_expires_at = Column(DateTime(timezone=True))  # この時刻までにハートビートがなければ再取得可能
+    heartbeat_at = Column(DateTime(timezone=True))
+    available_at = Column(DateTime(timezone=True), server_default=func.now())  # 再試行時はこの時刻まで待機
+    last_error = Column(Text)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    minutes = relationship("Minutes")
+
+# 処理チェックポイント（processing_checkpoint）テーブル：動画処理の完了済みステージと中間結果を格納
+class ProcessingCheckpoint(Base):
+    __tablename__ = "processing_checkpoint"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    video_id = Column(Integer, ForeignKey("video.id"), nullable=False)
+    stage = Column(String, nullable=False)  # uploaded / transcoded / segment_transcribed など
+    step = Column(Integer, default=0, nullable=False)  # セグメント番号など、ステージ内の単位
+    data = Column(Text)  # ステージの結果（Blob名、ファイル一覧、文字起こし結果など）
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    # 同じステージ・単位のチェックポイントは1件のみ
+    __table_args__ = (
+        UniqueConstraint('video_id', 'stage', 'step', name='uix_processing_checkpoint'),
+    )
+
+# 文字起こしキャッシュ（transcription_cache）テーブル：音声セグメントごとのWhisperの結果を格納
+# 同じ音声を同じモデル・デプロイメントで文字起こしする場合（再試行・再処理）はAPIを呼ばずに再利用する
+class TranscriptionCache(Base):
+    __tablename__ = "transcription_cache"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    cache_key = Column(String(64), unique=True, nullable=False)  # 音声ファイルのSHA-256・モデル・デプロイメント・出力形式から求めたキー
+    model = Column(String, nullable=False)
+    deployment = Column(String, nullable=False)
+    result = Column(Text, nullable=False)  # 文字起こし結果とタイムスタンプ（JSON）
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    last_used_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)  # 件数の上限を超えた場合は古いものから削除する
+
+# ベクトル化キャッシュ（embedding_cache）テーブル：同じテキストのベクトル化結果を再利用するためのキャッシュ
+class EmbeddingCache(Base):
+    __tablename__ = "embedding_cache"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    cache_key = Column(String(64), unique=True, nullable=False)  # 正規化したテキストのSHA-256・デプロイメントから求めたキー
+    deployment = Column(String, nullable=False)
+    vector = Column(LargeBinary, nullable=False)  # ヘッダー付きのfloat32バイナリ（vector_codecで変換）
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    last_used_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)  # 件数の上限を超えた場合は古いものから削除する
+
 # 文字起こし（transcript）テーブル：動画から生成された文字起こしの本文を格納
 class Transcript(Base):
     __tablename__ = "transcript"
@@ -46,10 +143,12 @@ class Transcript(Base):
     content = Column(Text, nullable=False)
     is_embedded = Column(Boolean, default=False, nullable=False)
     is_summaried = Column(Boolean, default=False, nullable=False)  # 要約が生成されたかどうかのフラグ
+    is_complete = Column(Boolean, default=True, nullable=False)  # 文字起こしが最後まで完了したかどうか（処理中は途中までの内容を保持する）
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     video = relationship("Video", back_populates="transcript", uselist=False)
     transcript_chunks = relationship("TranscriptChunk", back_populates="transcript")
+    transcript_segments = relationship("TranscriptSegment", back_populates="transcript")
     summary = relationship("Summary", back_populates="transcript", uselist=False)
     chat_session = relationship("ChatSession", back_populates="transcript")
 
@@ -61,18 +160,46 @@ class TranscriptChunk(Base):
     transcript_id = Column(Integer, ForeignKey("transcript.id"), nullable=False)
     chunk_index = Column(Integer, nullable=False)
     content = Column(String, nullable=False)
+    char_start = Column(Integer)  # 文字起こし全体の中での開始位置（文字数）
+    char_end = Column(Integer)  # 文字起こし全体の中での終了位置（この位置は含まない）
 
     transcript = relationship("Transcript", back_populates="transcript_chunks")
     vector_embedding = relationship("VectorEmbedding", back_populates="transcript_chunk")
     references = relationship("Reference", back_populates="transcript_chunk")
 
+    __table_args__ = (
+        Index('ix_transcript_chunk_char_start', 'transcript_id', 'char_start'),
+    )
+
+# 文字起こしセグメント（transcript_segment）テーブル：Whisperのセグメントごとの再生位置と、文字起こし全体の中での位置を格納
+# 本文は持たず、transcript.contentのchar_startからchar_endまでを参照する
+class TranscriptSegment(Base):
+    __tablename__ = "transcript_segment"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    transcript_id = Column(Integer, ForeignKey("transcript.id"), nullable=False)
+    seq = Column(Integer, nullable=False)  # 時刻順の通し番号
+    start_ms = Column(Integer, nullable=False)  # 動画の先頭からの開始時刻（ミリ秒）
+    end_ms = Column(Integer, nullable=False)  # 動画の先頭からの終了時刻（ミリ秒）
+    char_start = Column(Integer, nullable=False)
+    char_end = Column(Integer, nullable=False)
+
+    transcript = relationship("Transcript", back_populates="transcript_segments")
+
+    __table_args__ = (
+        UniqueConstraint('transcript_id', 'seq', name='uix_transcript_segment'),
+        Index('ix_transcript_segment_start_ms', 'transcript_id', 'start_ms'),
+        Index('ix_transcript_segment_char_start', 'transcript_id', 'char_start'),
+    )
+
 # ベクトル埋め込み（vector_embedding）テーブル：文字起こしチャンクのベクトル情報を格納
 class VectorEmbedding(Base):
     __tablename__ = "vector_embedding"
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     chunk_id = Column(Integer, ForeignKey("transcript_chunk.id"), nullable=False)
-    embedding = Column(String)  # SQLAlchemyではfloat配列が扱いづらいため、一旦Stringで保持
+    embedding = Column(String)  # 移行前の形式（JSON文字列）。移行後はNULL
+    vector = Column(LargeBinary)  # ヘッダー付きのfloat32バイナリ（vector_codecで変換）
     created_at = Column(DateTime, default=func.now())
 
     transcript_chunk = relationship("TranscriptChunk", back_populates="vector_embedding")
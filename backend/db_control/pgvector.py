@@ -0,0 +1,201 @@
+from sqlalchemy import bindparam, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from dotenv import load_dotenv
+from typing import List, Optional, Sequence, Tuple
+from db_control.vector_codec import decode_vector
+import logging
+import os
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# PostgreSQLのpgvector拡張を使った、データベース側での近傍検索
+# 拡張が使える場合のみ、vector_embeddingにpgvector型のカラム（pg_vector）とインデックスを追加する。
+# 使えない場合（SQLite、拡張未導入、権限不足）はavailableがFalseのままになり、Pythonでの検索を使う
+
+# 近傍検索の方式（"auto": pgvectorが使えれば使う / "python": 常にPythonで検索する）
+VECTOR_SEARCH_BACKEND = os.getenv("VECTOR_SEARCH_BACKEND", "auto")
+# インデックスの種類（"hnsw" / "ivfflat"）
+VECTOR_INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "hnsw")
+# ベクトルの次元数（インデックスには固定の次元数が必要。text-embedding-ada-002は1536）
+EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", "1536"))
+# IVFFlatのリスト数
+IVFFLAT_LISTS = int(os.getenv("IVFFLAT_LISTS", "100"))
+# 既存のベクトルをpg_vectorに書き込む際の1回あたりの行数
+PGVECTOR_BACKFILL_BATCH_SIZE = 500
+
+available = False
+# 絞り込み付きの検索でHNSWの反復スキャン（pgvector 0.8.0以降）を使えるか
+_iterative_scan = False
+
+def _version_tuple(version: str) -> Tuple[int, ...]:
+    return tuple(int(part) for part in version.split(".") if part.isdigit())
+
+def to_literal(vector: Sequence[float]) -> str:
+    """ベクトルをpgvectorの入力形式（'[1,2,3]'）に変換する"""
+    return "[" + ",".join(str(float(value)) for value in vector) + "]"
+
+def setup(engine: Engine) -> bool:
+    """
+    pgvectorが使えるかを確認し、カラムとインデックスを用意する（何度実行してもよい）
+
+    Args:
+        engine (Engine): データベースエンジン
+
+    Returns:
+        bool: pgvectorで検索できる場合True
+    """
+    global available, _iterative_scan
+    available = False
+    if VECTOR_SEARCH_BACKEND != "auto" or engine.dialect.name != "postgresql":
+        return False
+
+    try:
+        with engine.begin() as conn:
+            version = conn.execute(text("SELECT extversion FROM pg_extension WHERE extname = 'vector'")).scalar()
+            if version is None:
+                # 拡張を作成する権限がない場合は失敗する（その場合はPythonでの検索を使う）
+                conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+                version = conn.execute(text("SELECT extversion FROM pg_extension WHERE extname = 'vector'")).scalar()
+    except Exception as e:
+        logger.warning(f"pgvectorを使用できないため、Pythonで類似度検索を行います: {str(e)}")
+        return False
+
+    if VECTOR_INDEX_TYPE == "ivfflat":
+        index_statement = (
+            "CREATE INDEX IF NOT EXISTS ix_vector_embedding_pg_vector ON vector_embedding "
+            f"USING ivfflat (pg_vector vector_cosine_ops) WITH (lists = {IVFFLAT_LISTS})"
+        )
+    else:
+        index_statement = (
+            "CREATE INDEX IF NOT EXISTS ix_vector_embedding_pg_vector ON vector_embedding "
+            "USING hnsw (pg_vector vector_cosine_ops)"
+        )
+    try:
+        with engine.begin() as conn:
+            conn.execute(text(f"ALTER TABLE vector_embedding ADD COLUMN IF NOT EXISTS pg_vector vector({EMBEDDING_DIMENSIONS})"))
+            conn.execute(text(index_statement))
+    except Exception as e:
+        logger.warning(f"pgvectorのカラム・インデックスを作成できないため、Pythonで類似度検索を行います: {str(e)}")
+        return False
+
+    backfill(engine)
+    available = True
+    _iterative_scan = _version_tuple(version) >= (0, 8, 0)
+    logger.info(f"pgvectorで類似度検索を行います: version={version}, index={VECTOR_INDEX_TYPE}")
+    return True
+
+def backfill(engine: Engine, batch_size: int = PGVECTOR_BACKFILL_BATCH_SIZE) -> int:
+    """
+    バイナリで保存されたベクトルのうち、pg_vectorが未設定のものを書き込む
+
+    Args:
+        engine (Engine): データベースエンジン
+        batch_size (int): 1回に書き込む行数
+
+    Returns:
+        int: 書き込んだ行数
+    """
+    written = 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(
+                text(
+                    "SELECT id, vector FROM vector_embedding "
+                    "WHERE pg_vector IS NULL AND vector IS NOT NULL ORDER BY id LIMIT :limit"
+                ),
+                {"limit": batch_size}
+            ).all()
+            if not rows:
+                break
+            conn.execute(
+                text("UPDATE vector_embedding SET pg_vector = CAST(:pg_vector AS vector) WHERE id = :id"),
+                [{"id": row.id, "pg_vector": to_literal(decode_vector(row.vector))} for row in rows]
+            )
+        written += len(rows)
+    if written:
+        logger.info(f"pgvectorのカラムにベクトルを書き込みました: {written}件")
+    return written
+
+def sync_chunks(db: Session, chunk_ids: List[int]) -> None:
+    """
+    指定したチャンクのベクトルをpg_vectorに書き込む（ベクトルの保存・複製の後に呼ぶ。コミットは呼び出し側で行う）
+
+    Args:
+        db (Session): データベースセッション
+        chunk_ids (List[int]): チャンクIDのリスト
+    """
+    if not available or not chunk_ids:
+        return
+    rows = db.execute(
+        text(
+            "SELECT id, vector FROM vector_embedding "
+            "WHERE chunk_id IN :chunk_ids AND pg_vector IS NULL AND vector IS NOT NULL"
+        ).bindparams(bindparam("chunk_ids", expanding=True)),
+        {"chunk_ids": list(chunk_ids)}
+    ).all()
+    if rows:
+        db.execute(
+            text("UPDATE vector_embedding SET pg_vector = CAST(:pg_vector AS vector) WHERE id = :id"),
+            [{"id": row.id, "pg_vector": to_literal(decode_vector(row.vector))} for row in rows]
+        )
+
+def search_chunks(
+    db: Session,
+    query_vector: Sequence[float],
+    transcript_ids: List[int],
+    max_results: int,
+    threshold: Optional[float] = None
+) -> List[Tuple[int, float]]:
+    """
+    クエリベクトルとのコサイン類似度が高いチャンクを、データベース側で上位max_results件だけ取得する
+
+    pgvector 0.8.0以降はインデックスの反復スキャンで文字起こしの絞り込みと両立させる
+    （HNSWはstrict_order。IVFFlatはrelaxed_orderのみのため、取得後に類似度順に並べ直す）。
+    それより前のバージョンでは、絞り込み後のチャンクを厳密に並べ替える（インデックスを使うと件数が不足することがあるため）
+
+    Args:
+        db (Session): データベースセッション
+        query_vector (Sequence[float]): 検索クエリのベクトル
+        transcript_ids (List[int]): 検索対象の文字起こしID（複数の議事録をまたいで検索できる）
+        max_results (int): 最大結果数
+        threshold (Optional[float]): 類似度の閾値
+
+    Returns:
+        List[Tuple[int, float]]: (チャンクID, 類似度) のリスト（類似度の降順）
+    """
+    params = {"query": to_literal(query_vector), "transcript_ids": list(transcript_ids), "limit": max_results}
+    if _iterative_scan:
+        index_scan = (
+            "SELECT tc.id AS chunk_id, 1 - (ve.pg_vector <=> CAST(:query AS vector)) AS similarity "
+            "FROM vector_embedding ve JOIN transcript_chunk tc ON tc.id = ve.chunk_id "
+            "WHERE tc.transcript_id IN :transcript_ids AND ve.pg_vector IS NOT NULL "
+            "ORDER BY ve.pg_vector <=> CAST(:query AS vector) LIMIT :limit"
+        )
+        if VECTOR_INDEX_TYPE == "ivfflat":
+            # IVFFlatの反復スキャンは順序が厳密でないため、取得した上位の行を並べ直す
+            db.execute(text("SET LOCAL ivfflat.iterative_scan = relaxed_order"))
+            statement = text(
+                f"WITH matches AS MATERIALIZED ({index_scan}) "
+                "SELECT chunk_id, similarity FROM matches ORDER BY similarity DESC"
+            )
+        else:
+            db.execute(text("SET LOCAL hnsw.iterative_scan = strict_order"))
+            statement = text(index_scan)
+    else:
+        statement = text(
+            "WITH candidates AS MATERIALIZED ("
+            "SELECT tc.id AS chunk_id, ve.pg_vector FROM vector_embedding ve "
+            "JOIN transcript_chunk tc ON tc.id = ve.chunk_id "
+            "WHERE tc.transcript_id IN :transcript_ids AND ve.pg_vector IS NOT NULL) "
+            "SELECT chunk_id, 1 - (pg_vector <=> CAST(:query AS vector)) AS similarity "
+            "FROM candidates ORDER BY pg_vector <=> CAST(:query AS vector) LIMIT :limit"
+        )
+    rows = db.execute(statement.bindparams(bindparam("transcript_ids", expanding=True)), params).all()
+    return [
+        (row.chunk_id, float(row.similarity))
+        for row in rows
+        if threshold is None or row.similarity >= threshold
+    ]
@@ -10,6 +10,41 @@ class VideoUploadStatusResponse(BaseModel):
     minutes_id: int
     status: str
     progress: int
+    # 処理中でも途中までの文字起こしを取得できるかどうか（upload_resultにpartial=trueを指定して取得する）
+    transcript_available: bool = False
+
+class UploadSessionCreateRequest(BaseModel):
+    filename: str
+    total_size: int
+    part_size: Optional[int] = None
+
+class UploadSessionResponse(BaseModel):
+    upload_id: str
+    minutes_id: int
+    status: str
+    part_size: int
+    total_parts: int
+    received_parts: List[int]
+
+class UploadPartResponse(BaseModel):
+    upload_id: str
+    part_number: int
+    size: int
+
+class UploadCompleteRequest(BaseModel):
+    upload_id: str
+
+class DirectUploadCreateRequest(BaseModel):
+    filename: str
+    total_size: int
+
+class DirectUploadResponse(BaseModel):
+    minutes_id: int
+    upload_url: str
+    expires_at: datetime
+
+class DirectUploadCompleteRequest(BaseModel):
+    minutes_id: int
 
 class MinutesBase(BaseModel):
     user_id: str
@@ -95,8 +130,16 @@ class TranscriptResponse(BaseModel):
 class VideoUploadResultResponse(BaseModel):
     minutes_id: int
     title: str
-    video_url: str
+    video_url: Optional[str] = None  # 処理中でアップロードが完了していない場合はNone
     transcript: List[TranscriptResponse]
+    is_complete: bool = True  # Falseの場合、transcriptは処理中の途中までの内容
+
+class TranscriptSegmentResponse(BaseModel):
+    minutes_id: int
+    start_time: float  # 秒
+    end_time: float  # 秒
+    text: str
+    chunk_id: Optional[int] = None  # セグメントの先頭を含むチャンク
 
 class SummaryRequest(BaseModel):
     transcript_id: int
@@ -126,6 +169,9 @@ class ReferenceItem(BaseModel):
     chunk_id: int
     content: str
     rank: int
+    # チャンクに対応する再生範囲（秒）。タイムスタンプがない場合はNone
+    start_time: Optional[float] = None
+    end_time: Optional[float] = None
 
 class ReferenceResponse(BaseModel):
     references: List[ReferenceItem]
@@ -134,6 +180,7 @@ class MinutesListItem(BaseModel):
     minutes_id: int
     title: str
     image_url: Optional[str] = None
+    placeholder_url: Optional[str] = None  # サムネイルの読み込み中に表示する極小の画像
     created_at: datetime
 
 class MinutesListResponse(BaseModel):
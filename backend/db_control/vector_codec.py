@@ -0,0 +1,72 @@
+from typing import Optional, Sequence, Union
+from dotenv import load_dotenv
+import json
+import os
+import struct
+import numpy as np
+
+load_dotenv()
+
+# ベクトルをバイナリで保存する際の形式
+# 先頭8バイトのヘッダー（マジック2バイト、型コード1バイト、予約1バイト、次元数4バイト）に続けて、
+# リトルエンディアンの浮動小数点数を次元数分並べる。ヘッダーを8バイトにすることで、値の開始位置を揃える
+VECTOR_MAGIC = b"EV"
+VECTOR_HEADER = struct.Struct("<2sBxI")
+VECTOR_DTYPES = {
+    1: np.dtype("<f4"),  # float32
+    2: np.dtype("<f2"),  # float16（容量を半分にしたい場合）
+}
+VECTOR_DTYPE_CODES = {dtype: code for code, dtype in VECTOR_DTYPES.items()}
+# 新しく保存するベクトルの型（"float32" / "float16"）
+VECTOR_STORAGE_DTYPE = os.getenv("VECTOR_STORAGE_DTYPE", "float32")
+
+def encode_vector(values: Union[Sequence[float], np.ndarray], dtype: str = VECTOR_STORAGE_DTYPE) -> bytes:
+    """
+    ベクトルをヘッダー付きのバイナリに変換する
+
+    Args:
+        values (Union[Sequence[float], np.ndarray]): ベクトル
+        dtype (str): 保存する型（"float32" / "float16"）
+
+    Returns:
+        bytes: 保存用のバイナリ
+    """
+    array = np.asarray(values, dtype=np.dtype(dtype).newbyteorder("<"))
+    if array.ndim != 1:
+        raise ValueError("ベクトルは1次元の配列にしてください")
+    header = VECTOR_HEADER.pack(VECTOR_MAGIC, VECTOR_DTYPE_CODES[array.dtype], array.shape[0])
+    return header + array.tobytes()
+
+def decode_vector(data: Union[bytes, memoryview]) -> np.ndarray:
+    """
+    バイナリからベクトルを読み込む（コピーせずに元のバッファを参照する読み取り専用の配列を返す）
+
+    Args:
+        data (Union[bytes, memoryview]): encode_vectorで変換したバイナリ
+
+    Returns:
+        np.ndarray: ベクトル
+    """
+    magic, dtype_code, dimension = VECTOR_HEADER.unpack_from(data)
+    if magic != VECTOR_MAGIC or dtype_code not in VECTOR_DTYPES:
+        raise ValueError("ベクトルの形式が正しくありません")
+    return np.frombuffer(data, dtype=VECTOR_DTYPES[dtype_code], count=dimension, offset=VECTOR_HEADER.size)
+
+def load_embedding(vector: Optional[Union[bytes, memoryview]], embedding: Optional[str]) -> np.ndarray:
+    """
+    保存されたベクトルを読み込む
+
+    バイナリ（vector）があればそれを使い、移行前のJSON文字列（embedding）しかない行はJSONから読み込む
+
+    Args:
+        vector (Optional[Union[bytes, memoryview]]): バイナリのベクトル
+        embedding (Optional[str]): JSON文字列のベクトル（移行前の形式）
+
+    Returns:
+        np.ndarray: ベクトル
+    """
+    if vector is not None:
+        return decode_vector(vector)
+    if embedding:
+        return np.asarray(json.loads(embedding), dtype=np.float32)
+    raise ValueError("ベクトルが保存されていません")
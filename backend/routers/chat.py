@@ -4,9 +4,10 @@ from sqlalchemy.exc import IntegrityError
 from db_control import crud, schemas
 from db_control.connect import get_db
 from utils.auth import get_current_user_id
-from utils.embedding import generate_embedding
-from utils.similarity import find_similar_chunks, parse_embedding_vector
+from utils.embedding_cache import generate_embedding_cached
+from utils.similarity import search_similar_chunks
 from utils.chat_response import generate_chat_response
+from utils import ai_gateway
 from typing import Optional
 import logging
 import json
@@ -171,8 +172,8 @@ async def send_chat(
         
         # ユーザーメッセージをベクトル化
         try:
-            query_embedding_str = await generate_embedding(request.message)
-            query_vector = parse_embedding_vector(query_embedding_str)
+            # 同じ質問はキャッシュから取得する（APIへの往復を省く）
+            query_vector = await generate_embedding_cached(request.message, priority=ai_gateway.PRIORITY_INTERACTIVE)
             logger.info(f"ユーザーメッセージをベクトル化完了")
         except Exception as e:
             logger.error(f"ベクトル化中にエラーが発生: {str(e)}")
@@ -181,22 +182,12 @@ async def send_chat(
                 detail="メッセージのベクトル化中にエラーが発生しました"
             )
         
-        # 文字起こしのチャンクとベクトル埋め込みを取得
+        # 類似度検索を実行（pgvectorが使える場合はデータベース側で上位のチャンクのみを取得する）
         try:
-            chunks_with_embeddings = crud.get_transcript_chunks_with_embeddings(db, chat_session.transcript_id)
-            logger.info(f"チャンクとベクトル埋め込みを取得: {len(chunks_with_embeddings)}件")
-        except Exception as e:
-            logger.error(f"チャンクとベクトル埋め込みの取得中にエラーが発生: {str(e)}")
-            raise HTTPException(
-                status_code=500,
-                detail="文字起こしデータの取得中にエラーが発生しました"
-            )
-        
-        # 類似度検索を実行
-        try:
-            similar_chunks = find_similar_chunks(
+            similar_chunks = search_similar_chunks(
+                db,
+                chat_session.transcript_id,
                 query_vector=query_vector,
-                chunks_with_embeddings=chunks_with_embeddings,
                 threshold=0.65,
                 max_results=5
             )
@@ -316,10 +307,14 @@ async def get_references(
         # レスポンス形式に変換
         reference_items = []
         for reference, chunk in references_with_chunks:
+            # 動画の該当箇所へ移動できるよう、チャンクの再生範囲を付ける
+            time_range = crud.get_chunk_time_range(db, chunk)
             reference_items.append({
                 "chunk_id": chunk.id,
                 "content": chunk.content,
-                "rank": reference.rank
+                "rank": reference.rank,
+                "start_time": time_range[0] / 1000 if time_range else None,
+                "end_time": time_range[1] / 1000 if time_range else None
             })
         
         return {
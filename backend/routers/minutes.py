@@ -1,17 +1,11 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, BackgroundTasks, Depends
-from typing import List
-import asyncio
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
 from db_control import crud, schemas
 from utils.auth import get_current_user_id
-from utils import transcription, storage, chunk, embedding
+from utils import storage, upload, pipeline
 from sqlalchemy.orm import Session
-from db_control.connect import get_db, SessionLocal
-import tempfile
-import os
-from datetime import datetime
-import uuid
+from db_control.connect import get_db
 import logging
-from pydantic import BaseModel
+import os
 
 # ロギングの設定
 logging.basicConfig(level=logging.INFO)
@@ -28,8 +22,7 @@ def validate_video_file(file: UploadFile) -> bool:
 async def upload_video(
     file: UploadFile = File(...),
     user_id: str = Depends(get_current_user_id),
-    db: Session = Depends(get_db),
-    background_tasks: BackgroundTasks = None
+    db: Session = Depends(get_db)
 ):
     # ファイル形式のバリデーション
     if not validate_video_file(file):
@@ -38,129 +31,53 @@ async def upload_video(
             detail="無効なファイル形式です。mp4またはmov形式のファイルをアップロードしてください。"
         )
     
+    temp_path = None
+    minutes_id = None
     try:
+        # 一時ファイルに一定サイズずつ保存（動画全体をメモリに載せない）
+        temp_path, content_hash = await upload.save_upload_to_temp(file)
+        
         # minutes_idの生成とDBへの保存（ファイル名を渡す）
         minutes_id = await crud.create_minutes(db, user_id=user_id, filename=file.filename)
         
-        # 動画データをDBに保存（status: queued）
-        video_id = await crud.create_video(db, minutes_id, None)
+        # 動画データをDBに保存（Blobへのアップロードが終わるまでは処理待ちにしない）
+        video_id = await crud.create_video(db, minutes_id, None, status="uploading", content_hash=content_hash)
         
-        # 一時ファイルに保存
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(file.filename)[1])
-        content = await file.read()
-        temp_file.write(content)
-        temp_file.close()
+        # ジョブはBlob上の動画を参照する（APIのノードのファイルは他のノードのワーカーから読めないため渡さない）
+        await pipeline.upload_to_blob(temp_path, minutes_id, video_id)
+        await crud.update_video_status(db, minutes_id, "queued")
         
-        # バックグラウンドタスクとして処理を開始
-        background_tasks.add_task(process_video, temp_file.name, minutes_id, db)
+        # 処理ジョブをキューに登録（ジョブワーカーが処理する）
+        await crud.enqueue_processing_job(db, minutes_id, None)
         
         return schemas.VideoUploadResponse(
             minutes_id=minutes_id,
             status="queued"
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         # エラー発生時の処理
         error_message = f"動画のアップロード中にエラーが発生しました: {str(e)}"
         logger.error(error_message)  # ログ出力
+        if minutes_id is not None:
+            try:
+                db.rollback()
+                await crud.update_video_status(db, minutes_id, "failed")
+            except Exception as update_error:
+                logger.error(f"ステータス更新中にエラーが発生: {str(update_error)}")
         raise HTTPException(
             status_code=500,
             detail=error_message
         )
-
-async def process_video(file_path: str, minutes_id: int, db: Session):
-    """
-    動画の処理を行う関数
-    """
-    try:
-        # 処理開始を通知
-        await crud.update_video_status(db, minutes_id, "processing")
-        await crud.update_video_progress(db, minutes_id, 0)
-        
-        # 1. 動画をAzure Blob Storageにアップロード
-        with open(file_path, 'rb') as f:
-            video_url = await storage.upload_video(f, minutes_id)
-        if not video_url:
-            raise Exception("動画のアップロードに失敗しました")
-        await crud.update_video_progress(db, minutes_id, 10)
-        
-        # 2. 動画データのURLを更新
-        video = crud.get_video(db, minutes_id)
-        if not video:
-            raise Exception("動画データが見つかりません")
-        video.video_url = video_url
-        db.commit()
-        
-        # 動画保存完了（30%）
-        await crud.update_video_progress(db, minutes_id, 20)
-        
-        # 3. 文字起こしの実行
-        transcript_content = await transcription.transcribe_video(video_url, db, minutes_id)
-        if not transcript_content:
-            raise Exception("文字起こしに失敗しました")
-        
-        # 文字起こし完了（60%）
-        await crud.update_video_progress(db, minutes_id, 80)
-        
-        # 4. 文字起こしデータの保存
-        transcript_id = await crud.create_transcript(db, video.id, transcript_content)
-        if not transcript_id:
-            raise Exception("文字起こしデータの保存に失敗しました")
-        
-        # 5. チャンク分割
-        chunks = chunk.split_into_chunks(transcript_content)
-        if not chunks:
-            raise Exception("チャンク分割に失敗しました")
-        
-        # チャンク分割完了（80%）
-        await crud.update_video_progress(db, minutes_id, 90)
-        
-        # 6. チャンクの保存とベクトル化
-        total_chunks = len(chunks)
-        for i, chunk_content in enumerate(chunks):
-            # 各チャンク処理ごとに新しいデータベースセッションを作成
-            chunk_db = SessionLocal()
-            try:
-                chunk_id = await crud.create_transcript_chunk(chunk_db, transcript_id, i, chunk_content)
-                if not chunk_id:
-                    raise Exception("チャンクの保存に失敗しました")
-                    
-                embedding_vector = await embedding.generate_embedding(chunk_content)
-                if not embedding_vector:
-                    raise Exception("ベクトル化に失敗しました")
-                    
-                await crud.create_vector_embedding(chunk_db, chunk_id, embedding_vector)
-                chunk_db.commit()
-                
-                # Embedding生成の進捗を更新（95%）
-                await crud.update_video_progress(db, minutes_id, 95)
-            finally:
-                chunk_db.close()
-        
-        # すべてのチャンクのEmbedding生成が完了したら、is_embeddedを更新
-        await crud.update_transcript_embedded(db, transcript_id)
-        
-        # 7. 処理完了の更新
-        await crud.update_video_status(db, minutes_id, "completed")
-        await crud.update_video_progress(db, minutes_id, 100)
-        
-    except Exception as e:
-        # エラー発生時の処理
-        error_message = f"動画処理中にエラーが発生しました: {str(e)}"
-        logger.error(error_message)
-        try:
-            db.rollback()  # トランザクションをロールバック
-            await crud.update_video_status(db, minutes_id, "failed")
-            # エラー発生時の進捗を保持（最後に更新された進捗を維持）
-        except Exception as update_error:
-            logger.error(f"ステータス更新中にエラーが発生: {str(update_error)}")
-        raise Exception(error_message)
     finally:
-        # 一時ファイルの削除
-        try:
-            os.unlink(file_path)
-        except Exception as e:
-            logger.error(f"一時ファイルの削除に失敗: {str(e)}")
+        # Blobへのアップロード後（または失敗時）は一時ファイルを残さない
+        if temp_path:
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
 
 @router.get("/api/upload_status", response_model=schemas.VideoUploadStatusResponse)
 def get_upload_status(
@@ -203,10 +120,13 @@ def get_upload_status(
                 detail="指定された議事録IDの動画が見つかりません"
             )
         
+        transcript_state = crud.get_transcript_state(db, video.id)
+        
         return schemas.VideoUploadStatusResponse(
             minutes_id=minutes_id,
             status=video.status,
-            progress=video.progress
+            progress=video.progress,
+            transcript_available=bool(transcript_state)
         )
         
     except HTTPException:
@@ -222,14 +142,18 @@ def get_upload_status(
 @router.get("/api/upload_result", response_model=schemas.VideoUploadResultResponse)
 def get_upload_result(
     minutes_id: int,
+    partial: bool = False,
     user_id: str = Depends(get_current_user_id),
     db: Session = Depends(get_db)
 ):
     """
     動画のアップロードと処理結果を取得する
     
+    partialがtrueの場合は、処理中でもその時点までの文字起こしを返す（is_completeがfalseになる）
+    
     Args:
         minutes_id (int): 議事録ID
+        partial (bool): 処理中の途中までの文字起こしを取得するかどうか
         user_id (str): 認証されたユーザーID
         db (Session): データベースセッション
         
@@ -260,8 +184,9 @@ def get_upload_result(
                 detail="指定された議事録IDの動画が見つかりません"
             )
         
-        # 処理が完了していない場合はエラー
-        if video.status != "completed":
+        # 処理が完了していない場合はエラー（途中までの文字起こしを要求された場合を除く）
+        is_completed = video.status == "completed"
+        if not is_completed and not partial:
             raise HTTPException(
                 status_code=400,
                 detail="動画の処理が完了していません"
@@ -275,9 +200,11 @@ def get_upload_result(
                 detail="文字起こしデータが見つかりません"
             )
         
-        # 動画URLをSAS URLに変換
+        # 動画URLをSAS URLに変換（処理中でアップロードが完了していない場合はNone）
         try:
-            video_url = storage.generate_sas_url(video.video_url, storage.container_name_video)
+            video_url = None
+            if video.video_url:
+                video_url = storage.generate_sas_url(video.video_url, storage.container_name_video)
         except Exception as e:
             logger.error(f"動画URLのSAS URL生成中にエラーが発生: {str(e)}")
             raise HTTPException(
@@ -294,7 +221,8 @@ def get_upload_result(
                     transcript_id=transcript.id,
                     transcript_content=transcript.content
                 )
-            ]
+            ],
+            is_complete=is_completed and transcript.is_complete
         )
         
     except HTTPException:
@@ -307,6 +235,68 @@ def get_upload_result(
             detail=error_message
         )
 
+@router.get("/api/transcript_segment", response_model=schemas.TranscriptSegmentResponse)
+def get_transcript_segment(
+    minutes_id: int,
+    time: float,
+    user_id: str = Depends(get_current_user_id),
+    db: Session = Depends(get_db)
+):
+    """
+    動画の再生位置で話されている文字起こしのセグメントを取得する
+    
+    Args:
+        minutes_id (int): 議事録ID
+        time (float): 動画の先頭からの再生位置（秒）
+        user_id (str): 認証されたユーザーID
+        db (Session): データベースセッション
+        
+    Returns:
+        TranscriptSegmentResponse: セグメントの再生範囲と内容
+    """
+    try:
+        minutes = crud.get_minutes(db, minutes_id)
+        if not minutes:
+            raise HTTPException(
+                status_code=404,
+                detail="指定された議事録IDのデータが見つかりません"
+            )
+        
+        if str(minutes.user_id) != str(user_id):
+            raise HTTPException(
+                status_code=403,
+                detail="この議事録へのアクセス権限がありません"
+            )
+        
+        video = crud.get_video(db, minutes_id)
+        transcript = crud.get_transcript(db, video.id) if video else None
+        segment = crud.get_transcript_segment_at(db, transcript.id, int(time * 1000)) if transcript else None
+        if not segment:
+            raise HTTPException(
+                status_code=404,
+                detail="タイムスタンプ付きの文字起こしが見つかりません"
+            )
+        
+        chunk = crud.get_chunk_at_position(db, transcript.id, segment.char_start)
+        
+        return schemas.TranscriptSegmentResponse(
+            minutes_id=minutes_id,
+            start_time=segment.start_ms / 1000,
+            end_time=segment.end_ms / 1000,
+            text=transcript.content[segment.char_start:segment.char_end],
+            chunk_id=chunk.id if chunk else None
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        error_message = f"文字起こしセグメントの取得中にエラーが発生しました: {str(e)}"
+        logger.error(error_message)
+        raise HTTPException(
+            status_code=500,
+            detail=error_message
+        )
+
 @router.get("/api/get_all_minutes", response_model=schemas.MinutesListResponse)
 async def get_all_minutes(
     user_id: str = Depends(get_current_user_id),
@@ -330,11 +320,15 @@ async def get_all_minutes(
         minutes_list = []
         
         for minutes, video_image_url in results:
-            # 画像URLをSAS URLに変換
+            # 画像URL（サムネイルとプレースホルダー）をSAS URLに変換
             image_url = None
+            placeholder_url = None
             if video_image_url:
                 try:
                     image_url = storage.generate_sas_url(video_image_url, storage.container_name_video)
+                    placeholder_url = storage.generate_sas_url(
+                        storage.get_placeholder_blob_name(video_image_url), storage.container_name_video
+                    )
                 except Exception as e:
                     logger.error(f"画像URLのSAS URL生成中にエラーが発生: {str(e)}")
             
@@ -342,6 +336,7 @@ async def get_all_minutes(
                 minutes_id=minutes.id,
                 title=minutes.title,
                 image_url=image_url,
+                placeholder_url=placeholder_url,
                 created_at=minutes.created_at
             ))
         
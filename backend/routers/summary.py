@@ -27,7 +27,7 @@ async def generate_summary_endpoint(
         SummaryResponse: 生成された要約
     """
     try:
-        summary_content = process_summary_generation(db, request.transcript_id, user_id)
+        summary_content = await process_summary_generation(db, request.transcript_id, user_id)
         return {"summary": summary_content}
     except HTTPException:
         raise
@@ -0,0 +1,420 @@
+from fastapi import APIRouter, Request, HTTPException, Depends
+from db_control import crud, schemas
+from utils.auth import get_current_user_id
+from utils import upload, storage
+from routers.minutes import validate_video_file
+from sqlalchemy.orm import Session
+from db_control.connect import get_db
+import math
+import uuid
+import logging
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(tags=["Upload"])
+
+def get_owned_upload_session(db: Session, upload_id: str, user_id: str):
+    """
+    アップロードセッションを取得し、所有者を確認する
+
+    Raises:
+        HTTPException: セッションが存在しない、またはアクセス権限がない場合
+    """
+    upload_session = crud.get_upload_session(db, upload_id)
+    if not upload_session:
+        raise HTTPException(
+            status_code=404,
+            detail="指定されたアップロードセッションが見つかりません"
+        )
+    if str(upload_session.user_id) != str(user_id):
+        raise HTTPException(
+            status_code=403,
+            detail="このアップロードセッションへのアクセス権限がありません"
+        )
+    return upload_session
+
+def build_upload_session_response(db: Session, upload_session) -> schemas.UploadSessionResponse:
+    parts = crud.get_upload_parts(db, upload_session.id)
+    return schemas.UploadSessionResponse(
+        upload_id=upload_session.id,
+        minutes_id=upload_session.minutes_id,
+        status=upload_session.status,
+        part_size=upload_session.part_size,
+        total_parts=upload_session.total_parts,
+        received_parts=[part.part_number for part in parts]
+    )
+
+@router.post("/api/create_upload_session", response_model=schemas.UploadSessionResponse)
+async def create_upload_session(
+    request: schemas.UploadSessionCreateRequest,
+    user_id: str = Depends(get_current_user_id),
+    db: Session = Depends(get_db)
+):
+    """
+    分割アップロードのセッションを作成する
+
+    Args:
+        request (UploadSessionCreateRequest): ファイル名・全体サイズ・パートサイズ
+        user_id (str): 認証されたユーザーID
+        db (Session): データベースセッション
+
+    Returns:
+        UploadSessionResponse: アップロードIDとパート構成
+    """
+    if not validate_video_file(request):
+        raise HTTPException(
+            status_code=400,
+            detail="無効なファイル形式です。mp4またはmov形式のファイルをアップロードしてください。"
+        )
+    if request.total_size <= 0 or request.total_size > upload.MAX_UPLOAD_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"ファイルサイズは1バイト以上{upload.MAX_UPLOAD_SIZE}バイト以下にしてください"
+        )
+    part_size = request.part_size or upload.UPLOAD_PART_SIZE
+    if not upload.MIN_UPLOAD_PART_SIZE <= part_size <= upload.MAX_UPLOAD_PART_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"パートサイズは{upload.MIN_UPLOAD_PART_SIZE}〜{upload.MAX_UPLOAD_PART_SIZE}バイトで指定してください"
+        )
+
+    try:
+        minutes_id = await crud.create_minutes(db, user_id=user_id, filename=request.filename)
+        # パートが揃うまでは処理待ちにしない
+        await crud.create_video(db, minutes_id, None, status="uploading")
+
+        upload_session = await crud.create_upload_session(
+            db,
+            upload_id=uuid.uuid4().hex,
+            minutes_id=minutes_id,
+            user_id=user_id,
+            filename=request.filename,
+            total_size=request.total_size,
+            part_size=part_size,
+            total_parts=math.ceil(request.total_size / part_size)
+        )
+        logger.info(f"アップロードセッションを作成: upload_id={upload_session.id}, parts={upload_session.total_parts}")
+        return build_upload_session_response(db, upload_session)
+
+    except Exception as e:
+        error_message = f"アップロードセッションの作成中にエラーが発生しました: {str(e)}"
+        logger.error(error_message)
+        raise HTTPException(
+            status_code=500,
+            detail=error_message
+        )
+
+@router.put("/api/upload_part", response_model=schemas.UploadPartResponse)
+async def upload_part(
+    upload_id: str,
+    part_number: int,
+    request: Request,
+    user_id: str = Depends(get_current_user_id),
+    db: Session = Depends(get_db)
+):
+    """
+    パートを1つ受信する。リクエストボディがそのままパートのデータになる
+
+    パートは順不同・並列に送信でき、同じパートの再送は上書きされる。
+    パートは動画のブロブの未確定のブロックとして書き込むため、どのノードで受信してもよい。
+
+    Args:
+        upload_id (str): アップロードID
+        part_number (int): パート番号（1始まり）
+        request (Request): パートのデータを含むリクエスト
+        user_id (str): 認証されたユーザーID
+        db (Session): データベースセッション
+
+    Returns:
+        UploadPartResponse: 受信したパートの情報
+    """
+    upload_session = get_owned_upload_session(db, upload_id, user_id)
+    if upload_session.status != "uploading":
+        raise HTTPException(
+            status_code=409,
+            detail="このアップロードセッションは既に完了しています"
+        )
+    if not 1 <= part_number <= upload_session.total_parts:
+        raise HTTPException(
+            status_code=400,
+            detail=f"パート番号は1〜{upload_session.total_parts}で指定してください"
+        )
+
+    expected_size = upload.expected_part_size(
+        upload_session.total_size, upload_session.part_size, upload_session.total_parts, part_number
+    )
+    try:
+        size = await upload.stage_upload_part(
+            storage.get_video_blob_name(upload_session.minutes_id), part_number, request.stream(), expected_size
+        )
+        await crud.save_upload_part(db, upload_id, part_number, size)
+        return schemas.UploadPartResponse(
+            upload_id=upload_id,
+            part_number=part_number,
+            size=size
+        )
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        error_message = f"パートの受信中にエラーが発生しました: {str(e)}"
+        logger.error(error_message)
+        raise HTTPException(
+            status_code=500,
+            detail=error_message
+        )
+
+@router.get("/api/upload_session", response_model=schemas.UploadSessionResponse)
+def get_upload_session(
+    upload_id: str,
+    user_id: str = Depends(get_current_user_id),
+    db: Session = Depends(get_db)
+):
+    """
+    アップロードセッションの状態と受信済みのパート番号を取得する
+
+    Args:
+        upload_id (str): アップロードID
+        user_id (str): 認証されたユーザーID
+        db (Session): データベースセッション
+
+    Returns:
+        UploadSessionResponse: セッションの状態
+    """
+    upload_session = get_owned_upload_session(db, upload_id, user_id)
+    return build_upload_session_response(db, upload_session)
+
+@router.post("/api/complete_upload", response_model=schemas.VideoUploadResponse)
+async def complete_upload(
+    request: schemas.UploadCompleteRequest,
+    user_id: str = Depends(get_current_user_id),
+    db: Session = Depends(get_db)
+):
+    """
+    全パートを結合して動画処理を開始する
+
+    パートはBlobのブロックとして書き込み済みのため、ブロックの一覧を確定して1つのブロブにする。
+    ジョブはブロブを参照するため、どのノードのワーカーでも処理できる。
+    内容のハッシュはワーカーがブロブから求める。
+
+    Args:
+        request (UploadCompleteRequest): アップロードID
+        user_id (str): 認証されたユーザーID
+        db (Session): データベースセッション
+
+    Returns:
+        VideoUploadResponse: 議事録IDと処理状況
+    """
+    upload_session = get_owned_upload_session(db, request.upload_id, user_id)
+    if upload_session.status != "uploading":
+        raise HTTPException(
+            status_code=409,
+            detail="このアップロードセッションは既に完了しています"
+        )
+
+    # 全パートが想定サイズで揃っているか確認
+    parts = {part.part_number: part.size for part in crud.get_upload_parts(db, upload_session.id)}
+    missing_parts = [
+        n for n in range(1, upload_session.total_parts + 1)
+        if parts.get(n) != upload.expected_part_size(
+            upload_session.total_size, upload_session.part_size, upload_session.total_parts, n
+        )
+    ]
+    if missing_parts:
+        raise HTTPException(
+            status_code=400,
+            detail=f"未受信のパートがあります: {missing_parts}"
+        )
+
+    # 同じセッションの完了が同時に要求された場合は、先にステータスを更新したリクエストだけが処理する
+    if not crud.claim_upload_session(db, upload_session.id, "uploading", "completed"):
+        raise HTTPException(
+            status_code=409,
+            detail="このアップロードセッションは既に完了しています"
+        )
+
+    video_claimed = False
+    try:
+        # 結合は確定済みのブロックも参照できるため、前回の完了処理が途中で失敗していても再実行できる
+        blob_name = storage.get_video_blob_name(upload_session.minutes_id)
+        await storage.commit_video_blocks(
+            blob_name, [upload.get_block_id(n) for n in range(1, upload_session.total_parts + 1)]
+        )
+        video_claimed = crud.claim_video_upload(db, upload_session.minutes_id, blob_name)
+        if not video_claimed:
+            raise Exception("動画のステータスがアップロード中ではありません")
+
+        # 処理ジョブをキューに登録（Blobに結合済みのためファイルパスなし）
+        await crud.enqueue_processing_job(db, upload_session.minutes_id, None)
+
+        return schemas.VideoUploadResponse(
+            minutes_id=upload_session.minutes_id,
+            status="queued"
+        )
+
+    except Exception as e:
+        error_message = f"アップロードの完了処理中にエラーが発生しました: {str(e)}"
+        logger.error(error_message)
+        try:
+            db.rollback()
+            await crud.update_upload_session_status(db, upload_session.id, "uploading")
+            if video_claimed:
+                await crud.update_video_status(db, upload_session.minutes_id, "uploading")
+        except Exception as update_error:
+            logger.error(f"ステータス更新中にエラーが発生: {str(update_error)}")
+        raise HTTPException(
+            status_code=500,
+            detail=error_message
+        )
+
+@router.post("/api/create_direct_upload", response_model=schemas.DirectUploadResponse)
+async def create_direct_upload(
+    request: schemas.DirectUploadCreateRequest,
+    user_id: str = Depends(get_current_user_id),
+    db: Session = Depends(get_db)
+):
+    """
+    ブラウザからBlob Storageへ直接アップロードするための書き込み専用SAS URLを発行する
+
+    クライアントはupload_urlに動画をPUT（x-ms-blob-type: BlockBlob）し、
+    完了後に/api/complete_direct_uploadを呼び出す。
+    1回のPut Blobで書き込めるのは5000MiBまでで、MAX_UPLOAD_SIZE（5GiB）に届かないため、
+    大きいファイルはPut Block（comp=block）で分割して書き込み、Put Block List（comp=blocklist）で確定する。
+    SASの有効期限（UPLOAD_SAS_EXPIRY_MINUTES）内に確定まで終える必要がある。
+
+    Args:
+        request (DirectUploadCreateRequest): ファイル名と全体サイズ
+        user_id (str): 認証されたユーザーID
+        db (Session): データベースセッション
+
+    Returns:
+        DirectUploadResponse: 議事録IDとアップロード先のSAS URL
+    """
+    if not validate_video_file(request):
+        raise HTTPException(
+            status_code=400,
+            detail="無効なファイル形式です。mp4またはmov形式のファイルをアップロードしてください。"
+        )
+    if request.total_size <= 0 or request.total_size > upload.MAX_UPLOAD_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"ファイルサイズは1バイト以上{upload.MAX_UPLOAD_SIZE}バイト以下にしてください"
+        )
+
+    try:
+        minutes_id = await crud.create_minutes(db, user_id=user_id, filename=request.filename)
+        await crud.create_video(db, minutes_id, None, status="uploading")
+
+        upload_url, expires_at = storage.generate_upload_sas_url(
+            storage.get_video_blob_name(minutes_id), storage.container_name_video
+        )
+        logger.info(f"直接アップロード用SASを発行: minutes_id={minutes_id}, expires_at={expires_at}")
+        return schemas.DirectUploadResponse(
+            minutes_id=minutes_id,
+            upload_url=upload_url,
+            expires_at=expires_at
+        )
+
+    except Exception as e:
+        error_message = f"直接アップロードの準備中にエラーが発生しました: {str(e)}"
+        logger.error(error_message)
+        raise HTTPException(
+            status_code=500,
+            detail=error_message
+        )
+
+@router.post("/api/complete_direct_upload", response_model=schemas.VideoUploadResponse)
+async def complete_direct_upload(
+    request: schemas.DirectUploadCompleteRequest,
+    user_id: str = Depends(get_current_user_id),
+    db: Session = Depends(get_db)
+):
+    """
+    直接アップロードされたブロブを検証し、動画処理を開始する
+
+    Args:
+        request (DirectUploadCompleteRequest): 議事録ID
+        user_id (str): 認証されたユーザーID
+        db (Session): データベースセッション
+
+    Returns:
+        VideoUploadResponse: 議事録IDと処理状況
+    """
+    minutes = crud.get_minutes(db, request.minutes_id)
+    if not minutes:
+        raise HTTPException(
+            status_code=404,
+            detail="指定された議事録IDのデータが見つかりません"
+        )
+    if str(minutes.user_id) != str(user_id):
+        raise HTTPException(
+            status_code=403,
+            detail="この議事録へのアクセス権限がありません"
+        )
+    video = crud.get_video(db, request.minutes_id)
+    if not video:
+        raise HTTPException(
+            status_code=404,
+            detail="指定された議事録IDの動画が見つかりません"
+        )
+    if video.status != "uploading":
+        raise HTTPException(
+            status_code=409,
+            detail="この動画は既にアップロードが完了しています"
+        )
+
+    try:
+        # ブロブが存在し、サイズが上限内であることを確認
+        blob_name = storage.get_video_blob_name(request.minutes_id)
+        blob_info = await storage.get_blob_size_and_etag(blob_name, storage.container_name_video)
+        if not blob_info or not blob_info[0]:
+            raise HTTPException(
+                status_code=400,
+                detail="アップロードされた動画が見つかりません"
+            )
+        blob_size, blob_etag = blob_info
+        if blob_size > upload.MAX_UPLOAD_SIZE:
+            raise HTTPException(
+                status_code=413,
+                detail=f"ファイルサイズが上限（{upload.MAX_UPLOAD_SIZE}バイト）を超えています"
+            )
+
+        # "uploading"から"queued"への更新に成功したリクエストだけがジョブを登録する（同時の完了要求で二重に登録しない）
+        if not crud.claim_video_upload(db, request.minutes_id, blob_name):
+            raise HTTPException(
+                status_code=409,
+                detail="この動画は既にアップロードが完了しています"
+            )
+    except HTTPException:
+        raise
+    except Exception as e:
+        error_message = f"直接アップロードの完了処理中にエラーが発生しました: {str(e)}"
+        logger.error(error_message)
+        raise HTTPException(
+            status_code=500,
+            detail=error_message
+        )
+
+    try:
+        # SASの有効期限内は完了後もブロブを上書きできるため、完了時点のETagを記録し、
+        # 処理ではこのETagから変更されていないブロブのみを読み込む
+        await crud.save_checkpoint(db, video.id, "blob_etag", 0, blob_etag)
+
+        # 処理ジョブをキューに登録（アップロード済みのためファイルパスなし）
+        await crud.enqueue_processing_job(db, request.minutes_id, None)
+
+        return schemas.VideoUploadResponse(
+            minutes_id=request.minutes_id,
+            status="queued"
+        )
+
+    except Exception as e:
+        # ジョブを登録できなかった場合は、再度完了を要求できるようにアップロード中に戻す
+        db.rollback()
+        await crud.update_video_status(db, request.minutes_id, "uploading")
+        error_message = f"直接アップロードの完了処理中にエラーが発生しました: {str(e)}"
+        logger.error(error_message)
+        raise HTTPException(
+            status_code=500,
+            detail=error_message
+        )
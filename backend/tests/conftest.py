@@ -0,0 +1,8 @@
+import os
+import sys
+import tempfile
+
+# テストからbackend直下のモジュール（utils、db_controlなど）をインポートできるようにする
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# データベースを使うモジュールはインポート時に接続するため、未指定の場合はテスト用のSQLiteを使う
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.gettempdir(), 'ai_minutes_test.db')}")
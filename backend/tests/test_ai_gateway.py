@@ -0,0 +1,96 @@
+import asyncio
+import time
+import httpx
+import pytest
+from utils import ai_gateway
+
+# 応答を返すまでの時間（秒）
+SLOW_RESPONSE_SECONDS = 0.5
+
+async def slow_handler(request: httpx.Request) -> httpx.Response:
+    await asyncio.sleep(SLOW_RESPONSE_SECONDS)
+    return httpx.Response(200, json={
+        "object": "list",
+        "model": "test",
+        "usage": {"prompt_tokens": 1, "total_tokens": 1},
+        "data": [{"object": "embedding", "index": 0, "embedding": [0.1, 0.2]}],
+    })
+
+@pytest.fixture
+def slow_gateway(monkeypatch):
+    """共有のHTTPクライアントを、応答の遅いモックに差し替える"""
+    monkeypatch.setenv("AZURE_OPENAI_API_KEY", "test")
+    monkeypatch.setenv("AZURE_OPENAI_BASE_URL", "https://test.openai.azure.com")
+    monkeypatch.setitem(ai_gateway.DEPLOYMENTS, "embed", {
+        **ai_gateway.DEPLOYMENTS["embed"],
+        "deployment": "embed",
+        "api_version": "2024-06-01",
+        "rpm": 0,
+        "tpm": 0,
+    })
+    monkeypatch.setattr(ai_gateway, "_http_client", httpx.AsyncClient(transport=httpx.MockTransport(slow_handler)))
+    monkeypatch.setattr(ai_gateway, "_clients", {})
+    monkeypatch.setattr(ai_gateway, "_limiters", {})
+    monkeypatch.setattr(ai_gateway, "OPENAI_MAX_RETRIES", 0)
+    return ai_gateway
+
+def embed(client):
+    return client.embeddings.create(input=["テスト"], model="embed")
+
+async def call_with_ticker(kind: str):
+    """リクエストの間、別のタスクが動き続けた回数と、リクエストの結果・経過時間を返す"""
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.01)
+            ticks += 1
+
+    ticker_task = asyncio.create_task(ticker())
+    started_at = time.monotonic()
+    try:
+        result = await ai_gateway.call(kind, embed)
+    except Exception as e:
+        result = e
+    finally:
+        elapsed = time.monotonic() - started_at
+        ticker_task.cancel()
+    return result, elapsed, ticks
+
+def test_call_does_not_block_event_loop(slow_gateway):
+    result, elapsed, ticks = asyncio.run(call_with_ticker("embed"))
+
+    assert result.data[0].embedding == [0.1, 0.2]
+    assert elapsed >= SLOW_RESPONSE_SECONDS
+    # 応答待ちの間も、他のタスクが動き続けている
+    assert ticks >= SLOW_RESPONSE_SECONDS / 0.01 * 0.5
+
+def test_call_times_out_at_configured_timeout(slow_gateway, monkeypatch):
+    timeout = 0.1
+    monkeypatch.setitem(slow_gateway.DEPLOYMENTS["embed"], "timeout", timeout)
+
+    result, elapsed, ticks = asyncio.run(call_with_ticker("embed"))
+
+    assert isinstance(result, asyncio.TimeoutError)
+    # 応答を待たずに、制限時間で打ち切られる
+    assert timeout <= elapsed < SLOW_RESPONSE_SECONDS
+    assert ticks > 0
+
+def test_rate_limited_request_is_retried_only_by_gateway(slow_gateway, monkeypatch):
+    requests = []
+
+    async def rate_limited(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(429, json={"error": {"code": "429", "message": "rate limited"}})
+
+    monkeypatch.setattr(slow_gateway, "_http_client", httpx.AsyncClient(transport=httpx.MockTransport(rate_limited)))
+    monkeypatch.setattr(slow_gateway, "OPENAI_MAX_RETRIES", 2)
+    monkeypatch.setattr(slow_gateway, "OPENAI_RETRY_BASE_SECONDS", 0.001)
+
+    with pytest.raises(ai_gateway.RateLimitError):
+        asyncio.run(ai_gateway.call("embed", embed))
+
+    # クライアント自体は再試行せず、ゲートウェイの試行回数（1回 + 再試行2回）だけ送られる
+    assert slow_gateway.get_client("embed").max_retries == 0
+    assert len(requests) == 3
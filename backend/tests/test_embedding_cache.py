@@ -0,0 +1,56 @@
+import asyncio
+import uuid
+import numpy as np
+import pytest
+from db_control import crud
+from db_control.connect import SessionLocal
+from utils import embedding, embedding_cache
+
+@pytest.fixture
+def fake_embeddings(monkeypatch):
+    """ベクトル化のAPIと、キャッシュの削除を呼び出し回数を数えるモックに差し替える"""
+    calls = {"evict": 0}
+
+    async def generate_embeddings(texts, priority=embedding_cache.ai_gateway.PRIORITY_BATCH):
+        return [np.array([float(len(text)), 1.0], dtype=np.float32) for text in texts]
+
+    def evict(db, ttl_days, max_entries):
+        calls["evict"] += 1
+        return 0
+
+    monkeypatch.setattr(embedding, "generate_embeddings", generate_embeddings)
+    monkeypatch.setattr(crud, "evict_embedding_cache", evict)
+    monkeypatch.setattr(embedding_cache, "_memory", embedding_cache.OrderedDict())
+    monkeypatch.setattr(embedding_cache, "_inserted_since_eviction", 0)
+    monkeypatch.setattr(embedding_cache, "_eviction_task", None)
+    monkeypatch.setattr(embedding_cache, "EMBEDDING_CACHE_EVICT_EVERY", 3)
+    return calls
+
+def test_eviction_runs_every_n_inserts(fake_embeddings):
+    async def run():
+        prefix = uuid.uuid4().hex
+        # キャッシュにないテキストを1件ずつベクトル化しても、削除は登録のたびには行わない
+        for i in range(2):
+            await embedding_cache.generate_embedding_cached(f"{prefix} 質問{i}")
+        assert fake_embeddings["evict"] == 0
+        await embedding_cache.generate_embedding_cached(f"{prefix} 質問2")
+        await embedding_cache._eviction_task
+        assert fake_embeddings["evict"] == 1
+
+    asyncio.run(run())
+
+def test_hit_touches_last_used_at_only_after_interval():
+    db = SessionLocal()
+    try:
+        key = uuid.uuid4().hex
+        crud.save_embedding_caches(db, "embed", {key: [0.1, 0.2]})
+        saved_at = db.query(crud.models.EmbeddingCache).filter_by(cache_key=key).one().last_used_at
+
+        # 更新間隔内の取得では、最終利用日時を書き込まない
+        assert key in crud.get_embedding_caches(db, [key], touch_interval_seconds=3600)
+        assert db.query(crud.models.EmbeddingCache).filter_by(cache_key=key).one().last_used_at == saved_at
+
+        assert key in crud.get_embedding_caches(db, [key], touch_interval_seconds=0)
+        assert db.query(crud.models.EmbeddingCache).filter_by(cache_key=key).one().last_used_at > saved_at
+    finally:
+        db.close()
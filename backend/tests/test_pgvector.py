@@ -0,0 +1,38 @@
+from types import SimpleNamespace
+import pytest
+from db_control import pgvector
+
+class RecordingSession:
+    """実行したSQLを記録し、検索結果として固定の行を返す"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.statements = []
+
+    def execute(self, statement, params=None):
+        self.statements.append(str(statement))
+        return SimpleNamespace(all=lambda: self.rows)
+
+@pytest.mark.parametrize("index_type, setting", [
+    ("hnsw", "hnsw.iterative_scan = strict_order"),
+    ("ivfflat", "ivfflat.iterative_scan = relaxed_order"),
+])
+def test_iterative_scan_setting_matches_index_type(monkeypatch, index_type, setting):
+    monkeypatch.setattr(pgvector, "_iterative_scan", True)
+    monkeypatch.setattr(pgvector, "VECTOR_INDEX_TYPE", index_type)
+    db = RecordingSession([SimpleNamespace(chunk_id=1, similarity=0.9)])
+
+    pgvector.search_chunks(db, [0.1, 0.2], [1], 5)
+
+    assert setting in db.statements[0]
+    assert all("iterative_scan" not in statement for statement in db.statements[1:])
+
+def test_ivfflat_results_are_reordered_by_similarity(monkeypatch):
+    monkeypatch.setattr(pgvector, "_iterative_scan", True)
+    monkeypatch.setattr(pgvector, "VECTOR_INDEX_TYPE", "ivfflat")
+    db = RecordingSession([SimpleNamespace(chunk_id=1, similarity=0.9)])
+
+    pgvector.search_chunks(db, [0.1, 0.2], [1], 5)
+
+    # relaxed_orderでは順序が厳密でないため、取得後に類似度の降順に並べ直す
+    assert db.statements[1].rstrip().endswith("ORDER BY similarity DESC")
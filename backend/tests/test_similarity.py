@@ -0,0 +1,62 @@
+from types import SimpleNamespace
+import numpy as np
+import pytest
+from db_control import crud, pgvector
+from db_control.vector_codec import encode_vector
+from utils import similarity
+
+TRANSCRIPT_ID = 1
+
+def make_chunks(count: int):
+    vectors = np.eye(count, dtype=np.float32)
+    return [
+        (SimpleNamespace(id=100 + i, content=f"チャンク{i}"), SimpleNamespace(vector=encode_vector(vector), embedding=None))
+        for i, vector in enumerate(vectors)
+    ]
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    """チャンクとベクトルの読み込みを、読み込んだ回数を数えるモックに差し替える"""
+    state = {"chunks": make_chunks(3), "loads": 0}
+
+    def get_version(db, transcript_id):
+        chunks = state["chunks"]
+        return len(chunks), max(chunk.id for chunk, _ in chunks)
+
+    def get_chunks_with_embeddings(db, transcript_id):
+        state["loads"] += 1
+        return state["chunks"]
+
+    def get_chunks_by_ids(db, chunk_ids):
+        return {chunk.id: chunk for chunk, _ in state["chunks"] if chunk.id in chunk_ids}
+
+    monkeypatch.setattr(pgvector, "available", False)
+    monkeypatch.setattr(crud, "get_transcript_embedding_version", get_version)
+    monkeypatch.setattr(crud, "get_transcript_chunks_with_embeddings", get_chunks_with_embeddings)
+    monkeypatch.setattr(crud, "get_transcript_chunks_by_ids", get_chunks_by_ids)
+    monkeypatch.setattr(similarity, "_index_cache", similarity.OrderedDict())
+    return state
+
+def test_index_is_reused_between_queries(fake_db):
+    first = similarity.search_similar_chunks(None, TRANSCRIPT_ID, [0, 1, 0], threshold=0.5)
+    second = similarity.search_similar_chunks(None, TRANSCRIPT_ID, [0, 0, 1], threshold=0.5)
+
+    assert [chunk.id for chunk, _, _, _ in first] == [101]
+    assert [chunk.id for chunk, _, _, _ in second] == [102]
+    assert fake_db["loads"] == 1
+
+def test_index_is_rebuilt_when_chunks_are_added(fake_db):
+    similarity.search_similar_chunks(None, TRANSCRIPT_ID, [1, 0, 0])
+    # 別のプロセスのワーカーがベクトルを追加した場合
+    fake_db["chunks"] = make_chunks(4)
+    results = similarity.search_similar_chunks(None, TRANSCRIPT_ID, [0, 0, 0, 1], threshold=0.5)
+
+    assert [chunk.id for chunk, _, _, _ in results] == [103]
+    assert fake_db["loads"] == 2
+
+def test_invalidate_transcript_index(fake_db):
+    similarity.search_similar_chunks(None, TRANSCRIPT_ID, [1, 0, 0])
+    similarity.invalidate_transcript_index(TRANSCRIPT_ID)
+    similarity.search_similar_chunks(None, TRANSCRIPT_ID, [1, 0, 0])
+
+    assert fake_db["loads"] == 2
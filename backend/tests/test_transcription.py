@@ -0,0 +1,100 @@
+import asyncio
+import pytest
+from utils import transcription
+from utils.progress import ProgressReporter
+
+def write_file(path, data: bytes) -> str:
+    path.write_bytes(data)
+    return str(path)
+
+def test_cache_key_is_stable_across_runs(tmp_path):
+    # 同じ動画から2回エンコードした音声（Oggのシリアル番号などでバイト列が異なる）
+    first_run = write_file(tmp_path / "first.ogg", b"OggS\x00serial=1")
+    second_run = write_file(tmp_path / "second.ogg", b"OggS\x00serial=2")
+    source_hash = "a" * 64
+
+    first_key = transcription.get_transcription_cache_key(first_run, source_hash, (0, 600000))
+    second_key = transcription.get_transcription_cache_key(second_run, source_hash, (0, 600000))
+
+    assert first_key == second_key
+
+def test_cache_key_depends_on_segment_and_encoder(tmp_path, monkeypatch):
+    audio = write_file(tmp_path / "segment.ogg", b"OggS")
+    source_hash = "a" * 64
+    key = transcription.get_transcription_cache_key(audio, source_hash, (0, 600000))
+
+    assert transcription.get_transcription_cache_key(audio, source_hash, (600000, 1200000)) != key
+    assert transcription.get_transcription_cache_key(audio, "b" * 64, (0, 600000)) != key
+    monkeypatch.setitem(transcription.ENCODER_SETTINGS, transcription.TRANSCRIPTION_MODE, "opus:16000:32k:mono:voip")
+    assert transcription.get_transcription_cache_key(audio, source_hash, (0, 600000)) != key
+
+def test_cache_key_falls_back_to_file_hash(tmp_path):
+    # 元の動画のハッシュがわからない場合は、ファイルの内容をキーにする
+    first = write_file(tmp_path / "first.ogg", b"OggS\x00serial=1")
+    same = write_file(tmp_path / "same.ogg", b"OggS\x00serial=1")
+    other = write_file(tmp_path / "other.ogg", b"OggS\x00serial=2")
+
+    assert transcription.get_transcription_cache_key(first) == transcription.get_transcription_cache_key(same)
+    assert transcription.get_transcription_cache_key(first) != transcription.get_transcription_cache_key(other)
+
+def test_transcribe_video_without_audio_fails_without_wrapping(tmp_path, monkeypatch):
+    video = write_file(tmp_path / "screen.mp4", b"\x00\x00\x00\x18ftypmp42")
+
+    async def no_audio(file_path):
+        return False
+
+    async def no_scratch(input_path, blob_name):
+        return 0
+
+    monkeypatch.setattr(transcription, "has_audio_stream", no_audio)
+    monkeypatch.setattr(transcription, "estimate_scratch_bytes", no_scratch)
+    monkeypatch.setattr(transcription.crud, "get_checkpoints", lambda db, video_id, stage: {})
+
+    # ジョブワーカーが再試行しないよう、NoAudioErrorのまま呼び出し元に伝わる
+    with pytest.raises(transcription.NoAudioError, match="音声トラックがない"):
+        asyncio.run(transcription.transcribe_video(video, None, None, -1, -1, ProgressReporter(-1)))
+    transcription.scratch.manager.remove_work_dir(-1)
+
+def test_create_thumbnails_seeks_before_decoding(monkeypatch):
+    commands = []
+
+    async def fake_run_ffmpeg(command, error_message, duration=None, on_progress=None):
+        commands.append(command)
+        return ""
+
+    monkeypatch.setattr(transcription, "run_ffmpeg", fake_run_ffmpeg)
+    asyncio.run(transcription.create_thumbnails("input.mp4", 3600, "thumbnail.webp", "placeholder.webp"))
+
+    command = commands[0]
+    # 入力側でシークし（-iより前の-ss）、サムネイルの位置より前の映像はデコードしない
+    assert command.index('-ss') < command.index('-i')
+    assert float(command[command.index('-ss') + 1]) == transcription.THUMBNAIL_MAX_POSITION_SECONDS
+    # 各出力は1フレームで終わる
+    assert command.count('-frames:v') == 2
+
+def test_transcription_cache_is_evicted_once_per_job(tmp_path, monkeypatch):
+    evictions = []
+    segments = [write_file(tmp_path / f"segment_{i:03d}.ogg", b"OggS%d" % i) for i in range(3)]
+
+    async def no_scratch(input_path, blob_name):
+        return 0
+
+    async def fake_transcribe_file(file_path):
+        return "テキスト", []
+
+    async def fake_transcribe_segments(input_path, blob_name, db, video_id, work_dir, reporter, on_segment, source_hash):
+        results = [await transcription.transcribe_file_cached(segment) for segment in segments]
+        return " ".join(text for text, _ in results)
+
+    monkeypatch.setattr(transcription, "estimate_scratch_bytes", no_scratch)
+    monkeypatch.setattr(transcription, "transcribe_file", fake_transcribe_file)
+    monkeypatch.setattr(transcription, "_transcribe_segments", fake_transcribe_segments)
+    monkeypatch.setattr(transcription.crud, "get_transcription_cache", lambda db, cache_key: None)
+    monkeypatch.setattr(transcription.crud, "save_transcription_cache", lambda *args: None)
+    monkeypatch.setattr(transcription.crud, "evict_transcription_cache", lambda *args: evictions.append(args) or 0)
+
+    # セグメントごとではなく、文字起こしの完了後に1回だけ削除する
+    asyncio.run(transcription.transcribe_video(None, None, None, -2, -2, ProgressReporter(-2)))
+    transcription.scratch.manager.remove_work_dir(-2)
+
+    assert len(evictions) == 1
@@ -0,0 +1,99 @@
+import asyncio
+import uuid
+from fastapi import FastAPI, File, UploadFile
+from fastapi.testclient import TestClient
+from db_control import crud
+from db_control.connect import SessionLocal
+from utils.upload import UploadSizeLimitMiddleware
+
+def create_session(db) -> str:
+    async def _create():
+        minutes_id = await crud.create_minutes(db, user_id="user", filename="meeting.mp4")
+        upload_session = await crud.create_upload_session(
+            db,
+            upload_id=uuid.uuid4().hex,
+            minutes_id=minutes_id,
+            user_id="user",
+            filename="meeting.mp4",
+            total_size=1,
+            part_size=1,
+            total_parts=1
+        )
+        return upload_session.id
+    return asyncio.run(_create())
+
+def test_claim_upload_session_succeeds_once():
+    db = SessionLocal()
+    try:
+        upload_id = create_session(db)
+
+        # 同じセッションの完了が2回要求されても、処理するのは先に更新した1回だけ
+        assert crud.claim_upload_session(db, upload_id, "uploading", "completed")
+        assert not crud.claim_upload_session(db, upload_id, "uploading", "completed")
+        assert crud.get_upload_session(db, upload_id).status == "completed"
+    finally:
+        db.close()
+
+def test_claim_upload_session_after_revert():
+    db = SessionLocal()
+    try:
+        upload_id = create_session(db)
+        assert crud.claim_upload_session(db, upload_id, "uploading", "completed")
+
+        # 完了処理に失敗してステータスを戻した場合は、再度完了できる
+        asyncio.run(crud.update_upload_session_status(db, upload_id, "uploading"))
+        assert crud.claim_upload_session(db, upload_id, "uploading", "completed")
+    finally:
+        db.close()
+
+def test_claim_video_upload_succeeds_once():
+    db = SessionLocal()
+    try:
+        async def _create():
+            minutes_id = await crud.create_minutes(db, user_id="user", filename="meeting.mp4")
+            await crud.create_video(db, minutes_id, None, status="uploading")
+            return minutes_id
+        minutes_id = asyncio.run(_create())
+
+        # 直接アップロードの完了が2回要求されても、ジョブを登録するのは先に更新した1回だけ
+        assert crud.claim_video_upload(db, minutes_id, "video.mp4")
+        assert not crud.claim_video_upload(db, minutes_id, "video.mp4")
+        video = crud.get_video(db, minutes_id)
+        assert video.status == "queued"
+        assert video.video_url == "video.mp4"
+    finally:
+        db.close()
+
+def create_limited_client() -> TestClient:
+    app = FastAPI()
+    app.add_middleware(UploadSizeLimitMiddleware, paths=["/upload"], max_bytes=1024)
+
+    @app.post("/upload")
+    async def upload(file: UploadFile = File(...)):
+        return {"size": len(await file.read())}
+
+    @app.post("/other")
+    async def other(file: UploadFile = File(...)):
+        return {"size": len(await file.read())}
+
+    return TestClient(app)
+
+def test_upload_size_limit_rejects_by_content_length():
+    client = create_limited_client()
+
+    assert client.post("/upload", files={"file": ("a.mp4", b"x" * 100)}).json() == {"size": 100}
+    # Content-Lengthが上限を超える場合は本文を読む前に拒否する（対象外のパスは制限しない）
+    assert client.post("/upload", files={"file": ("a.mp4", b"x" * 2048)}).status_code == 413
+    assert client.post("/other", files={"file": ("a.mp4", b"x" * 2048)}).json() == {"size": 2048}
+
+def test_upload_size_limit_rejects_streamed_body():
+    client = create_limited_client()
+    body = b"--b\r\nContent-Disposition: form-data; name=\"file\"; filename=\"a.mp4\"\r\n\r\n" + b"x" * 2048 + b"\r\n--b--\r\n"
+
+    def chunks():
+        for i in range(0, len(body), 256):
+            yield body[i:i + 256]
+
+    # Content-Lengthがない（chunked）場合も、受信したバイト数が上限を超えた時点で拒否する
+    response = client.post("/upload", content=chunks(), headers={"Content-Type": "multipart/form-data; boundary=b"})
+    assert response.status_code == 413
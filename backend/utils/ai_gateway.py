@@ -0,0 +1,224 @@
+from openai import AsyncAzureOpenAI, RateLimitError, APIConnectionError, APITimeoutError, InternalServerError
+from dotenv import load_dotenv
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import random
+import time
+import httpx
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Azure OpenAIへのリクエストはすべてこのモジュールを経由させる
+# ・非同期クライアントを使い、応答待ちの間もイベントループを止めない（他のリクエストの処理を続けられる）
+# ・クライアントとHTTP接続（keep-alive）をプロセス全体で共有する
+# ・デプロイメントの種類ごとの制限時間を超えたリクエストは打ち切り、呼び出し元の中断（キャンセル）時は通信も中断する
+# ・デプロイメントごとに1分あたりのリクエスト数（RPM）・トークン数（TPM）をトークンバケットで制限する
+# ・制限に達した場合は優先度の高いリクエスト（チャット）から先に送る
+# ・429や一時的なエラーはジッター付きの指数バックオフで再試行する
+
+# 優先度（値が小さいほど先に送る）
+PRIORITY_INTERACTIVE = 0  # チャットなど、ユーザーが応答を待っているリクエスト
+PRIORITY_NORMAL = 1  # 要約など、ユーザー操作を起点とする時間のかかるリクエスト
+PRIORITY_BATCH = 2  # 文字起こし・ベクトル化などのバックグラウンド処理
+
+# 再試行の回数と待機時間（秒）
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "5"))
+OPENAI_RETRY_BASE_SECONDS = float(os.getenv("OPENAI_RETRY_BASE_SECONDS", "1"))
+OPENAI_RETRY_MAX_SECONDS = float(os.getenv("OPENAI_RETRY_MAX_SECONDS", "60"))
+# 共有するHTTP接続数の上限
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "20"))
+
+# デプロイメントの種類ごとの設定（RPM・TPMはデプロイメントのクォータに合わせて設定する。0は無制限）
+# timeoutは1回のリクエストの制限時間（秒）
+DEPLOYMENTS = {
+    "whisper": {
+        "deployment": os.getenv("AZURE_OPENAI_DEPLOYMENT_WHISPER"),
+        "api_version": os.getenv("AZURE_OPENAI_API_VERSION_WHISPER"),
+        "rpm": int(os.getenv("AZURE_OPENAI_RPM_WHISPER", "50")),
+        "tpm": 0,
+        "timeout": float(os.getenv("OPENAI_TIMEOUT_SECONDS_WHISPER", "600")),
+    },
+    "embed": {
+        "deployment": os.getenv("AZURE_OPENAI_DEPLOYMENT_EMBED"),
+        "api_version": os.getenv("AZURE_OPENAI_API_VERSION_EMBED"),
+        "rpm": int(os.getenv("AZURE_OPENAI_RPM_EMBED", "720")),
+        "tpm": int(os.getenv("AZURE_OPENAI_TPM_EMBED", "120000")),
+        "timeout": float(os.getenv("OPENAI_TIMEOUT_SECONDS_EMBED", "30")),
+    },
+    "chat": {
+        "deployment": os.getenv("AZURE_OPENAI_DEPLOYMENT_CHAT", "gpt-4.1"),
+        "api_version": os.getenv("AZURE_OPENAI_API_VERSION_CHAT", "2025-01-01-preview"),
+        "rpm": int(os.getenv("AZURE_OPENAI_RPM_CHAT", "300")),
+        "tpm": int(os.getenv("AZURE_OPENAI_TPM_CHAT", "50000")),
+        "timeout": float(os.getenv("OPENAI_TIMEOUT_SECONDS_CHAT", "120")),
+    },
+}
+
+# すべてのクライアントで共有するHTTP接続プール
+_http_client = httpx.AsyncClient(
+    limits=httpx.Limits(
+        max_connections=OPENAI_MAX_CONNECTIONS,
+        max_keepalive_connections=OPENAI_MAX_CONNECTIONS,
+        keepalive_expiry=60
+    ),
+    timeout=httpx.Timeout(600, connect=10)
+)
+_clients: Dict[str, AsyncAzureOpenAI] = {}
+_limiters: Dict[str, "RateLimiter"] = {}
+
+class TokenBucket:
+    """
+    1分あたりの上限を、時間の経過に応じて少しずつ補充されるトークンとして管理する
+    """
+
+    def __init__(self, per_minute: int):
+        self.capacity = per_minute
+        self.tokens = float(per_minute)
+        self.rate = per_minute / 60
+        self.updated_at = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, amount: int) -> float:
+        """amountだけ消費できるようになるまでの秒数を返す"""
+        self._refill()
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self.tokens) / self.rate)
+
+    def consume(self, amount: int) -> None:
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+class RateLimiter:
+    """
+    デプロイメントごとのRPM・TPMの制限
+
+    制限に達している間は待機中のリクエストを優先度順（同じ優先度の場合は到着順）に並べ、
+    先頭のリクエストだけが枠の補充を待つ。後から優先度の高いリクエストが来た場合はそちらが先頭になる
+    """
+
+    def __init__(self, rpm: int, tpm: int):
+        self.requests = TokenBucket(rpm) if rpm > 0 else None
+        self.tokens = TokenBucket(tpm) if tpm > 0 else None
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._changed = asyncio.Event()
+
+    def _wait_time(self, tokens: int) -> float:
+        wait = 0.0
+        if self.requests:
+            wait = max(wait, self.requests.wait_time(1))
+        if self.tokens and tokens:
+            wait = max(wait, self.tokens.wait_time(tokens))
+        return wait
+
+    async def acquire(self, tokens: int, priority: int) -> None:
+        entry = (priority, next(self._sequence))
+        heapq.heappush(self._waiters, entry)
+        try:
+            while True:
+                if self._waiters[0] == entry:
+                    wait = self._wait_time(tokens)
+                    if wait <= 0:
+                        if self.requests:
+                            self.requests.consume(1)
+                        if self.tokens and tokens:
+                            self.tokens.consume(tokens)
+                        return
+                    # 待機中に優先度の高いリクエストが来た場合に備え、短い間隔で確認し直す
+                    await asyncio.sleep(min(wait, 0.5))
+                else:
+                    await self._changed.wait()
+        finally:
+            self._waiters.remove(entry)
+            heapq.heapify(self._waiters)
+            # 待機中のリクエストに先頭が変わったことを通知する
+            self._changed.set()
+            self._changed = asyncio.Event()
+
+def get_client(kind: str) -> AsyncAzureOpenAI:
+    """
+    デプロイメントの種類に対応するクライアントを返す（HTTP接続プールは全種類で共有する）
+
+    再試行はこのモジュールで行うため、クライアント自体の再試行は無効にする
+    """
+    if kind not in _clients:
+        _clients[kind] = AsyncAzureOpenAI(
+            api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+            api_version=DEPLOYMENTS[kind]["api_version"],
+            azure_endpoint=os.getenv("AZURE_OPENAI_BASE_URL"),
+            http_client=_http_client,
+            max_retries=0
+        )
+    return _clients[kind]
+
+def get_deployment(kind: str) -> Optional[str]:
+    """デプロイメントの種類に対応するデプロイメント名を返す"""
+    return DEPLOYMENTS[kind]["deployment"]
+
+def _get_limiter(kind: str) -> "RateLimiter":
+    # 同じデプロイメントを複数の種類で使う場合も、制限は共有する
+    config = DEPLOYMENTS[kind]
+    key = config["deployment"] or kind
+    if key not in _limiters:
+        _limiters[key] = RateLimiter(config["rpm"], config["tpm"])
+    return _limiters[key]
+
+def estimate_tokens(text: str) -> int:
+    """
+    TPMの制限に使うトークン数の見積もり
+
+    日本語はおおむね1文字1トークン以下になるため、文字数を上限として使う
+    """
+    return len(text)
+
+def _retry_delay(error: Exception, attempt: int) -> float:
+    # 429でRetry-Afterが返された場合はそれに従う
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), OPENAI_RETRY_MAX_SECONDS)
+        except ValueError:
+            pass
+    # フルジッター：0から指数的に伸ばした上限までの間でランダムに待つ
+    return random.uniform(0, min(OPENAI_RETRY_MAX_SECONDS, OPENAI_RETRY_BASE_SECONDS * (2 ** attempt)))
+
+async def call(kind: str, request: Callable[[AsyncAzureOpenAI], Awaitable[T]], priority: int = PRIORITY_BATCH, tokens: int = 0) -> T:
+    """
+    Azure OpenAIへのリクエストを、レート制限と再試行付きで実行する
+
+    Args:
+        kind (str): デプロイメントの種類（"whisper" / "embed" / "chat"）
+        request (Callable[[AsyncAzureOpenAI], Awaitable[T]]): クライアントを受け取ってリクエストを送るコルーチン関数
+        priority (int): 優先度（PRIORITY_INTERACTIVE / PRIORITY_NORMAL / PRIORITY_BATCH）
+        tokens (int): TPMの制限に使うトークン数の見積もり（入力と出力の上限の合計）
+
+    Returns:
+        T: requestの戻り値
+    """
+    client = get_client(kind)
+    limiter = _get_limiter(kind)
+    timeout = DEPLOYMENTS[kind]["timeout"]
+    for attempt in range(OPENAI_MAX_RETRIES + 1):
+        await limiter.acquire(tokens, priority)
+        try:
+            # 制限時間を超えた場合やキャンセルされた場合は、送信中のリクエストも中断される
+            return await asyncio.wait_for(request(client), timeout)
+        except (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError, asyncio.TimeoutError) as e:
+            if attempt >= OPENAI_MAX_RETRIES:
+                raise
+            delay = _retry_delay(e, attempt)
+            logger.warning(f"Azure OpenAIへのリクエストを{delay:.1f}秒後に再試行します（{kind}）: {str(e) or type(e).__name__}")
+            await asyncio.sleep(delay)
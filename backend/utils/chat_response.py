@@ -1,19 +1,14 @@
-from openai import AzureOpenAI
-import os
 from dotenv import load_dotenv
 import logging
 from typing import List, Tuple
+from utils import ai_gateway
 
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
-# Azure OpenAIの設定
-client = AzureOpenAI(
-    api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-    api_version=os.getenv("AZURE_OPENAI_API_VERSION_CHAT", "2025-01-01-preview"),
-    azure_endpoint=os.getenv("AZURE_OPENAI_BASE_URL")
-)
+# 応答の最大トークン数
+MAX_RESPONSE_TOKENS = 800
 
 async def generate_chat_response(user_question: str, related_chunks: List[Tuple]) -> str:
     """
@@ -54,15 +49,20 @@ async def generate_chat_response(user_question: str, related_chunks: List[Tuple]
 
 上記の参考情報に基づいて、質問に答えてください。"""
         
-        # Azure OpenAIのチャットモデルに送信
-        response = client.chat.completions.create(
-            model=os.getenv("AZURE_OPENAI_DEPLOYMENT_CHAT"),
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            temperature=0.3,  # 一貫性のある応答のため低めに設定
-            max_tokens=800    # 応答の長さを制限
+        # Azure OpenAIのチャットモデルに送信（ユーザーが待っているため、バッチ処理より優先する）
+        response = await ai_gateway.call(
+            "chat",
+            lambda client: client.chat.completions.create(
+                model=ai_gateway.get_deployment("chat"),
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt}
+                ],
+                temperature=0.3,  # 一貫性のある応答のため低めに設定
+                max_tokens=MAX_RESPONSE_TOKENS    # 応答の長さを制限
+            ),
+            priority=ai_gateway.PRIORITY_INTERACTIVE,
+            tokens=ai_gateway.estimate_tokens(system_prompt + user_prompt) + MAX_RESPONSE_TOKENS
         )
         
         generated_response = response.choices[0].message.content
@@ -1,3 +1,16 @@
+from typing import List, Tuple
+
+def _find_chunk_end(text: str, start: int, end: int, overlap: int) -> int:
+    """
+    チャンクの終了位置を、startからendまでの範囲にある最後の句点の直後に合わせる
+
+    句点で区切ると次のチャンクの開始位置（終了位置 - オーバーラップ）が進まない場合は、endのまま区切る
+    """
+    last_period = text.rfind('。', start, end)
+    if last_period != -1 and last_period + 1 - overlap > start:
+        return last_period + 1
+    return end
+
 def split_into_chunks(text: str, chunk_size: int = 400, overlap: int = 50) -> list:
     """
     テキストを指定されたサイズのチャンクに分割する
@@ -27,9 +40,7 @@ def split_into_chunks(text: str, chunk_size: int = 400, overlap: int = 50) -> li
             break
         
         # 文の区切りで分割するために、最後の句点を探す
-        last_period = text.rfind('。', start, end)
-        if last_period != -1:
-            end = last_period + 1
+        end = _find_chunk_end(text, start, end, overlap)
         
         # チャンクを追加
         chunks.append(text[start:end])
@@ -38,3 +49,53 @@ def split_into_chunks(text: str, chunk_size: int = 400, overlap: int = 50) -> li
         start = end - overlap
     
     return chunks
+
+class ChunkStream:
+    """
+    先頭から少しずつ届くテキストを、確定したチャンクから順に返す
+
+    チャンクの区切りは後続のテキストに影響されないため、届いた分だけで確定できる。
+    最後にfinishを呼ぶと、全体をsplit_into_chunksで分割した場合と同じチャンクが同じ順に得られる。
+    各チャンクには、テキスト全体の中での開始位置（文字数）を付けて返す
+    """
+
+    def __init__(self, chunk_size: int = 400, overlap: int = 50):
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        # まだチャンクとして確定していないテキスト（先頭が次のチャンクの開始位置）
+        self.buffer = ""
+        # bufferの先頭の、テキスト全体の中での位置
+        self.offset = 0
+        self.next_index = 0
+
+    def feed(self, text: str) -> List[Tuple[int, int, str]]:
+        """
+        テキストを追加し、新たに確定したチャンクを返す
+
+        Returns:
+            List[Tuple[int, int, str]]: (チャンク番号, 開始位置, チャンクの内容) のリスト
+        """
+        self.buffer += text
+        return self._drain(final=False)
+
+    def finish(self) -> List[Tuple[int, int, str]]:
+        """テキストの終わりを通知し、残りのチャンクを返す"""
+        return self._drain(final=True)
+
+    def _drain(self, final: bool) -> List[Tuple[int, int, str]]:
+        chunks = []
+        while self.buffer:
+            # 残りがチャンクのサイズに収まる場合は、後続のテキストが届くまで確定しない
+            if self.chunk_size >= len(self.buffer):
+                if final:
+                    chunks.append((self.next_index, self.offset, self.buffer))
+                    self.next_index += 1
+                    self.offset += len(self.buffer)
+                    self.buffer = ""
+                break
+            end = _find_chunk_end(self.buffer, 0, self.chunk_size, self.overlap)
+            chunks.append((self.next_index, self.offset, self.buffer[:end]))
+            self.next_index += 1
+            self.offset += end - self.overlap
+            self.buffer = self.buffer[end - self.overlap:]
+        return chunks
@@ -0,0 +1,22 @@
+import asyncio
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# 処理ステージごとの同時実行数の上限
+# ジョブは各ステージの実行中だけ枠を確保するため、ある動画のエンコード中に
+# 別の動画の文字起こしやベクトル化を並行して進められる
+
+# ffmpeg（CPUバウンド）：CPUコア数まで
+FFMPEG_CONCURRENCY = int(os.getenv("FFMPEG_CONCURRENCY", str(os.cpu_count() or 1)))
+# Whisper API（I/Oバウンド）：デプロイメントのクォータに合わせて設定
+WHISPER_CONCURRENCY = int(os.getenv("WHISPER_CONCURRENCY", "3"))
+# 1つの動画で同時に文字起こしするセグメント数（全体の上限はWHISPER_CONCURRENCY）
+SEGMENT_CONCURRENCY = int(os.getenv("SEGMENT_CONCURRENCY", str(WHISPER_CONCURRENCY)))
+# Embedding API（I/Oバウンド）：デプロイメントのクォータに合わせて設定
+EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", "4"))
+
+ffmpeg_pool = asyncio.Semaphore(FFMPEG_CONCURRENCY)
+whisper_pool = asyncio.Semaphore(WHISPER_CONCURRENCY)
+embedding_pool = asyncio.Semaphore(EMBEDDING_CONCURRENCY)
@@ -1,36 +1,96 @@
-from openai import AzureOpenAI
-import os
 from dotenv import load_dotenv
-import json
+from typing import Any, List, Optional, Tuple
+import os
+import numpy as np
+from utils import ai_gateway
 
 load_dotenv()
 
-client = AzureOpenAI(
-    api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-    api_version=os.getenv("AZURE_OPENAI_API_VERSION_EMBED"),
-    azure_endpoint=os.getenv("AZURE_OPENAI_BASE_URL")
-)
+# 1回のリクエストでベクトル化するテキストの上限（件数と、トークン数の見積もりの合計）
+# 件数の上限はデプロイメントのモデル・APIバージョンに合わせて設定する
+EMBEDDING_BATCH_MAX_INPUTS = int(os.getenv("EMBEDDING_BATCH_MAX_INPUTS", "16"))
+EMBEDDING_BATCH_MAX_TOKENS = int(os.getenv("EMBEDDING_BATCH_MAX_TOKENS", "16000"))
 
-async def generate_embedding(text: str) -> str:
+async def generate_embedding(text: str, priority: int = ai_gateway.PRIORITY_BATCH) -> np.ndarray:
     """
     Azure OpenAIのtext-embedding-ada-002モデルを使用してテキストをベクトル化する
-    
+
     Args:
         text (str): ベクトル化するテキスト
-        
+        priority (int): リクエストの優先度（チャットの質問はPRIORITY_INTERACTIVE）
+
+    Returns:
+        np.ndarray: ベクトル（float32）
+    """
+    return (await generate_embeddings([text], priority))[0]
+
+async def generate_embeddings(texts: List[str], priority: int = ai_gateway.PRIORITY_BATCH) -> List[np.ndarray]:
+    """
+    複数のテキストを1回のリクエストでベクトル化する
+
+    Args:
+        texts (List[str]): ベクトル化するテキストのリスト（件数・トークン数はEMBEDDING_BATCH_MAX_*以内）
+        priority (int): リクエストの優先度
+
     Returns:
-        str: ベクトルデータ（JSON文字列）
+        List[np.ndarray]: textsと同じ順のベクトル（float32）のリスト
     """
     try:
-        # テキストをベクトル化
-        response = client.embeddings.create(
-            input=text,
-            model=os.getenv("AZURE_OPENAI_DEPLOYMENT_EMBED")
+        # テキストをまとめてベクトル化（共通のゲートウェイ経由でレート制限・再試行を行う）
+        response = await ai_gateway.call(
+            "embed",
+            lambda client: client.embeddings.create(
+                input=texts,
+                model=ai_gateway.get_deployment("embed")
+            ),
+            priority=priority,
+            tokens=sum(ai_gateway.estimate_tokens(text) for text in texts)
         )
-        
-        # ベクトルデータをJSON文字列に変換
-        embedding_vector = response.data[0].embedding
-        return json.dumps(embedding_vector)
-        
+
+        # 結果は入力の順序どおりとは限らないため、indexで並べ直す
+        vectors = sorted(response.data, key=lambda item: item.index)
+        if len(vectors) != len(texts):
+            raise Exception(f"ベクトルの件数が一致しません: {len(vectors)}/{len(texts)}")
+
+        return [np.asarray(item.embedding, dtype=np.float32) for item in vectors]
+
     except Exception as e:
         raise Exception(f"ベクトル化処理中にエラーが発生しました: {str(e)}")
+
+class EmbeddingBatcher:
+    """
+    ベクトル化するテキストを、1回のリクエストの上限（件数・トークン数）に収まるバッチにまとめる
+
+    addで追加したテキストは、次を追加すると上限を超える時点でバッチとして返す。
+    残りはflushで取り出す。各テキストにはキー（チャンクIDなど）を付け、結果の対応付けに使う
+    """
+
+    def __init__(self, max_inputs: int = EMBEDDING_BATCH_MAX_INPUTS, max_tokens: int = EMBEDDING_BATCH_MAX_TOKENS):
+        self.max_inputs = max_inputs
+        self.max_tokens = max_tokens
+        self.items: List[Tuple[Any, str]] = []
+        self.tokens = 0
+
+    def add(self, key: Any, text: str) -> Optional[List[Tuple[Any, str]]]:
+        """
+        テキストを追加する
+
+        Returns:
+            Optional[List[Tuple[Any, str]]]: 上限に達したために確定したバッチ（(キー, テキスト) のリスト）。なければNone
+        """
+        tokens = ai_gateway.estimate_tokens(text)
+        batch = None
+        if self.items and (len(self.items) >= self.max_inputs or self.tokens + tokens > self.max_tokens):
+            batch = self.flush()
+        self.items.append((key, text))
+        self.tokens += tokens
+        return batch
+
+    def flush(self) -> Optional[List[Tuple[Any, str]]]:
+        """追加済みのテキストをバッチとして取り出す（なければNone）"""
+        if not self.items:
+            return None
+        batch = self.items
+        self.items = []
+        self.tokens = 0
+        return batch
@@ -0,0 +1,160 @@
+from collections import OrderedDict
+from db_control import crud
+from db_control.connect import SessionLocal
+from db_control.vector_codec import decode_vector
+from dotenv import load_dotenv
+from typing import Dict, List, Optional
+from utils import ai_gateway, embedding
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import unicodedata
+import numpy as np
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# 同じテキスト（再処理・重複した動画のチャンク、定型の挨拶、繰り返されるチャットの質問）のベクトル化結果を再利用する
+# ・プロセス内のLRU（最近使ったものから一定件数）を先に参照し、なければデータベースのキャッシュを参照する
+# ・キーは正規化したテキストのSHA-256とデプロイメント（モデルが変わった場合は別のキーになる）
+
+# プロセス内に保持する件数（1536次元のfloat32で1件あたり約6KB）
+EMBEDDING_CACHE_MEMORY_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MEMORY_ENTRIES", "2000"))
+# データベースのキャッシュを最後に利用されてから保持する日数と、保持する最大件数
+EMBEDDING_CACHE_TTL_DAYS = int(os.getenv("EMBEDDING_CACHE_TTL_DAYS", "90"))
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+# 期限切れ・上限超過のキャッシュの削除は、この件数を登録するごとにバックグラウンドで行う（登録のたびには行わない）
+EMBEDDING_CACHE_EVICT_EVERY = int(os.getenv("EMBEDDING_CACHE_EVICT_EVERY", "1000"))
+# キャッシュの最終利用日時は、前回の更新からこの秒数以上経過した場合のみ更新する
+EMBEDDING_CACHE_TOUCH_INTERVAL_SECONDS = int(os.getenv("EMBEDDING_CACHE_TOUCH_INTERVAL_SECONDS", str(24 * 60 * 60)))
+
+_memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+_stats = {"memory_hits": 0, "db_hits": 0, "misses": 0}
+# 前回の削除以降に登録した件数と、実行中の削除のタスク
+_inserted_since_eviction = 0
+_eviction_task: Optional[asyncio.Task] = None
+
+def normalize_text(text: str) -> str:
+    """キャッシュキー用にテキストを正規化する（全角・半角の統一、前後の空白の除去、連続する空白の圧縮）"""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text)).strip()
+
+def get_cache_key(text: str, deployment: str) -> str:
+    """正規化したテキストとデプロイメントからキャッシュキーを求める"""
+    text_hash = hashlib.sha256(normalize_text(text).encode()).hexdigest()
+    return hashlib.sha256(f"{text_hash}:{deployment}".encode()).hexdigest()
+
+def _remember(cache_key: str, vector: np.ndarray) -> None:
+    _memory[cache_key] = vector
+    _memory.move_to_end(cache_key)
+    while len(_memory) > EMBEDDING_CACHE_MEMORY_ENTRIES:
+        _memory.popitem(last=False)
+
+def _evict() -> None:
+    db = SessionLocal()
+    try:
+        deleted = crud.evict_embedding_cache(db, EMBEDDING_CACHE_TTL_DAYS, EMBEDDING_CACHE_MAX_ENTRIES)
+        if deleted:
+            logger.info(f"ベクトル化キャッシュを削除しました: {deleted}件")
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"ベクトル化キャッシュの削除に失敗: {str(e)}")
+    finally:
+        db.close()
+
+def _schedule_eviction(inserted: int) -> None:
+    """
+    登録した件数を数え、EMBEDDING_CACHE_EVICT_EVERY件に達したらキャッシュの削除をバックグラウンドで始める
+    
+    削除はテーブル全体の件数を数えるため、チャットの質問などの応答を待たせないよう呼び出し元では待たない
+    """
+    global _inserted_since_eviction, _eviction_task
+    _inserted_since_eviction += inserted
+    if _inserted_since_eviction < EMBEDDING_CACHE_EVICT_EVERY or (_eviction_task and not _eviction_task.done()):
+        return
+    _inserted_since_eviction = 0
+    _eviction_task = asyncio.create_task(asyncio.to_thread(_evict))
+
+def get_stats() -> Dict[str, float]:
+    """
+    キャッシュのヒット数・ミス数を返す（このプロセスで起動してからの累計）
+
+    Returns:
+        Dict[str, float]: memory_hits / db_hits / misses / hit_rate / memory_entries
+    """
+    total = sum(_stats.values())
+    return {
+        **_stats,
+        "hit_rate": (_stats["memory_hits"] + _stats["db_hits"]) / total if total else 0.0,
+        "memory_entries": len(_memory),
+    }
+
+async def generate_embeddings_cached(texts: List[str], priority: int = ai_gateway.PRIORITY_BATCH) -> List[np.ndarray]:
+    """
+    キャッシュを使って複数のテキストをベクトル化する
+
+    キャッシュにないテキストだけを1回のリクエストでベクトル化し、結果をキャッシュに登録する。
+    データベースのキャッシュの読み書きに失敗した場合は、キャッシュを使わずにベクトル化を続ける
+
+    Args:
+        texts (List[str]): ベクトル化するテキストのリスト
+        priority (int): リクエストの優先度
+
+    Returns:
+        List[np.ndarray]: textsと同じ順のベクトルのリスト
+    """
+    deployment = ai_gateway.get_deployment("embed") or ""
+    keys = [get_cache_key(text, deployment) for text in texts]
+    vectors: Dict[str, np.ndarray] = {}
+
+    for key in keys:
+        if key in vectors:
+            continue
+        vector = _memory.get(key)
+        if vector is not None:
+            _memory.move_to_end(key)
+            vectors[key] = vector
+            _stats["memory_hits"] += 1
+
+    pending = [key for key in dict.fromkeys(keys) if key not in vectors]
+    if pending:
+        db = SessionLocal()
+        try:
+            for key, data in crud.get_embedding_caches(db, pending, EMBEDDING_CACHE_TOUCH_INTERVAL_SECONDS).items():
+                vectors[key] = decode_vector(data)
+                _remember(key, vectors[key])
+                _stats["db_hits"] += 1
+        except Exception as e:
+            logger.warning(f"ベクトル化キャッシュの取得に失敗: {str(e)}")
+        finally:
+            db.close()
+
+    # 同じテキストが複数含まれる場合も、ベクトル化は1回にする
+    missing: Dict[str, str] = {}
+    for key, text in zip(keys, texts):
+        if key not in vectors and key not in missing:
+            missing[key] = text
+    if missing:
+        _stats["misses"] += len(missing)
+        generated = dict(zip(missing, await embedding.generate_embeddings(list(missing.values()), priority)))
+        for key, vector in generated.items():
+            vectors[key] = vector
+            _remember(key, vector)
+
+        db = SessionLocal()
+        try:
+            crud.save_embedding_caches(db, deployment, generated)
+            _schedule_eviction(len(generated))
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"ベクトル化キャッシュの登録に失敗: {str(e)}")
+        finally:
+            db.close()
+
+    return [vectors[key] for key in keys]
+
+async def generate_embedding_cached(text: str, priority: int = ai_gateway.PRIORITY_BATCH) -> np.ndarray:
+    """キャッシュを使ってテキストをベクトル化する（チャットの質問など1件の場合）"""
+    return (await generate_embeddings_cached([text], priority))[0]
@@ -0,0 +1,254 @@
+from sqlalchemy.orm import Session
+from db_control import crud
+from db_control.connect import SessionLocal
+from utils import transcription, storage, chunk, embedding, embedding_cache, concurrency, scratch, similarity
+from utils.progress import ProgressReporter
+from typing import List, Optional, Tuple
+import logging
+import asyncio
+import os
+
+logger = logging.getLogger(__name__)
+
+async def process_video(file_path: Optional[str], minutes_id: int, db: Session):
+    """
+    動画の処理を行う関数
+    
+    file_pathがNoneの場合は、動画がブラウザから直接Blobにアップロード済みとして扱う。
+    file_pathがある場合は、Blobへのアップロードと並行してローカルのファイルから文字起こしを行う。
+    ジョブワーカーから、ジョブ専用のデータベースセッションで呼び出される。
+    
+    文字起こしはセグメントが揃うたびに保存し（処理中でも途中までの内容を参照できる）、
+    確定したチャンクから順に、文字起こしの完了を待たずにベクトル化する（チャンクはバッチにまとめ、バッチ単位で並行して送る）。
+    
+    各ステージの完了はチェックポイントやテーブルに記録されるため、再試行や別ワーカーでの再開時は
+    完了済みのステージ（アップロード、圧縮、セグメントごとの文字起こし、チャンクごとのベクトル化）を省略する。
+    """
+    upload_task = None
+    embedding_tasks = []
+    # チャンクは上限までまとめて1回のリクエストでベクトル化する
+    embedding_batcher = embedding.EmbeddingBatcher()
+    # 進捗はまとめて書き込む（ffmpegの進捗やチャンクごとの報告で毎回UPDATEしない）
+    reporter = ProgressReporter(minutes_id)
+    try:
+        # 処理開始を通知
+        await crud.update_video_status(db, minutes_id, "processing", 0)
+        
+        video = crud.get_video(db, minutes_id)
+        if not video:
+            raise Exception("動画データが見つかりません")
+        
+        # 前回の実行で文字起こしまで完了していれば再利用する
+        transcript = crud.get_transcript_by_video_id(db, video.id)
+        
+        # 直接アップロードされた動画は内容のハッシュが未計算のため、Blobを読み込んで求める
+        # （重複の判定と文字起こしキャッシュのキーに使う。失敗した場合はどちらも使わずに処理を続ける）
+        if not video.content_hash and not transcript and video.video_url:
+            try:
+                blob_etag = crud.get_checkpoints(db, video.id, "blob_etag").get(0)
+                content_hash = await storage.get_blob_sha256(video.video_url, storage.container_name_video, etag=blob_etag)
+                await crud.update_video_content_hash(db, minutes_id, content_hash)
+            except Exception as e:
+                logger.warning(f"動画のハッシュを計算できませんでした: {str(e)}")
+                db.rollback()
+        
+        # 同じ内容の動画が処理済みであれば、その結果を複製して終了
+        if video.content_hash and not transcript:
+            source_video = crud.get_completed_video_by_content_hash(db, video.content_hash, video.id)
+            if source_video:
+                logger.info(f"同一の動画が処理済みのため結果を複製します: source_video_id={source_video.id}, video_id={video.id}")
+                await crud.clone_processed_video(db, source_video, video)
+                await crud.update_video_status(db, minutes_id, "completed", 100)
+                return
+        
+        # 1. 動画をAzure Blob Storageにアップロード
+        # アーカイブ用のアップロードはバックグラウンドで進め、その間にローカルのファイルから圧縮・文字起こしを行う
+        uploaded = crud.get_checkpoints(db, video.id, "uploaded")
+        has_local_file = bool(file_path) and os.path.exists(file_path)
+        if has_local_file and not uploaded:
+            upload_task = asyncio.create_task(upload_to_blob(file_path, minutes_id, video.id))
+        elif not video.video_url:
+            raise Exception("アップロード済みの動画が見つかりません")
+        
+        reporter.report(20)
+        
+        # チャンクの保存とベクトル化（保存済みのチャンク・ベクトル化済みのチャンクはスキップ）
+        # 文字起こしの途中でも、確定したチャンクから順にベクトル化を始める
+        chunk_states = {}
+        chunk_count = 0
+        
+        def dispatch_embeddings(batch):
+            if batch:
+                embedding_tasks.append(asyncio.create_task(embed_chunks(transcript_id, batch)))
+        
+        async def add_chunk(chunk_index: int, char_start: int, chunk_content: str):
+            nonlocal chunk_count
+            chunk_count += 1
+            chunk_id, is_embedded = chunk_states.get(chunk_index, (None, False))
+            if is_embedded:
+                return
+            if not chunk_id:
+                chunk_id = await crud.create_transcript_chunk(db, transcript_id, chunk_index, chunk_content, char_start)
+            if not chunk_id:
+                raise Exception("チャンクの保存に失敗しました")
+            dispatch_embeddings(embedding_batcher.add(chunk_id, chunk_content))
+        
+        if transcript and transcript.is_complete:
+            logger.info(f"保存済みの文字起こしを再利用します: transcript_id={transcript.id}")
+            transcript_id = transcript.id
+            chunk_states = crud.get_transcript_chunk_states(db, transcript_id)
+            chunk_stream = chunk.ChunkStream()
+            for chunk_args in chunk_stream.feed(transcript.content) + chunk_stream.finish():
+                await add_chunk(*chunk_args)
+            dispatch_embeddings(embedding_batcher.flush())
+        else:
+            # 3. 文字起こしの実行
+            # 開始時に空の文字起こしを作り、セグメントが揃うたびに内容を伸ばしていく
+            if transcript:
+                transcript_id = transcript.id
+            else:
+                transcript_id = await crud.create_transcript(db, video.id, "", is_complete=False)
+            if not transcript_id:
+                raise Exception("文字起こしデータの保存に失敗しました")
+            chunk_states = crud.get_transcript_chunk_states(db, transcript_id)
+            # タイムスタンプは先頭のセグメントから登録し直す
+            crud.delete_transcript_segments(db, transcript_id)
+            next_seq = 0
+            
+            # 4. チャンク分割（確定したチャンクから順に保存・ベクトル化する）
+            chunk_stream = chunk.ChunkStream()
+            segment_texts = []
+            
+            async def on_segment(segment_index: int, text: str, timings: list):
+                nonlocal next_seq
+                segment_texts.append(text)
+                content = " ".join(segment_texts)
+                await crud.update_transcript_content(db, transcript_id, content)
+                # 文字起こし全体の中での、このセグメントの開始位置
+                char_offset = len(content) - len(text)
+                next_seq = crud.save_transcript_segments(
+                    db, transcript_id, next_seq, transcription.align_timings(text, char_offset, timings)
+                )
+                for chunk_args in chunk_stream.feed(text if segment_index == 0 else " " + text):
+                    await add_chunk(*chunk_args)
+                # 次のセグメントを待たずに、このセグメントで確定したチャンクをベクトル化する
+                dispatch_embeddings(embedding_batcher.flush())
+            
+            # 完了済みのセグメントはスキップされる
+            transcript_content = await transcription.transcribe_video(
+                file_path if has_local_file else None,
+                video.video_url,
+                db,
+                minutes_id,
+                video.id,
+                reporter,
+                on_segment=on_segment,
+                source_hash=video.content_hash
+            )
+            if not transcript_content:
+                raise Exception("文字起こしに失敗しました")
+            await crud.update_transcript_content(db, transcript_id, transcript_content, is_complete=True)
+            for chunk_args in chunk_stream.finish():
+                await add_chunk(*chunk_args)
+            dispatch_embeddings(embedding_batcher.flush())
+            
+            # 文字起こし完了
+            reporter.report(80)
+        
+        if not chunk_count:
+            raise Exception("チャンク分割に失敗しました")
+        reporter.report(90)
+        
+        # 5. 残りのベクトル化の完了を待つ（完了したバッチの割合で進捗を進める）
+        for done, embedding_task in enumerate(asyncio.as_completed(embedding_tasks), 1):
+            await embedding_task
+            reporter.report(90 + 9 * done / len(embedding_tasks))
+        
+        # 2. アップロードの完了を待つ（動画URLが揃ってから完了にする）
+        if upload_task:
+            await upload_task
+            db.refresh(video)
+        
+        # すべてのチャンクのEmbedding生成が完了したら、is_embeddedを更新
+        await crud.update_transcript_embedded(db, transcript_id)
+        
+        # 7. 処理完了の更新
+        reporter.close()
+        await crud.update_video_status(db, minutes_id, "completed", 100)
+        
+        # チェックポイントと中間ファイルは不要になるため削除
+        crud.delete_checkpoints(db, video.id)
+        scratch.manager.remove_work_dir(minutes_id)
+        
+    except Exception as e:
+        # エラー発生時の処理
+        # ステータスの更新（再試行またはfailed）と一時ファイルの削除はジョブワーカーが行う
+        error_message = f"動画処理中にエラーが発生しました: {str(e)}"
+        logger.error(error_message)
+        db.rollback()  # トランザクションをロールバック
+        reporter.flush()  # 最後に報告された進捗を残す
+        # 実行中のアップロードは完了させ、再試行時にアップロードし直さないようにする
+        if upload_task:
+            await asyncio.gather(upload_task, return_exceptions=True)
+        for task in embedding_tasks:
+            if not task.done():
+                task.cancel()
+        await asyncio.gather(*embedding_tasks, return_exceptions=True)
+        # 音声トラックがない場合は、ジョブワーカーが再試行しないよう種類を変えずに伝える
+        if isinstance(e, transcription.NoAudioError):
+            raise
+        raise Exception(error_message)
+    finally:
+        reporter.close()
+        if upload_task and not upload_task.done():
+            upload_task.cancel()
+        for task in embedding_tasks:
+            if not task.done():
+                task.cancel()
+
+async def embed_chunks(transcript_id: int, batch: List[Tuple[int, str]]) -> None:
+    """
+    チャンクのバッチを1回のリクエストでベクトル化して保存する（キャッシュにあるチャンクはリクエストしない）
+    
+    文字起こしと並行して実行するため、バッチごとに新しいデータベースセッションを使う
+    
+    Args:
+        transcript_id (int): 文字起こしID
+        batch (List[Tuple[int, str]]): (チャンクID, チャンクの内容) のリスト
+    """
+    chunk_db = SessionLocal()
+    try:
+        async with concurrency.embedding_pool:
+            embedding_vectors = await embedding_cache.generate_embeddings_cached([content for _, content in batch])
+        if not all(len(vector) for vector in embedding_vectors):
+            raise Exception("ベクトル化に失敗しました")
+        
+        await crud.create_vector_embeddings(
+            chunk_db, [(chunk_id, vector) for (chunk_id, _), vector in zip(batch, embedding_vectors)]
+        )
+        # 処理中の文字起こしへの質問で、追加したチャンクも検索されるようにする
+        similarity.invalidate_transcript_index(transcript_id)
+    finally:
+        chunk_db.close()
+
+async def upload_to_blob(file_path: str, minutes_id: int, video_id: int) -> str:
+    """
+    動画をAzure Blob Storageにアップロードし、動画URLとチェックポイントを記録する
+    
+    文字起こしと並行して実行するため、専用のデータベースセッションを使う
+    """
+    db = SessionLocal()
+    try:
+        with open(file_path, 'rb') as f:
+            video_url = await storage.upload_video(f, minutes_id)
+        if not video_url:
+            raise Exception("動画のアップロードに失敗しました")
+        
+        video = crud.get_video_by_id(db, video_id)
+        video.video_url = video_url
+        db.commit()
+        await crud.save_checkpoint(db, video_id, "uploaded", 0, video_url)
+        logger.info(f"動画のアップロードが完了しました: minutes_id={minutes_id}")
+        return video_url
+    finally:
+        db.close()
@@ -0,0 +1,83 @@
+from db_control import crud
+from db_control.connect import SessionLocal
+from dotenv import load_dotenv
+from typing import Callable, Optional
+import asyncio
+import logging
+import os
+import time
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# 進捗をデータベースに書き込む最短の間隔（秒）
+PROGRESS_WRITE_INTERVAL_SECONDS = float(os.getenv("PROGRESS_WRITE_INTERVAL_SECONDS", "2"))
+
+class ProgressReporter:
+    """
+    動画処理の進捗をまとめてデータベースに書き込む
+
+    reportは何度呼んでもよく、書き込みは1ジョブあたりPROGRESS_WRITE_INTERVAL_SECONDSに1回まで
+    （間隔内に報告された値は最後の値だけを、間隔が空いた時点で書き込む）。
+    1回の処理の中で進捗が戻らないよう、前回より小さい値は無視する。
+    書き込みは短いセッションで行うため、ジョブのデータベースセッションとは独立している
+    """
+
+    def __init__(self, minutes_id: int, interval: float = PROGRESS_WRITE_INTERVAL_SECONDS):
+        self.minutes_id = minutes_id
+        self.interval = interval
+        self.value: Optional[int] = None
+        self.written: Optional[int] = None
+        self.written_at = 0.0
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def report(self, progress: float) -> None:
+        """進捗（0-100）を報告する"""
+        progress = int(max(0, min(100, progress)))
+        if self.value is not None and progress <= self.value:
+            return
+        self.value = progress
+
+        wait = self.written_at + self.interval - time.monotonic()
+        if wait <= 0:
+            self._write()
+        elif not self._timer:
+            self._timer = asyncio.get_running_loop().call_later(wait, self._on_timer)
+
+    def stage(self, start: int, end: int) -> Callable[[float], None]:
+        """
+        ステージ内の進み具合（0.0-1.0）を、全体の進捗のstartからendまでの範囲に割り当てて報告する関数を返す
+        """
+        return lambda fraction: self.report(start + (end - start) * max(0.0, min(1.0, fraction)))
+
+    def flush(self) -> None:
+        """報告済みでまだ書き込んでいない進捗をすぐに書き込む"""
+        self._cancel_timer()
+        self._write()
+
+    def close(self) -> None:
+        """書き込みの予約を取り消す（ジョブの終了時に呼ぶ）"""
+        self._cancel_timer()
+
+    def _cancel_timer(self) -> None:
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+
+    def _on_timer(self) -> None:
+        self._timer = None
+        self._write()
+
+    def _write(self) -> None:
+        if self.value is None or self.value == self.written:
+            return
+        db = SessionLocal()
+        try:
+            crud.set_video_progress(db, self.minutes_id, self.value)
+        except Exception as e:
+            logger.error(f"進捗の書き込みに失敗: minutes_id={self.minutes_id}, error={str(e)}")
+        finally:
+            db.close()
+        self.written = self.value
+        self.written_at = time.monotonic()
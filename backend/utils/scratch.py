@@ -0,0 +1,142 @@
+from contextlib import asynccontextmanager
+from dotenv import load_dotenv
+from typing import AsyncIterator, Iterable, List, Optional
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# ジョブの中間ファイルを置くディレクトリ（再試行で再利用するため処理完了まで残す）
+SCRATCH_DIR = os.getenv("PIPELINE_WORK_DIR") or os.path.join(tempfile.gettempdir(), "ai_minutes_work")
+# 中間ファイルに使ってよい容量（バイト）。0の場合は起動時の空き容量の8割をSCRATCH_PROCESSESで割った値
+# 予約はプロセスごとに管理するため、この容量は1プロセスあたりの上限になる。
+# 同じディスクを複数のプロセス（ワーカーを複数起動する場合や、APIプロセス内のワーカーと併用する場合）で使う場合は、
+# SCRATCH_PROCESSESにプロセス数を設定するか、SCRATCH_BUDGET_BYTESにディスク全体の予算をプロセス数で割った値を設定する
+SCRATCH_BUDGET_BYTES = int(os.getenv("SCRATCH_BUDGET_BYTES", "0"))
+SCRATCH_PROCESSES = max(1, int(os.getenv("SCRATCH_PROCESSES", "1")))
+# 小さいジョブの中間ファイルを置くメモリ上のディレクトリ（例: /dev/shm/ai_minutes_work）。未指定の場合は使わない
+SCRATCH_TMPFS_DIR = os.getenv("SCRATCH_TMPFS_DIR") or None
+# メモリ上のディレクトリの容量も1プロセスあたりの上限
+SCRATCH_TMPFS_BUDGET_BYTES = int(os.getenv("SCRATCH_TMPFS_BUDGET_BYTES", str(1024 * 1024 * 1024)))  # 1GB
+# この容量以下と見積もられたジョブのみメモリ上のディレクトリを使う
+SCRATCH_TMPFS_MAX_JOB_BYTES = int(os.getenv("SCRATCH_TMPFS_MAX_JOB_BYTES", str(256 * 1024 * 1024)))  # 256MB
+
+WORK_DIR_PREFIX = "minutes_"
+
+class ScratchArea:
+    """中間ファイルを置くディレクトリと、そこで予約済みの容量"""
+
+    def __init__(self, root: str, budget: int):
+        self.root = root
+        self.budget = budget
+        self.reserved = 0
+
+    def fits(self, size: int) -> bool:
+        # 容量を超える大きなジョブも、他に予約がなければ実行する（待ち続けないようにする）
+        return self.reserved == 0 or self.reserved + size <= self.budget
+
+class ScratchManager:
+    """
+    ジョブの中間ファイル用の作業ディレクトリを管理する
+
+    重い処理（ダウンロード・エンコード・分割）を始める前に、見積もった容量を予約する。
+    容量が足りない間は、他のジョブの予約が解放されるまで待つ（同時に処理する長い動画でディスクが溢れないようにする）。
+    予約はこのプロセス内のジョブの間でのみ共有する（他のプロセスの予約は数えない。SCRATCH_BUDGET_BYTESを参照）。
+    小さいジョブはメモリ上のディレクトリ（tmpfs）を優先して使う
+    """
+
+    def __init__(self):
+        os.makedirs(SCRATCH_DIR, exist_ok=True)
+        budget = SCRATCH_BUDGET_BYTES or int(shutil.disk_usage(SCRATCH_DIR).free * 0.8 / SCRATCH_PROCESSES)
+        self.disk = ScratchArea(SCRATCH_DIR, budget)
+        self.tmpfs = None
+        if SCRATCH_TMPFS_DIR:
+            try:
+                os.makedirs(SCRATCH_TMPFS_DIR, exist_ok=True)
+                self.tmpfs = ScratchArea(SCRATCH_TMPFS_DIR, SCRATCH_TMPFS_BUDGET_BYTES)
+            except OSError as e:
+                logger.warning(f"メモリ上の作業ディレクトリを使用できません: {str(e)}")
+        self._condition = asyncio.Condition()
+
+    @property
+    def areas(self) -> List[ScratchArea]:
+        return [area for area in (self.tmpfs, self.disk) if area]
+
+    def _work_dir(self, area: ScratchArea, minutes_id: int) -> str:
+        return os.path.join(area.root, f"{WORK_DIR_PREFIX}{minutes_id}")
+
+    def _choose_area(self, minutes_id: int, size: int) -> Optional[ScratchArea]:
+        # 前回の実行の中間ファイルが残っていれば、再利用できるよう同じ場所を使う
+        for area in self.areas:
+            if os.path.isdir(self._work_dir(area, minutes_id)):
+                return area if area.fits(size) else None
+        if self.tmpfs and size <= SCRATCH_TMPFS_MAX_JOB_BYTES and self.tmpfs.fits(size):
+            return self.tmpfs
+        if self.disk.fits(size):
+            return self.disk
+        return None
+
+    @asynccontextmanager
+    async def reserve(self, minutes_id: int, size: int) -> AsyncIterator[str]:
+        """
+        容量を予約して作業ディレクトリを返す（withを抜けると予約を解放する。ディレクトリは残す）
+
+        Args:
+            minutes_id (int): 議事録ID
+            size (int): 見積もった容量（バイト）
+
+        Yields:
+            str: 作業ディレクトリのパス
+        """
+        async with self._condition:
+            area = self._choose_area(minutes_id, size)
+            if not area:
+                logger.info(f"作業領域の空きを待っています: minutes_id={minutes_id}, size={size}")
+            while not area:
+                await self._condition.wait()
+                area = self._choose_area(minutes_id, size)
+            area.reserved += size
+
+        work_dir = self._work_dir(area, minutes_id)
+        try:
+            os.makedirs(work_dir, exist_ok=True)
+            yield work_dir
+        finally:
+            async with self._condition:
+                area.reserved -= size
+                self._condition.notify_all()
+
+    def remove_work_dir(self, minutes_id: int) -> None:
+        """作業ディレクトリを中間ファイルごと削除する"""
+        for area in self.areas:
+            work_dir = self._work_dir(area, minutes_id)
+            if os.path.exists(work_dir):
+                shutil.rmtree(work_dir, ignore_errors=True)
+                logger.info(f"作業ディレクトリを削除: {work_dir}")
+
+    def sweep(self, active_minutes_ids: Iterable[int]) -> int:
+        """
+        処理中・処理待ちのジョブに属さない作業ディレクトリを削除する（起動時に呼ぶ）
+
+        Args:
+            active_minutes_ids (Iterable[int]): 処理中・処理待ちのジョブの議事録ID
+
+        Returns:
+            int: 削除したディレクトリ数
+        """
+        active_dirs = {f"{WORK_DIR_PREFIX}{minutes_id}" for minutes_id in active_minutes_ids}
+        removed = 0
+        for area in self.areas:
+            for name in os.listdir(area.root):
+                path = os.path.join(area.root, name)
+                if name.startswith(WORK_DIR_PREFIX) and name not in active_dirs and os.path.isdir(path):
+                    shutil.rmtree(path, ignore_errors=True)
+                    removed += 1
+        return removed
+
+manager = ScratchManager()
@@ -0,0 +1,94 @@
+import math
+import re
+from typing import List, Tuple
+
+# ffmpegのsilencedetectフィルタの出力から無音区間を読み取るための正規表現
+_SILENCE_START_PATTERN = re.compile(r"silence_start:\s*(-?[\d.]+)")
+_SILENCE_END_PATTERN = re.compile(r"silence_end:\s*(-?[\d.]+)")
+
+def parse_silences(ffmpeg_output: str, duration: float) -> List[Tuple[float, float]]:
+    """
+    silencedetectの出力（ffmpegの標準エラー出力）から無音区間の一覧を取り出す
+
+    Args:
+        ffmpeg_output (str): ffmpegの標準エラー出力
+        duration (float): ファイルの長さ（秒）。末尾で終わっていない無音区間の終点に使う
+
+    Returns:
+        List[Tuple[float, float]]: (開始秒, 終了秒) のリスト（時刻順）
+    """
+    silences = []
+    start = None
+    for line in ffmpeg_output.splitlines():
+        match = _SILENCE_START_PATTERN.search(line)
+        if match:
+            start = max(0.0, float(match.group(1)))
+            continue
+        match = _SILENCE_END_PATTERN.search(line)
+        if match and start is not None:
+            silences.append((start, float(match.group(1))))
+            start = None
+    if start is not None:
+        silences.append((start, duration))
+    return silences
+
+def max_segment_duration(duration: float, file_size: int, max_bytes: int) -> float:
+    """
+    実測のビットレートから、1セグメントがmax_bytesに収まる最大の長さ（秒）を求める
+
+    Args:
+        duration (float): ファイルの長さ（秒）
+        file_size (int): ファイルサイズ（バイト）
+        max_bytes (int): 1セグメントあたりのバイト数の上限
+
+    Returns:
+        float: セグメントの最大の長さ（秒）
+    """
+    bytes_per_second = file_size / duration if duration > 0 else file_size
+    return max_bytes / bytes_per_second if bytes_per_second > 0 else duration
+
+def plan_cut_points(
+    duration: float,
+    max_duration: float,
+    silences: List[Tuple[float, float]],
+    min_fill: float = 0.5
+) -> List[float]:
+    """
+    セグメントの区切り位置（秒）を決める
+
+    各セグメントがmax_durationを超えない範囲で、できるだけ後ろにある無音区間の中央で区切る。
+    上限の近くで区切るほどセグメント数が少なくなり、無音で区切ることで単語の途中で切れなくなる。
+    セグメントの前半（max_durationのmin_fill未満）に無音しかない場合は、上限の位置でそのまま区切る。
+
+    Args:
+        duration (float): ファイルの長さ（秒）
+        max_duration (float): 1セグメントの最大の長さ（秒）
+        silences (List[Tuple[float, float]]): 無音区間の一覧
+        min_fill (float): 無音で区切る場合に最低限確保するセグメントの長さ（max_durationに対する割合）
+
+    Returns:
+        List[float]: 区切り位置のリスト（昇順）。分割不要の場合は空
+    """
+    if max_duration <= 0:
+        raise ValueError("セグメントの最大の長さは正の値にしてください")
+    candidates = sorted((start + end) / 2 for start, end in silences)
+    cut_points = []
+    position = 0.0
+    while duration - position > max_duration:
+        limit = position + max_duration
+        lower = position + max_duration * min_fill
+        cut = None
+        for candidate in candidates:
+            if candidate > limit:
+                break
+            if candidate >= lower:
+                cut = candidate
+        if cut is None:
+            cut = limit
+        cut_points.append(cut)
+        position = cut
+    return cut_points
+
+def min_segment_count(duration: float, max_duration: float) -> int:
+    """分割に必要な最小のセグメント数を返す"""
+    return max(1, math.ceil(duration / max_duration))
@@ -1,29 +1,94 @@
-import json
+from collections import OrderedDict
+from dotenv import load_dotenv
+from typing import List, Optional, Tuple
+from sqlalchemy.orm import Session
+from db_control import crud, pgvector
+from db_control.vector_codec import load_embedding
+import os
 import numpy as np
-from typing import List, Tuple
-from sklearn.metrics.pairwise import cosine_similarity
 
-def calculate_cosine_similarity(vector1: List[float], vector2: List[float]) -> float:
+load_dotenv()
+
+# 文字起こしごとに作成したインデックスをプロセス内に保持する件数（1,000チャンクで約6MB）
+SIMILARITY_INDEX_CACHE_ENTRIES = int(os.getenv("SIMILARITY_INDEX_CACHE_ENTRIES", "32"))
+
+# 文字起こしID -> (作成時のベクトルの件数と最大のID, インデックス)
+_index_cache: "OrderedDict[int, Tuple[Tuple[int, Optional[int]], SimilarityIndex]]" = OrderedDict()
+
+class SimilarityIndex:
     """
-    2つのベクトル間のコサイン類似度を計算する
+    文字起こしのチャンクのベクトルを1つの行列にまとめた、コサイン類似度の検索用インデックス
     
-    Args:
-        vector1 (List[float]): 比較対象のベクトル1
-        vector2 (List[float]): 比較対象のベクトル2
-        
-    Returns:
-        float: コサイン類似度（0から1の値）
+    ベクトルは作成時に正規化して連続した配列（float32）に並べておき、
+    検索はクエリとの行列積1回で全チャンクの類似度を求め、上位k件をargpartitionで選ぶ
     """
-    try:
-        # numpy配列に変換
-        v1 = np.array(vector1).reshape(1, -1)
-        v2 = np.array(vector2).reshape(1, -1)
+    
+    def __init__(self, items: List, vectors: np.ndarray):
+        """
+        Args:
+            items (List): 各行に対応する値（(chunk, embedding)のタプルなど）
+            vectors (np.ndarray): ベクトルを行に並べた行列（件数 × 次元数）
+        """
+        self.items = items
+        matrix = np.ascontiguousarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        # 長さ0のベクトルは類似度0として扱う
+        self.matrix = np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
+    
+    @classmethod
+    def from_chunks(cls, chunks_with_embeddings: List[Tuple]) -> "SimilarityIndex":
+        """(chunk, embedding)のタプルのリストからインデックスを作成する"""
+        if not chunks_with_embeddings:
+            return cls([], np.zeros((0, 0), dtype=np.float32))
+        vectors = np.stack([
+            load_embedding(embedding.vector, embedding.embedding)
+            for _, embedding in chunks_with_embeddings
+        ])
+        return cls(list(chunks_with_embeddings), vectors)
+    
+    def __len__(self) -> int:
+        return len(self.items)
+    
+    def search_batch(self, query_vectors: np.ndarray, threshold: float, max_results: int) -> List[List[Tuple[int, float]]]:
+        """
+        複数のクエリについて、類似度が閾値以上のチャンクを上位max_results件まで求める
         
-        # コサイン類似度を計算
-        similarity = cosine_similarity(v1, v2)[0][0]
-        return float(similarity)
-    except Exception as e:
-        raise Exception(f"コサイン類似度計算中にエラーが発生しました: {str(e)}")
+        Args:
+            query_vectors (np.ndarray): クエリのベクトルを行に並べた行列（クエリ数 × 次元数）
+            threshold (float): 類似度の閾値
+            max_results (int): 最大結果数
+            
+        Returns:
+            List[List[Tuple[int, float]]]: クエリごとの (行番号, 類似度) のリスト（類似度の降順）
+        """
+        queries = np.atleast_2d(np.asarray(query_vectors, dtype=np.float32))
+        if not len(self) or max_results <= 0:
+            return [[] for _ in range(len(queries))]
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries = np.divide(queries, norms, out=np.zeros_like(queries), where=norms > 0)
+        
+        # 全チャンクとの類似度を行列積1回で求める（クエリ数 × チャンク数）
+        scores = queries @ self.matrix.T
+        k = min(max_results, scores.shape[1])
+        if k < scores.shape[1]:
+            # 上位k件だけを選び（全体は並べ替えない）、その中で並べ替える
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            top = np.broadcast_to(np.arange(k), (len(scores), k))
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        # 類似度の降順（同じ類似度の場合はチャンクの並び順）に並べる
+        order = np.lexsort((top, -top_scores), axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+        
+        return [
+            [(int(row), float(score)) for row, score in zip(rows, row_scores) if score >= threshold]
+            for rows, row_scores in zip(top, top_scores)
+        ]
+    
+    def search(self, query_vector: List[float], threshold: float, max_results: int) -> List[Tuple[int, float]]:
+        """1件のクエリについて、類似度が閾値以上のチャンクを上位max_results件まで求める"""
+        return self.search_batch(np.asarray(query_vector, dtype=np.float32)[np.newaxis, :], threshold, max_results)[0]
 
 def find_similar_chunks(
     query_vector: List[float], 
@@ -44,25 +109,12 @@ def find_similar_chunks(
         List[Tuple]: (chunk, embedding, similarity, rank)のタプルのリスト
     """
     try:
-        similarities = []
-        
-        for chunk, embedding in chunks_with_embeddings:
-            # JSONから埋め込みベクトルをパース
-            embedding_vector = json.loads(embedding.embedding)
-            
-            # 類似度を計算
-            similarity = calculate_cosine_similarity(query_vector, embedding_vector)
-            
-            # 閾値以上の場合のみ追加
-            if similarity >= threshold:
-                similarities.append((chunk, embedding, similarity))
+        index = SimilarityIndex.from_chunks(chunks_with_embeddings)
         
-        # 類似度で降順ソート
-        similarities.sort(key=lambda x: x[2], reverse=True)
-        
-        # 最大結果数まで取得し、rankを追加
+        # 類似度の降順に、閾値以上のものを最大結果数まで取得し、rankを追加
         results = []
-        for rank, (chunk, embedding, similarity) in enumerate(similarities[:max_results], 1):
+        for rank, (row, similarity) in enumerate(index.search(query_vector, threshold, max_results), 1):
+            chunk, embedding = index.items[row]
             results.append((chunk, embedding, similarity, rank))
         
         return results
@@ -70,17 +122,75 @@ def find_similar_chunks(
     except Exception as e:
         raise Exception(f"類似チャンク検索中にエラーが発生しました: {str(e)}")
 
-def parse_embedding_vector(embedding_str: str) -> List[float]:
+def invalidate_transcript_index(transcript_id: int) -> None:
+    """文字起こしのインデックスをキャッシュから削除する（チャンクのベクトルを保存・複製した後に呼ぶ）"""
+    _index_cache.pop(transcript_id, None)
+
+def get_transcript_index(db: Session, transcript_id: int) -> SimilarityIndex:
     """
-    JSON文字列からベクトルをパースする
+    文字起こしの全チャンクのベクトルをまとめたインデックス（各行の値はチャンクID）を返す
+    
+    作成したインデックスは文字起こしごとにキャッシュし、質問のたびに全チャンクのベクトルを読み込み直さない。
+    ベクトルの件数と最大のIDが作成時から変わっていれば作り直す
+    （別のプロセスのワーカーがベクトルを追加した場合も、古いインデックスを使わない）
     
     Args:
-        embedding_str (str): JSON形式のベクトル文字列
+        db (Session): データベースセッション
+        transcript_id (int): 文字起こしID
         
     Returns:
-        List[float]: ベクトルのリスト
+        SimilarityIndex: インデックス
+    """
+    version = crud.get_transcript_embedding_version(db, transcript_id)
+    cached = _index_cache.get(transcript_id)
+    if cached and cached[0] == version:
+        _index_cache.move_to_end(transcript_id)
+        return cached[1]
+    
+    chunks_with_embeddings = crud.get_transcript_chunks_with_embeddings(db, transcript_id)
+    index = SimilarityIndex.from_chunks(chunks_with_embeddings)
+    # ORMのオブジェクトはセッションに紐づくため、キャッシュにはチャンクIDだけを残す
+    index.items = [chunk.id for chunk, _ in index.items]
+    _index_cache[transcript_id] = (version, index)
+    _index_cache.move_to_end(transcript_id)
+    while len(_index_cache) > SIMILARITY_INDEX_CACHE_ENTRIES:
+        _index_cache.popitem(last=False)
+    return index
+
+def search_similar_chunks(
+    db: Session,
+    transcript_id: int,
+    query_vector: List[float],
+    threshold: float = 0.65,
+    max_results: int = 5
+) -> List[Tuple]:
+    """
+    文字起こしの中から、クエリベクトルと類似するチャンクを検索する
+    
+    pgvectorが使える場合はデータベース側で上位のチャンクIDと類似度だけを取得し、
+    使えない場合はキャッシュしたインデックス（get_transcript_index）を使ってPythonで類似度を計算する
+    
+    Args:
+        db (Session): データベースセッション
+        transcript_id (int): 文字起こしID
+        query_vector (List[float]): 検索クエリのベクトル
+        threshold (float): 類似度の閾値（デフォルト: 0.65）
+        max_results (int): 最大結果数（デフォルト: 5）
+        
+    Returns:
+        List[Tuple]: (chunk, embedding, similarity, rank)のタプルのリスト（embeddingはNone）
     """
     try:
-        return json.loads(embedding_str)
+        if pgvector.available:
+            matches = pgvector.search_chunks(db, query_vector, [transcript_id], max_results, threshold)
+        else:
+            index = get_transcript_index(db, transcript_id)
+            matches = [(index.items[row], similarity) for row, similarity in index.search(query_vector, threshold, max_results)]
     except Exception as e:
-        raise Exception(f"ベクトルのパース中にエラーが発生しました: {str(e)}") 
\ No newline at end of file
+        raise Exception(f"類似チャンク検索中にエラーが発生しました: {str(e)}")
+    
+    chunks = crud.get_transcript_chunks_by_ids(db, [chunk_id for chunk_id, _ in matches])
+    return [
+        (chunks[chunk_id], None, similarity, rank)
+        for rank, (chunk_id, similarity) in enumerate(matches, 1)
+    ]
@@ -1,10 +1,14 @@
-from azure.storage.blob import BlobServiceClient, generate_blob_sas, BlobSasPermissions
+from azure.storage.blob import BlobServiceClient, generate_blob_sas, BlobSasPermissions, ContentSettings, BlobBlock
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceNotFoundError
 from datetime import datetime, timedelta, timezone
 import os
 from dotenv import load_dotenv
 import tempfile
 import asyncio
+import hashlib
 from urllib.parse import urlparse, unquote, quote_plus
+from typing import List, Optional, Tuple
 
 
 load_dotenv()
@@ -13,6 +17,8 @@ load_dotenv()
 account_name = os.getenv("AZURE_STORAGE_ACCOUNT_NAME")
 account_key = os.getenv("AZURE_STORAGE_ACCOUNT_KEY")
 container_name_video = os.getenv("AZURE_STORAGE_CONTAINER_VIDEO", "video")
+# 直接アップロード用SASの有効期限（分）
+UPLOAD_SAS_EXPIRY_MINUTES = int(os.getenv("UPLOAD_SAS_EXPIRY_MINUTES", "30"))
 
 # BlobServiceClientの初期化
 blob_service_client = BlobServiceClient(
@@ -56,13 +62,10 @@ def _extract_blob_name(blob_name_or_url: str, container: str) -> str:
         blob_enc = blob_name_or_url                             # すでに blob 名
     return unquote(blob_enc)  # i3pKKo3p1eYPR5Xz4N4Y=  ← "=" が戻る!
 
-def generate_sas_url(blob_name: str, container_name: str) -> str:
+def _build_sas_url(raw_blob_name: str, container_name: str, permission: BlobSasPermissions, expiry: datetime) -> str:
     """
-    指定 blob を 1 時間ダウンロード可能な SAS URL に変換して返す。
-    blob_name は **フル URL でも blob 名だけでも可**。
+    デコード済みの blob 名に、指定した権限・有効期限の SAS を付けた URL を返す。
     """
-    raw_blob_name = _extract_blob_name(blob_name, container_name)
-
     now_utc = datetime.utcnow().replace(tzinfo=timezone.utc)
 
     sas_token = generate_blob_sas(
@@ -70,8 +73,8 @@ def generate_sas_url(blob_name: str, container_name: str) -> str:
         container_name = container_name,
         blob_name      = raw_blob_name,                 # デコード済み!
         account_key    = account_key,
-        permission     = BlobSasPermissions(read=True),
-        expiry         = now_utc + timedelta(hours=1),  # 有効期限
+        permission     = permission,
+        expiry         = expiry,                        # 有効期限
         start          = now_utc - timedelta(minutes=30),  # 時計ずれ吸収
         version        = "2023-11-03",                  # devtools と揃える
     )
@@ -83,6 +86,45 @@ def generate_sas_url(blob_name: str, container_name: str) -> str:
         f"https://{account_name}.blob.core.windows.net/"
         f"{container_name}/{blob_name_url}?{sas_token}"
     )
+
+def generate_sas_url(blob_name: str, container_name: str) -> str:
+    """
+    指定 blob を 1 時間ダウンロード可能な SAS URL に変換して返す。
+    blob_name は **フル URL でも blob 名だけでも可**。
+    """
+    raw_blob_name = _extract_blob_name(blob_name, container_name)
+    now_utc = datetime.utcnow().replace(tzinfo=timezone.utc)
+    return _build_sas_url(
+        raw_blob_name,
+        container_name,
+        BlobSasPermissions(read=True),
+        now_utc + timedelta(hours=1),
+    )
+
+def generate_upload_sas_url(blob_name: str, container_name: str, expiry_minutes: int = None) -> Tuple[str, datetime]:
+    """
+    指定 blob へブラウザから直接書き込むための SAS URL を返す。
+    権限は作成・書き込みのみ（読み取り・削除・一覧は不可）で、有効期限は短くする。
+
+    Args:
+        blob_name (str): ブロブ名
+        container_name (str): コンテナ名
+        expiry_minutes (int): 有効期限（分）。未指定の場合は UPLOAD_SAS_EXPIRY_MINUTES
+
+    Returns:
+        Tuple[str, datetime]: SAS URL と有効期限
+    """
+    raw_blob_name = _extract_blob_name(blob_name, container_name)
+    expiry = datetime.utcnow().replace(tzinfo=timezone.utc) + timedelta(
+        minutes=expiry_minutes or UPLOAD_SAS_EXPIRY_MINUTES
+    )
+    url = _build_sas_url(
+        raw_blob_name,
+        container_name,
+        BlobSasPermissions(create=True, write=True),
+        expiry,
+    )
+    return url, expiry
 # def generate_sas_url(blob_name: str, container_name: str) -> str:
 #     """
 #     SASトークンを含むURLを生成する
@@ -129,7 +171,7 @@ async def upload_video(video_file, minutes_id: int) -> str:
         container_client = blob_service_client.get_container_client(container_name_video)
         
         # ブロブ名の生成
-        blob_name = f"video_{minutes_id}.mp4"
+        blob_name = get_video_blob_name(minutes_id)
         
         # ファイルのアップロード（非同期で実行）
         await asyncio.to_thread(
@@ -144,3 +186,178 @@ async def upload_video(video_file, minutes_id: int) -> str:
         
     except Exception as e:
         raise Exception(f"動画のアップロード中にエラーが発生しました: {str(e)}")
+
+
+async def stage_video_block(blob_name: str, block_id: str, file_path: str) -> None:
+    """
+    ファイルの内容を動画のブロブの未確定のブロックとして書き込む（commit_video_blocksで確定するまで読み込めない）
+
+    同じブロックIDで書き込み直した場合は上書きされる
+
+    Args:
+        blob_name (str): ブロブ名
+        block_id (str): ブロックID（同じブロブのブロックIDはすべて同じ長さにする）
+        file_path (str): 書き込むファイルのパス
+    """
+    blob_client = blob_service_client.get_blob_client(container=container_name_video, blob=blob_name)
+
+    def _stage() -> None:
+        with open(file_path, 'rb') as f:
+            blob_client.stage_block(block_id, f, length=os.path.getsize(file_path))
+
+    try:
+        await asyncio.to_thread(_stage)
+    except Exception as e:
+        raise Exception(f"動画のブロックの書き込み中にエラーが発生しました: {str(e)}")
+
+async def commit_video_blocks(blob_name: str, block_ids: List[str]) -> None:
+    """
+    書き込み済みのブロックをこの順に結合して動画のブロブを確定する
+
+    確定済みのブロックも参照できるため、確定後に同じブロックIDで再実行しても同じ内容になる
+
+    Args:
+        blob_name (str): ブロブ名
+        block_ids (List[str]): ブロックIDのリスト（結合する順）
+    """
+    blob_client = blob_service_client.get_blob_client(container=container_name_video, blob=blob_name)
+    try:
+        await asyncio.to_thread(
+            blob_client.commit_block_list,
+            [BlobBlock(block_id=block_id) for block_id in block_ids]
+        )
+    except Exception as e:
+        raise Exception(f"動画のブロックの結合中にエラーが発生しました: {str(e)}")
+
+def get_video_blob_name(minutes_id: int) -> str:
+    """議事録IDに対応する動画のブロブ名を返す"""
+    return f"video_{minutes_id}.mp4"
+
+def get_thumbnail_blob_name(video_id: int) -> str:
+    """動画IDに対応するサムネイル画像のブロブ名を返す"""
+    return f"thumbnail_{video_id}.webp"
+
+def get_placeholder_blob_name(thumbnail_blob_name: str) -> str:
+    """サムネイル画像のブロブ名から、読み込み中に表示する小さなプレースホルダー画像のブロブ名を返す"""
+    return thumbnail_blob_name.replace(".webp", "_placeholder.webp")
+
+async def upload_image(file_path: str, blob_name: str, container_name: str) -> None:
+    """
+    WebP画像をAzure Blob Storageにアップロードする（ブラウザでキャッシュできるようにする）
+
+    Args:
+        file_path (str): アップロードする画像ファイルのパス
+        blob_name (str): ブロブ名
+        container_name (str): コンテナ名
+    """
+    blob_client = blob_service_client.get_blob_client(container=container_name, blob=blob_name)
+
+    def _upload() -> None:
+        with open(file_path, 'rb') as f:
+            blob_client.upload_blob(
+                f,
+                overwrite=True,
+                content_settings=ContentSettings(content_type="image/webp", cache_control="public, max-age=86400")
+            )
+
+    try:
+        await asyncio.to_thread(_upload)
+    except Exception as e:
+        raise Exception(f"画像のアップロード中にエラーが発生しました: {str(e)}")
+
+async def get_blob_size(blob_name: str, container_name: str) -> Optional[int]:
+    """
+    ブロブのサイズを取得する
+
+    Args:
+        blob_name (str): ブロブ名またはフルURL
+        container_name (str): コンテナ名
+
+    Returns:
+        Optional[int]: ブロブのサイズ（バイト）。存在しない場合はNone
+    """
+    raw_blob_name = _extract_blob_name(blob_name, container_name)
+    blob_client = blob_service_client.get_blob_client(container=container_name, blob=raw_blob_name)
+    try:
+        properties = await asyncio.to_thread(blob_client.get_blob_properties)
+    except ResourceNotFoundError:
+        return None
+    return properties.size
+
+async def get_blob_size_and_etag(blob_name: str, container_name: str) -> Optional[Tuple[int, str]]:
+    """
+    ブロブのサイズとETagを取得する
+
+    Args:
+        blob_name (str): ブロブ名またはフルURL
+        container_name (str): コンテナ名
+
+    Returns:
+        Optional[Tuple[int, str]]: ブロブのサイズ（バイト）とETag。存在しない場合はNone
+    """
+    raw_blob_name = _extract_blob_name(blob_name, container_name)
+    blob_client = blob_service_client.get_blob_client(container=container_name, blob=raw_blob_name)
+    try:
+        properties = await asyncio.to_thread(blob_client.get_blob_properties)
+    except ResourceNotFoundError:
+        return None
+    return properties.size, properties.etag
+
+def _match_etag(etag: Optional[str]) -> dict:
+    """etagを指定した場合に、ブロブが変更されていないときのみ読み込む条件を返す"""
+    if not etag:
+        return {}
+    return {"etag": etag, "match_condition": MatchConditions.IfNotModified}
+
+async def download_video(blob_name: str, container_name: str, dest_path: str, etag: Optional[str] = None) -> int:
+    """
+    ブロブをローカルファイルへ直接ダウンロードする（メモリに全体を載せない）
+
+    Args:
+        blob_name (str): ブロブ名またはフルURL
+        container_name (str): コンテナ名
+        dest_path (str): 保存先のパス
+        etag (Optional[str]): 指定した場合、ブロブがこのETagから変更されていればエラーにする
+
+    Returns:
+        int: ダウンロードしたバイト数
+    """
+    raw_blob_name = _extract_blob_name(blob_name, container_name)
+    blob_client = blob_service_client.get_blob_client(container=container_name, blob=raw_blob_name)
+
+    def _download() -> int:
+        with open(dest_path, 'wb') as f:
+            return blob_client.download_blob(max_concurrency=4, **_match_etag(etag)).readinto(f)
+
+    try:
+        return await asyncio.to_thread(_download)
+    except Exception as e:
+        raise Exception(f"動画のダウンロード中にエラーが発生しました: {str(e)}")
+
+async def get_blob_sha256(blob_name: str, container_name: str, etag: Optional[str] = None) -> str:
+    """
+    ブロブの内容を先頭から読み込んでSHA-256を求める（ファイルには保存せず、メモリにも全体を載せない）
+
+    Blobに記録されるMD5・CRC64はアップロード方法によって付かない・ブロックごとの値になるため、内容から求める
+
+    Args:
+        blob_name (str): ブロブ名またはフルURL
+        container_name (str): コンテナ名
+        etag (Optional[str]): 指定した場合、ブロブがこのETagから変更されていればエラーにする
+
+    Returns:
+        str: SHA-256の16進数表記
+    """
+    raw_blob_name = _extract_blob_name(blob_name, container_name)
+    blob_client = blob_service_client.get_blob_client(container=container_name, blob=raw_blob_name)
+
+    def _hash() -> str:
+        sha256 = hashlib.sha256()
+        for data in blob_client.download_blob(max_concurrency=4, **_match_etag(etag)).chunks():
+            sha256.update(data)
+        return sha256.hexdigest()
+
+    try:
+        return await asyncio.to_thread(_hash)
+    except Exception as e:
+        raise Exception(f"動画のハッシュ計算中にエラーが発生しました: {str(e)}")
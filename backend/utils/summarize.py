@@ -1,18 +1,13 @@
 from fastapi import HTTPException
 from sqlalchemy.orm import Session
 from db_control import crud
-from openai import AzureOpenAI
-import os
+from utils import ai_gateway
 import logging
 
 logger = logging.getLogger(__name__)
 
-# Azure OpenAIの設定
-client = AzureOpenAI(
-    api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-    api_version=os.getenv("AZURE_OPENAI_API_VERSION_CHAT", "2025-01-01-preview"),
-    azure_endpoint=os.getenv("AZURE_OPENAI_BASE_URL")
-)
+# 要約の最大トークン数
+MAX_SUMMARY_TOKENS = 1000
 
 def validate_access_permissions(db: Session, transcript_id: int, user_id: str) -> None:
     """
@@ -58,7 +53,7 @@ def validate_access_permissions(db: Session, transcript_id: int, user_id: str) -
             detail="この議事録へのアクセス権限がありません"
         )
 
-def generate_summary_content(transcript_content: str) -> str:
+async def generate_summary_content(transcript_content: str) -> str:
     """
     Azure OpenAIを使用して要約を生成する
     
@@ -72,14 +67,20 @@ def generate_summary_content(transcript_content: str) -> str:
         HTTPException: 要約生成中にエラーが発生した場合
     """
     try:
-        response = client.chat.completions.create(
-            model=os.getenv("AZURE_OPENAI_DEPLOYMENT_CHAT", "gpt-4.1"),
-            messages=[
-                {"role": "system", "content": "あなたは会議の議事録を要約する専門家です。与えられた文字起こし文章を、重要なポイントを漏らさず、簡潔にマークダウン記法で要約してください。見出しには`### を使ってください。それ以上の大きな見出し # や ## は使わないでください。"},
-                {"role": "user", "content": f"以下の会議の文字起こしを要約してください：\n\n{transcript_content}"}
-            ],
-            temperature=0.7,
-            max_tokens=1000
+        messages = [
+            {"role": "system", "content": "あなたは会議の議事録を要約する専門家です。与えられた文字起こし文章を、重要なポイントを漏らさず、簡潔にマークダウン記法で要約してください。見出しには`### を使ってください。それ以上の大きな見出し # や ## は使わないでください。"},
+            {"role": "user", "content": f"以下の会議の文字起こしを要約してください：\n\n{transcript_content}"}
+        ]
+        response = await ai_gateway.call(
+            "chat",
+            lambda client: client.chat.completions.create(
+                model=ai_gateway.get_deployment("chat"),
+                messages=messages,
+                temperature=0.7,
+                max_tokens=MAX_SUMMARY_TOKENS
+            ),
+            priority=ai_gateway.PRIORITY_NORMAL,
+            tokens=ai_gateway.estimate_tokens(transcript_content) + MAX_SUMMARY_TOKENS
         )
         return response.choices[0].message.content
     except Exception as e:
@@ -90,7 +91,7 @@ def generate_summary_content(transcript_content: str) -> str:
             detail=error_message
         )
 
-def process_summary_generation(db: Session, transcript_id: str, user_id: str) -> str:
+async def process_summary_generation(db: Session, transcript_id: str, user_id: str) -> str:
     """
     要約生成の一連の処理を実行する
     
@@ -113,10 +114,16 @@ def process_summary_generation(db: Session, transcript_id: str, user_id: str) ->
         
         # 文字起こしデータを取得
         transcript = crud.get_transcript_by_id(db, transcript_id)
+        # 処理中の途中までの文字起こしは要約しない
+        if not transcript.is_complete:
+            raise HTTPException(
+                status_code=400,
+                detail="文字起こしが完了していません"
+            )
         transcript_content = transcript.content if hasattr(transcript, 'content') else transcript.text
         
         # 要約を生成
-        summary_content = generate_summary_content(transcript_content)
+        summary_content = await generate_summary_content(transcript_content)
         logger.info("要約の生成が完了しました")
         
         # 要約を保存
@@ -1,17 +1,18 @@
-from openai import AzureOpenAI
 import os
 from dotenv import load_dotenv
-import tempfile
 import requests
 import mimetypes
 import logging
 import subprocess
-import shutil
-import aiohttp
 import asyncio
-from typing import List, Tuple
+import json
+import hashlib
+from typing import List, Tuple, Optional, Callable, Awaitable
 from sqlalchemy.orm import Session
 from db_control import crud
+from db_control.connect import SessionLocal
+from utils import concurrency, storage, segmentation, ai_gateway, scratch
+from utils.progress import ProgressReporter
 
 # ロギングの設定
 logging.basicConfig(level=logging.INFO)
@@ -19,14 +20,48 @@ logger = logging.getLogger(__name__)
 
 load_dotenv()
 
-client = AzureOpenAI(
-    api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-    api_version=os.getenv("AZURE_OPENAI_API_VERSION_WHISPER"),
-    azure_endpoint=os.getenv("AZURE_OPENAI_BASE_URL")
-)
-
 MAX_SIZE = 25 * 1024 * 1024  # 25MB in bytes
+# Whisperのモデル名（キャッシュキーに含める。デプロイメントのモデルを更新した場合は変更する）
+WHISPER_MODEL = os.getenv("AZURE_OPENAI_MODEL_WHISPER", "whisper")
+WHISPER_RESPONSE_FORMAT = "verbose_json"
+# 文字起こしキャッシュの保持期間（最後に利用されてからの日数）と最大件数
+TRANSCRIPTION_CACHE_TTL_DAYS = int(os.getenv("TRANSCRIPTION_CACHE_TTL_DAYS", "30"))
+TRANSCRIPTION_CACHE_MAX_ENTRIES = int(os.getenv("TRANSCRIPTION_CACHE_MAX_ENTRIES", "10000"))
 MAX_DURATION = 10 * 60  # 10分（秒）
+# 文字起こし用の中間ファイルの形式
+# "audio": 音声のみを抽出する（モノラル・16kHz・Opus。映像のエンコードを行わないため高速）
+# "video": 従来どおり映像ごと720pに再エンコードする
+TRANSCRIPTION_MODE = os.getenv("TRANSCRIPTION_MODE", "audio")
+# 音声抽出時のビットレート（24kbpsで90分の音声が約16MBになる）
+AUDIO_BITRATE = os.getenv("TRANSCRIPTION_AUDIO_BITRATE", "24k")
+# Whisperの入力は16kHzにリサンプリングされるため、それ以上のサンプリングレートは不要
+AUDIO_SAMPLE_RATE = 16000
+# 無音とみなす音量と最短の長さ（秒）。セグメントはこの無音区間で区切る
+SILENCE_NOISE = os.getenv("SILENCE_NOISE", "-35dB")
+SILENCE_MIN_DURATION = float(os.getenv("SILENCE_MIN_DURATION", "0.5"))
+# 1セグメントのサイズの上限（MAX_SIZEに対する割合。コンテナのオーバーヘッドやビットレートの揺れの分を空ける）
+SEGMENT_SIZE_MARGIN = 0.9
+# セグメントが上限を超えた場合に、予算を縮めて分割し直す回数
+SEGMENT_SPLIT_ATTEMPTS = 3
+# 文字起こし中の進捗の範囲（セグメントの完了数に応じて進める）
+TRANSCRIBE_PROGRESS_START = 60
+TRANSCRIBE_PROGRESS_END = 80
+# サムネイル画像の幅・プレースホルダー画像の幅（ピクセル）とWebPの画質
+THUMBNAIL_WIDTH = int(os.getenv("THUMBNAIL_WIDTH", "320"))
+THUMBNAIL_PLACEHOLDER_WIDTH = 16
+THUMBNAIL_QUALITY = 70
+# サムネイルにするフレームの位置（動画の長さに対する割合と上限の秒数。冒頭の暗転を避けつつ、手前のフレームで済ませる）
+THUMBNAIL_POSITION_RATIO = 0.1
+THUMBNAIL_MAX_POSITION_SECONDS = 60
+# この数のフレームの中から、最も代表的なフレームを選ぶ（ffmpegのthumbnailフィルタ）
+THUMBNAIL_CANDIDATE_FRAMES = 50
+# 文字起こし用の中間ファイルのエンコード設定（文字起こしキャッシュのキーに含める）
+ENCODER_SETTINGS = {
+    "audio": f"opus:{AUDIO_SAMPLE_RATE}:{AUDIO_BITRATE}:mono:voip",
+    "video": "h264:crf28:720p:24fps:aac96k",
+}
+# 中間ファイルの容量の見積もりに使う、元の動画に対する圧縮・抽出後のファイルサイズの比率
+SCRATCH_OUTPUT_RATIO = {"audio": 0.1, "video": 1.0}
 
 async def get_video_duration(file_path: str) -> float:
     """動画の長さを取得する関数"""
@@ -50,7 +85,279 @@ async def get_video_duration(file_path: str) -> float:
     
     return float(stdout.decode().strip())
 
-async def compress_video(input_path: str, output_path: str) -> None:
+class NoAudioError(Exception):
+    """動画に音声トラックがない（再試行しても文字起こしできない）ことを表すエラー"""
+
+async def _has_stream(file_path: str, stream_specifier: str) -> bool:
+    command = [
+        'ffprobe', '-v', 'error',
+        '-select_streams', stream_specifier,
+        '-show_entries', 'stream=index',
+        '-of', 'csv=p=0',
+        file_path
+    ]
+    
+    process = await asyncio.create_subprocess_exec(
+        *command,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    
+    stdout, _ = await process.communicate()
+    return process.returncode == 0 and bool(stdout.strip())
+
+async def has_video_stream(file_path: str) -> bool:
+    """ファイルに映像ストリームが含まれるかを確認する関数"""
+    return await _has_stream(file_path, 'v:0')
+
+async def has_audio_stream(file_path: str) -> bool:
+    """ファイルに音声ストリームが含まれるかを確認する関数"""
+    return await _has_stream(file_path, 'a:0')
+
+async def run_ffmpeg(
+    command: List[str],
+    error_message: str,
+    duration: Optional[float] = None,
+    on_progress: Optional[Callable[[float], None]] = None
+) -> str:
+    """
+    ffmpegを実行し、標準エラー出力（ffmpegのログ）を返す関数
+    
+    CPUを占有するため、ffmpegプールの枠を確保してから実行する。
+    durationとon_progressを指定すると、ffmpegの-progress出力から処理済みの時間を読み取り、
+    進み具合（0.0-1.0）をon_progressに渡す。中断された場合はffmpegのプロセスを終了させる
+    """
+    report_progress = bool(on_progress and duration)
+    if report_progress:
+        command = [command[0], '-progress', 'pipe:1', '-nostats'] + command[1:]
+    
+    async with concurrency.ffmpeg_pool:
+        process = await asyncio.create_subprocess_exec(
+            *command,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        
+        try:
+            if report_progress:
+                # 標準エラー出力は並行して読み切る（パイプが詰まってffmpegが止まらないようにする）
+                stderr_task = asyncio.create_task(process.stderr.read())
+                async for line in process.stdout:
+                    key, _, value = line.decode(errors="replace").strip().partition('=')
+                    # out_time_msも実際の単位はマイクロ秒
+                    if key in ('out_time_us', 'out_time_ms') and value.isdigit():
+                        on_progress(int(value) / 1_000_000 / duration)
+                stderr = await stderr_task
+                await process.wait()
+            else:
+                stdout, stderr = await process.communicate()
+        except asyncio.CancelledError:
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+            raise
+    
+    if process.returncode != 0:
+        raise Exception(f"{error_message}: {stderr.decode()}")
+    return stderr.decode(errors="replace")
+
+async def transcribe_file(file_path: str) -> Tuple[str, List[Tuple[int, int, str]]]:
+    """
+    Whisperで音声ファイルを文字起こしする関数
+    
+    Whisperプールの枠を確保し、共通のゲートウェイ経由（レート制限・再試行付き）で呼び出す
+    
+    Returns:
+        Tuple[str, List[Tuple[int, int, str]]]: 文字起こし結果と、セグメントごとの (開始ミリ秒, 終了ミリ秒, テキスト)
+    """
+    async def _create(client):
+        with open(file_path, 'rb') as audio_file:
+            return await client.audio.transcriptions.create(
+                model=ai_gateway.get_deployment("whisper"),
+                file=audio_file,
+                response_format=WHISPER_RESPONSE_FORMAT
+            )
+    
+    async with concurrency.whisper_pool:
+        response = await ai_gateway.call("whisper", _create, priority=ai_gateway.PRIORITY_BATCH)
+    
+    timings = []
+    for segment in getattr(response, "segments", None) or []:
+        if not isinstance(segment, dict):
+            segment = segment.model_dump()
+        timings.append((int(segment["start"] * 1000), int(segment["end"] * 1000), segment["text"]))
+    return response.text, timings
+
+def align_timings(text: str, char_offset: int, timings: List[Tuple[int, int, str]]) -> List[Tuple[int, int, int, int]]:
+    """
+    セグメントごとのタイムスタンプに、文字起こし全体の中での文字位置を付ける関数
+    
+    各セグメントのテキストをファイル全体の文字起こし結果の中から先頭側から順に探して文字位置を決める。
+    見つからない場合は直前のセグメントの直後に置く
+    
+    Args:
+        text (str): ファイル全体の文字起こし結果
+        char_offset (int): textの、文字起こし全体の中での開始位置
+        timings (List[Tuple[int, int, str]]): セグメントごとの (開始ミリ秒, 終了ミリ秒, テキスト)
+        
+    Returns:
+        List[Tuple[int, int, int, int]]: (開始ミリ秒, 終了ミリ秒, 開始文字位置, 終了文字位置) のリスト
+    """
+    aligned = []
+    cursor = 0
+    for start_ms, end_ms, segment_text in timings:
+        segment_text = segment_text.strip()
+        position = text.find(segment_text, cursor) if segment_text else -1
+        if position == -1:
+            position = cursor
+        end = min(len(text), position + len(segment_text))
+        aligned.append((start_ms, end_ms, char_offset + position, char_offset + end))
+        cursor = end
+    return aligned
+
+def _dump_transcription_result(text: str, timings: List[Tuple[int, int, str]]) -> str:
+    """文字起こし結果とタイムスタンプを、チェックポイント・キャッシュに保存する形式（JSON）にする"""
+    return json.dumps({"text": text, "segments": timings}, ensure_ascii=False)
+
+def _load_transcription_result(data: str) -> Tuple[str, List[Tuple[int, int, str]]]:
+    """
+    チェックポイント・キャッシュから文字起こし結果とタイムスタンプを取り出す
+    
+    タイムスタンプを記録する前の形式（文字起こし結果のみ）の場合は、タイムスタンプなしとして扱う
+    """
+    try:
+        payload = json.loads(data)
+    except ValueError:
+        payload = None
+    if not isinstance(payload, dict):
+        return data, []
+    return payload["text"], [tuple(timing) for timing in payload.get("segments", [])]
+
+def _file_sha256(file_path: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+def get_transcription_cache_key(file_path: str, source_hash: Optional[str] = None, segment_range: Optional[Tuple[int, int]] = None) -> str:
+    """
+    文字起こしキャッシュのキーを求める関数
+    
+    Opusなどのエンコード結果は実行ごとにバイト列が変わることがある（Oggのシリアル番号など）ため、
+    元の動画のSHA-256がわかる場合は、元の動画・セグメントの範囲（ミリ秒）・エンコード設定をキーにする。
+    わからない場合は、音声ファイル自体のSHA-256をキーにする。
+    どちらの場合も、モデル・デプロイメント・出力形式をキーに含める
+    """
+    if source_hash and segment_range:
+        start_ms, end_ms = segment_range
+        audio_id = f"{source_hash}:{start_ms}-{end_ms}:{ENCODER_SETTINGS.get(TRANSCRIPTION_MODE, TRANSCRIPTION_MODE)}"
+    else:
+        audio_id = _file_sha256(file_path)
+    deployment = ai_gateway.get_deployment("whisper") or ""
+    return hashlib.sha256(
+        f"{audio_id}:{WHISPER_MODEL}:{deployment}:{WHISPER_RESPONSE_FORMAT}".encode()
+    ).hexdigest()
+
+async def transcribe_file_cached(
+    file_path: str,
+    source_hash: Optional[str] = None,
+    segment_range: Optional[Tuple[int, int]] = None
+) -> Tuple[str, List[Tuple[int, int, str]]]:
+    """
+    文字起こしキャッシュを使って音声ファイルを文字起こしする関数
+    
+    同じ音声の文字起こし結果があればAPIを呼ばずに返す（再試行や再処理ではAPIのクォータをほとんど消費しない）。
+    キーはget_transcription_cache_keyで求める（source_hashとsegment_rangeは元の動画のSHA-256とセグメントの範囲）。
+    キャッシュの読み書きに失敗した場合は、キャッシュを使わずに文字起こしを続ける。
+    セグメントは並行して処理されるため、データベースセッションは呼び出しごとに作成する
+    """
+    deployment = ai_gateway.get_deployment("whisper") or ""
+    cache_key = await asyncio.to_thread(get_transcription_cache_key, file_path, source_hash, segment_range)
+    
+    # APIの呼び出し中に接続を保持しないよう、キャッシュの参照と登録でセッションを分ける
+    db = SessionLocal()
+    try:
+        cached = crud.get_transcription_cache(db, cache_key)
+    except Exception as e:
+        logger.warning(f"文字起こしキャッシュの取得に失敗: {str(e)}")
+        cached = None
+    finally:
+        db.close()
+    if cached:
+        logger.info(f"文字起こしキャッシュを使用します: {os.path.basename(file_path)}")
+        return _load_transcription_result(cached)
+    
+    text, timings = await transcribe_file(file_path)
+    
+    db = SessionLocal()
+    try:
+        crud.save_transcription_cache(db, cache_key, WHISPER_MODEL, deployment, _dump_transcription_result(text, timings))
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"文字起こしキャッシュの登録に失敗: {str(e)}")
+    finally:
+        db.close()
+    return text, timings
+
+def evict_transcription_cache() -> None:
+    """
+    期限切れ・上限超過の文字起こしキャッシュを削除する関数
+    
+    テーブル全体の件数を数えるため、セグメントごとではなく1ジョブに1回（文字起こしの完了後に）行う。
+    失敗しても文字起こしの結果には影響しないため、処理は続ける
+    """
+    db = SessionLocal()
+    try:
+        deleted = crud.evict_transcription_cache(db, TRANSCRIPTION_CACHE_TTL_DAYS, TRANSCRIPTION_CACHE_MAX_ENTRIES)
+        if deleted:
+            logger.info(f"文字起こしキャッシュを削除しました: {deleted}件")
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"文字起こしキャッシュの削除に失敗: {str(e)}")
+    finally:
+        db.close()
+
+async def get_segment_ranges(segments: List[str]) -> List[Tuple[int, int]]:
+    """分割したファイルごとの、動画の先頭からの (開始時刻, 終了時刻)（ミリ秒）を、各ファイルの長さから求める関数"""
+    ranges = []
+    start = 0
+    for segment in segments:
+        end = start + int(await get_video_duration(segment) * 1000)
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+async def transcribe_segment(
+    index: int,
+    file_path: str,
+    limiter: asyncio.Semaphore,
+    source_hash: Optional[str] = None,
+    segment_range: Optional[Tuple[int, int]] = None
+) -> Tuple[int, Tuple[str, List[Tuple[int, int, str]]]]:
+    """
+    セグメントを1件文字起こしする関数
+
+    source_hashとsegment_rangeは文字起こしキャッシュのキーに使う（transcribe_file_cachedを参照）。
+    429や一時的なエラーの再試行は共通のゲートウェイ（ai_gateway.call）だけで行う
+    （ここでも再試行すると、試行回数と待機時間が掛け算で増えるため）。
+    失敗したセグメントは、ジョブの再試行時にこのセグメントだけが文字起こしし直される
+
+    Returns:
+        Tuple[int, Tuple[str, List[Tuple[int, int, str]]]]: セグメント番号と、文字起こし結果とタイムスタンプ
+    """
+    async with limiter:
+        try:
+            return index, await transcribe_file_cached(file_path, source_hash, segment_range)
+        except Exception as e:
+            raise Exception(f"セグメント {index+1} の文字起こしに失敗しました: {str(e)}")
+
+async def compress_video(
+    input_path: str,
+    output_path: str,
+    duration: Optional[float] = None,
+    on_progress: Optional[Callable[[float], None]] = None
+) -> None:
     """動画を圧縮する関数"""
     command = [
         'ffmpeg', '-i', input_path,
@@ -59,130 +366,348 @@ async def compress_video(input_path: str, output_path: str) -> None:
         '-preset', 'medium',
         '-vf', 'scale=1280:720',  # 720pに解像度を下げる
         '-r', '24',  # フレームレートを24fpsに下げる
+        '-g', '48',  # 2秒ごとにキーフレームを入れ、コピー分割の区切り位置を細かくする
         '-c:a', 'aac',
         '-b:a', '96k',  # 音声ビットレートを96kに下げる
         '-y', output_path
     ]
     
-    process = await asyncio.create_subprocess_exec(
-        *command,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE
-    )
+    await run_ffmpeg(command, "動画の圧縮に失敗しました", duration, on_progress)
+
+async def extract_audio(
+    input_path: str,
+    output_path: str,
+    duration: Optional[float] = None,
+    on_progress: Optional[Callable[[float], None]] = None
+) -> None:
+    """
+    動画から文字起こし用の音声のみを抽出する関数
+
+    映像ストリームは出力せず、音声をモノラル・16kHzのOpus（低ビットレートの音声向け設定）に変換する
+    """
+    command = [
+        'ffmpeg', '-i', input_path,
+        '-vn',  # 映像は出力しない
+        '-map', '0:a:0',
+        '-ac', '1',  # モノラル
+        '-ar', str(AUDIO_SAMPLE_RATE),
+        '-c:a', 'libopus',
+        '-b:a', AUDIO_BITRATE,
+        '-application', 'voip',  # 音声（話し声）向けのエンコード設定
+        '-y', output_path
+    ]
     
-    stdout, stderr = await process.communicate()
+    await run_ffmpeg(command, "音声の抽出に失敗しました", duration, on_progress)
+
+async def detect_silences(input_path: str, duration: float, on_progress: Optional[Callable[[float], None]] = None) -> List[Tuple[float, float]]:
+    """
+    ffmpegのsilencedetectで無音区間を検出する関数（音声のみをデコードする）
+    """
+    command = [
+        'ffmpeg', '-hide_banner', '-nostats',
+        '-i', input_path,
+        '-vn',
+        '-af', f'silencedetect=noise={SILENCE_NOISE}:d={SILENCE_MIN_DURATION}',
+        '-f', 'null', '-'
+    ]
     
-    if process.returncode != 0:
-        raise Exception(f"動画の圧縮に失敗しました: {stderr.decode()}")
+    output = await run_ffmpeg(command, "無音区間の検出に失敗しました", duration, on_progress)
+    return segmentation.parse_silences(output, duration)
 
-async def split_video(input_path: str, output_dir: str, segment_duration: int = 600) -> List[str]:
-    """動画を分割する関数"""
+async def split_media(input_path: str, output_dir: str, cut_points: List[float]) -> List[str]:
+    """
+    圧縮済みの動画または抽出済みの音声を、指定した位置で分割する関数
+
+    再エンコードは行わず、ストリームをコピーして区切る（映像は区切り位置以降の最初のキーフレームで区切られる）
+    """
+    # 前回の実行で作られたセグメントを削除
+    for name in os.listdir(output_dir):
+        if name.startswith('segment_'):
+            os.unlink(os.path.join(output_dir, name))
+    
+    extension = os.path.splitext(input_path)[1]
     command = [
         'ffmpeg', '-i', input_path,
-        '-c:v', 'libx264',
-        '-crf', '28',
-        '-preset', 'medium',
-        '-vf', 'scale=1280:720',
-        '-r', '24',
-        '-c:a', 'aac',
-        '-b:a', '96k',
+        '-map', '0',
+        '-c', 'copy',
         '-f', 'segment',
-        '-segment_time', str(segment_duration),
+        '-segment_times', ','.join(f'{point:.3f}' for point in cut_points),
         '-reset_timestamps', '1',
         '-y',
-        os.path.join(output_dir, 'segment_%03d.mp4')
+        os.path.join(output_dir, f'segment_%03d{extension}')
     ]
     
-    process = await asyncio.create_subprocess_exec(
-        *command,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE
-    )
+    await run_ffmpeg(command, "ファイルの分割に失敗しました")
     
-    stdout, stderr = await process.communicate()
-    
-    if process.returncode != 0:
-        raise Exception(f"動画の分割に失敗しました: {stderr.decode()}")
-    
-    # 分割されたファイルのリストを取得
     segments = sorted([f for f in os.listdir(output_dir) if f.startswith('segment_')])
     return [os.path.join(output_dir, segment) for segment in segments]
 
-async def transcribe_video(video_url: str, db: Session, minutes_id: int) -> str:
-    """動画の文字起こしを行う関数"""
-    temp_dir = None
+async def split_by_silence(input_path: str, output_dir: str, duration: float, on_progress: Optional[Callable[[float], None]] = None) -> List[str]:
+    """
+    ファイルを、各セグメントがMAX_SIZEに収まり、かつ無音区間で終わるように分割する関数
+
+    実測のビットレートとMAX_SIZEから1セグメントの長さの上限を求め、その範囲でできるだけ長く区切る
+    （APIの呼び出し回数を減らし、単語の途中で切れないようにする）。
+    ビットレートの揺れで上限を超えたセグメントがあれば、予算を縮めて分割し直す
+    """
+    file_size = os.path.getsize(input_path)
+    silences = await detect_silences(input_path, duration, on_progress)
+    logger.info(f"無音区間を{len(silences)}件検出しました")
+    
+    margin = SEGMENT_SIZE_MARGIN
+    for _ in range(SEGMENT_SPLIT_ATTEMPTS):
+        max_duration = segmentation.max_segment_duration(duration, file_size, int(MAX_SIZE * margin))
+        cut_points = segmentation.plan_cut_points(duration, max_duration, silences)
+        segments = await split_media(input_path, output_dir, cut_points)
+        oversized = [segment for segment in segments if os.path.getsize(segment) > MAX_SIZE]
+        logger.info(
+            f"{len(segments)}件に分割しました（最小{segmentation.min_segment_count(duration, max_duration)}件、"
+            f"1セグメント最大{max_duration:.0f}秒）"
+        )
+        if not oversized:
+            return segments
+        logger.warning(f"制限を超えたセグメントがあるため分割し直します: {len(oversized)}件")
+        margin *= 0.8
+    raise Exception("セグメントを制限内のサイズに分割できませんでした")
+
+async def estimate_scratch_bytes(input_path: Optional[str], blob_name: Optional[str]) -> int:
+    """
+    ジョブの中間ファイルに必要な容量（バイト）を見積もる
+    
+    圧縮・抽出後のファイルと、その分割後のセグメント（同じサイズ）を合わせた容量とする。
+    ローカルにファイルがない場合は、ダウンロードする元の動画の容量も加える
+    """
+    if input_path and os.path.exists(input_path):
+        input_size = os.path.getsize(input_path)
+        download_size = 0
+    else:
+        input_size = (await storage.get_blob_size(blob_name, storage.container_name_video) if blob_name else None) or 0
+        download_size = input_size
+    ratio = SCRATCH_OUTPUT_RATIO["video" if TRANSCRIPTION_MODE == "video" else "audio"]
+    return download_size + int(input_size * ratio * 2)
+
+async def create_thumbnails(input_path: str, duration: Optional[float], thumbnail_path: str, placeholder_path: str) -> None:
+    """
+    動画の先頭付近から代表的なフレームを1枚選び、一覧表示用の小さなWebPと、読み込み中に表示する極小のWebPを書き出す関数
+    
+    圧縮・音声抽出とは別の実行にし、入力側でサムネイルの位置までシークしてから
+    THUMBNAIL_CANDIDATE_FRAMES枚だけデコードする（動画全体の映像はデコードしない）
+    """
+    position = min((duration or 0) * THUMBNAIL_POSITION_RATIO, THUMBNAIL_MAX_POSITION_SECONDS)
+    filter_graph = (
+        f"[0:v:0]thumbnail={THUMBNAIL_CANDIDATE_FRAMES},split=2[thumb][placeholder];"
+        f"[thumb]scale={THUMBNAIL_WIDTH}:-2[thumb_out];"
+        f"[placeholder]scale={THUMBNAIL_PLACEHOLDER_WIDTH}:-2[placeholder_out]"
+    )
+    command = [
+        'ffmpeg', '-ss', f'{position:.3f}', '-i', input_path,
+        '-filter_complex', filter_graph,
+        '-map', '[thumb_out]', '-frames:v', '1', '-c:v', 'libwebp', '-quality', str(THUMBNAIL_QUALITY), '-y', thumbnail_path,
+        '-map', '[placeholder_out]', '-frames:v', '1', '-c:v', 'libwebp', '-quality', '50', '-y', placeholder_path,
+    ]
+    
+    await run_ffmpeg(command, "サムネイルの作成に失敗しました")
+
+async def save_thumbnails(db: Session, video_id: int, input_path: str, duration: Optional[float], work_dir: str) -> None:
+    """
+    サムネイル画像とプレースホルダー画像を作成してBlobにアップロードし、動画に紐づける
+    
+    サムネイルは一覧表示のためのものなので、失敗しても処理は続ける
+    """
+    thumbnail_path = os.path.join(work_dir, 'thumbnail.webp')
+    placeholder_path = os.path.join(work_dir, 'placeholder.webp')
     try:
-        # 一時ディレクトリの作成
-        temp_dir = tempfile.mkdtemp()
-        temp_input = os.path.join(temp_dir, 'input.mp4')
-        temp_output = os.path.join(temp_dir, 'output.mp4')
-        
-        # 動画のダウンロード
-        async with aiohttp.ClientSession() as session:
-            async with session.get(video_url) as response:
-                if response.status != 200:
-                    raise Exception(f"動画のダウンロードに失敗しました: {response.status}")
-                content = await response.read()
-                with open(temp_input, 'wb') as f:
-                    f.write(content)
-        
-        # 動画の長さを取得
-        duration = await get_video_duration(temp_input)
-        logger.info(f"動画の長さ: {duration}秒")
-        await crud.update_video_progress(db, minutes_id, 30)
-        db.commit()
-        
+        await create_thumbnails(input_path, duration, thumbnail_path, placeholder_path)
+        blob_name = storage.get_thumbnail_blob_name(video_id)
+        await asyncio.gather(
+            storage.upload_image(thumbnail_path, blob_name, storage.container_name_video),
+            storage.upload_image(placeholder_path, storage.get_placeholder_blob_name(blob_name), storage.container_name_video)
+        )
+        await crud.update_video_image_url(db, video_id, blob_name)
+        logger.info(f"サムネイルを保存しました: {blob_name}")
+    except Exception as e:
+        logger.warning(f"サムネイルの保存に失敗: {str(e)}")
+
+async def prepare_segments(
+    input_path: Optional[str],
+    blob_name: Optional[str],
+    db: Session,
+    video_id: int,
+    work_dir: str,
+    reporter: ProgressReporter
+) -> List[str]:
+    """
+    文字起こし用のファイル（必要に応じて分割）を用意する関数
+    
+    TRANSCRIPTION_MODEが"audio"の場合は音声のみを抽出し、"video"の場合は動画を圧縮する。
+    ローカルにアップロードされたファイルがあればそれを直接使い、ない場合のみBlobからダウンロードする。
+    完了時に"transcoded"チェックポイントを記録し、再実行時はファイルが残っていればそのまま使う
+    """
+    checkpoint = crud.get_checkpoints(db, video_id, "transcoded").get(0)
+    if checkpoint:
+        segments = [os.path.join(work_dir, name) for name in json.loads(checkpoint)]
+        if all(os.path.exists(segment) for segment in segments):
+            logger.info(f"圧縮済みのファイルを再利用します: {len(segments)}件")
+            return segments
+    
+    audio_only = TRANSCRIPTION_MODE != "video"
+    temp_output = os.path.join(work_dir, 'output.ogg' if audio_only else 'output.mp4')
+    
+    if input_path and os.path.exists(input_path):
+        temp_input = input_path
+    else:
+        # ローカルにファイルがない場合（直接アップロード・別ノードでの再開）のみダウンロード
+        if not blob_name:
+            raise Exception("文字起こし対象の動画が見つかりません")
+        temp_input = os.path.join(work_dir, 'input.mp4')
+        # 直接アップロードの完了後にブロブが上書きされていれば読み込まない
+        blob_etag = crud.get_checkpoints(db, video_id, "blob_etag").get(0)
+        size = await storage.download_video(blob_name, storage.container_name_video, temp_input, etag=blob_etag)
+        logger.info(f"動画をダウンロードしました: {size} bytes")
+    
+    # 音声トラックがなければ文字起こしできないため、エンコードする前に打ち切る（再試行しない）
+    if not await has_audio_stream(temp_input):
+        raise NoAudioError("動画に音声トラックがないため、文字起こしできません")
+    
+    # 動画の長さを取得
+    duration = await get_video_duration(temp_input)
+    logger.info(f"動画の長さ: {duration}秒")
+    reporter.report(30)
+    
+    if audio_only:
+        # 音声のみを抽出（映像の再エンコードを行わない）
+        logger.info("音声の抽出を開始")
+        await extract_audio(temp_input, temp_output, duration, reporter.stage(30, 50))
+    else:
         # 動画の圧縮
         logger.info("動画の圧縮を開始")
-        await compress_video(temp_input, temp_output)
-        await crud.update_video_progress(db, minutes_id, 50)
-        db.commit()
-        
-        # 圧縮後のファイルサイズをチェック
-        compressed_size = os.path.getsize(temp_output)
-        logger.info(f"圧縮後のファイルサイズ: {compressed_size} bytes")
-        
-        if compressed_size <= MAX_SIZE:
-            # 圧縮後のファイルが制限内の場合、そのまま文字起こし
-            logger.info("圧縮後のファイルが制限内のため、そのまま文字起こしを実行")
-            with open(temp_output, 'rb') as audio_file:
-                response = client.audio.transcriptions.create(
-                    model=os.getenv("AZURE_OPENAI_DEPLOYMENT_WHISPER"),
-                    file=audio_file,
-                    response_format="text"
-                )
-            return response
-        else:
-            # 圧縮後のファイルが制限を超える場合、分割して処理
-            logger.info("圧縮後のファイルが制限を超えるため、分割して処理")
-            segments = await split_video(temp_input, temp_dir)
-            await crud.update_video_progress(db, minutes_id, 60)
-            db.commit()
-            transcriptions = []
-            
-            for i, segment in enumerate(segments):
-                logger.info(f"セグメント {i+1}/{len(segments)} の文字起こしを開始")
-                with open(segment, 'rb') as audio_file:
-                    response = client.audio.transcriptions.create(
-                        model=os.getenv("AZURE_OPENAI_DEPLOYMENT_WHISPER"),
-                        file=audio_file,
-                        response_format="text"
-                    )
-                transcriptions.append(response)
-            
-            # 文字起こし結果を結合
-            return " ".join(transcriptions)
-            
+        await compress_video(temp_input, temp_output, duration, reporter.stage(30, 50))
+    reporter.report(50)
+    
+    # 映像がある場合のみサムネイルを作成する（音声のみのファイルでは行わない）
+    if await has_video_stream(temp_input):
+        await save_thumbnails(db, video_id, temp_input, duration, work_dir)
+    
+    # 圧縮後のファイルサイズをチェック
+    compressed_size = os.path.getsize(temp_output)
+    logger.info(f"圧縮後のファイルサイズ: {compressed_size} bytes")
+    
+    if compressed_size <= MAX_SIZE:
+        # 圧縮後のファイルが制限内の場合、そのまま文字起こし
+        logger.info("圧縮後のファイルが制限内のため、そのまま文字起こしを実行")
+        segments = [temp_output]
+    else:
+        # 圧縮後のファイルが制限を超える場合、分割して処理
+        logger.info("圧縮後のファイルが制限を超えるため、分割して処理")
+        # 圧縮・抽出済みのファイルを無音区間でコピー分割する（元の動画から再エンコードし直さない）
+        segments = await split_by_silence(temp_output, work_dir, duration, reporter.stage(50, 58))
+    reporter.report(60)
+    
+    await crud.save_checkpoint(db, video_id, "transcoded", 0, json.dumps([os.path.basename(segment) for segment in segments]))
+    return segments
+
+async def transcribe_video(
+    input_path: Optional[str],
+    blob_name: Optional[str],
+    db: Session,
+    minutes_id: int,
+    video_id: int,
+    reporter: ProgressReporter,
+    on_segment: Optional[Callable[[int, str, List[Tuple[int, int, str]]], Awaitable[None]]] = None,
+    source_hash: Optional[str] = None
+) -> str:
+    """
+    動画の文字起こしを行う関数
+    
+    input_pathにローカルファイルがあればそこから処理し、なければblob_nameの動画をダウンロードする。
+    
+    セグメントは並行して文字起こしし（同時実行数はSEGMENT_CONCURRENCY）、結果はセグメント順に結合する。
+    セグメントごとの文字起こし結果とタイムスタンプを"segment_transcribed"チェックポイントとして記録し、
+    再実行時は完了済みのセグメントを再送しない。中間ファイルは作業ディレクトリに残し、
+    処理完了後に呼び出し側で削除する。
+    
+    on_segmentを指定すると、先頭から途切れずに揃ったセグメントの結果を、揃った時点でセグメント順に
+    1件ずつ渡す（途中までの文字起こしの公開や、後続のチャンク分割を先に進めるため）。
+    タイムスタンプ（Whisperのセグメント単位）は、分割したファイルの開始時刻を足して動画の先頭からの時刻にして渡す。
+    
+    source_hash（元の動画のSHA-256）を指定すると、文字起こしキャッシュのキーを元の動画とセグメントの範囲から求める
+    （中間ファイルのバイト列が実行ごとに変わっても、同じ動画であればキャッシュを使える）。
+    """
+    try:
+        # 中間ファイルの容量を予約してから重い処理を始める（空きがなければ他のジョブの完了を待つ）
+        scratch_bytes = await estimate_scratch_bytes(input_path, blob_name)
+        async with scratch.manager.reserve(minutes_id, scratch_bytes) as work_dir:
+            transcript = await _transcribe_segments(input_path, blob_name, db, video_id, work_dir, reporter, on_segment, source_hash)
+        await asyncio.to_thread(evict_transcription_cache)
+        return transcript
+    except NoAudioError as e:
+        logger.error(f"エラーが発生: {str(e)}")
+        raise
     except Exception as e:
         logger.error(f"エラーが発生: {str(e)}")
         raise Exception(f"文字起こし処理中にエラーが発生しました: {str(e)}")
-    finally:
-        # 一時ファイルの削除
-        if temp_dir and os.path.exists(temp_dir):
+
+async def _transcribe_segments(
+    input_path: Optional[str],
+    blob_name: Optional[str],
+    db: Session,
+    video_id: int,
+    work_dir: str,
+    reporter: ProgressReporter,
+    on_segment: Optional[Callable[[int, str, List[Tuple[int, int, str]]], Awaitable[None]]],
+    source_hash: Optional[str]
+) -> str:
+    """予約した作業ディレクトリで、セグメントの用意と文字起こしを行う（transcribe_videoから呼ぶ）"""
+    segments = await prepare_segments(input_path, blob_name, db, video_id, work_dir, reporter)
+    
+    transcriptions = {
+        i: _load_transcription_result(data)
+        for i, data in crud.get_checkpoints(db, video_id, "segment_transcribed").items()
+    }
+    ranges = await get_segment_ranges(segments) if on_segment or source_hash else [None] * len(segments)
+    pending = [i for i in range(len(segments)) if i not in transcriptions]
+    if pending:
+        logger.info(f"{len(pending)}/{len(segments)}件のセグメントの文字起こしを開始")
+    
+    published = 0
+    async def publish():
+        nonlocal published
+        while on_segment and published in transcriptions:
+            text, timings = transcriptions[published]
+            offset = ranges[published][0]
+            await on_segment(published, text, [(start + offset, end + offset, t) for start, end, t in timings])
+            published += 1
+    await publish()
+    
+    # セグメントは並行して文字起こしし、完了した順に記録する
+    # （データベースの更新はこのコルーチンだけで行い、セッションを共有しない）
+    limiter = asyncio.Semaphore(concurrency.SEGMENT_CONCURRENCY)
+    tasks = [
+        asyncio.create_task(transcribe_segment(i, segments[i], limiter, source_hash, ranges[i]))
+        for i in pending
+    ]
+    errors = []
+    try:
+        for next_done in asyncio.as_completed(tasks):
             try:
-                for file in os.listdir(temp_dir):
-                    os.unlink(os.path.join(temp_dir, file))
-                os.rmdir(temp_dir)
-                logger.info(f"一時ディレクトリを削除: {temp_dir}")
+                i, result = await next_done
             except Exception as e:
-                logger.error(f"一時ファイルの削除に失敗: {str(e)}")
+                # 失敗したセグメントがあっても、他のセグメントの結果は記録してから中断する
+                errors.append(str(e))
+                continue
+            transcriptions[i] = result
+            text, timings = result
+            await crud.save_checkpoint(db, video_id, "segment_transcribed", i, _dump_transcription_result(text, timings))
+            reporter.report(
+                TRANSCRIBE_PROGRESS_START + (TRANSCRIBE_PROGRESS_END - TRANSCRIBE_PROGRESS_START) * len(transcriptions) / len(segments)
+            )
+            await publish()
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+    if errors:
+        raise Exception(", ".join(errors))
+    
+    # 文字起こし結果をセグメント順に結合
+    return " ".join(transcriptions[i][0] for i in range(len(segments)))
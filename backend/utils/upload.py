@@ -0,0 +1,239 @@
+from fastapi import UploadFile, HTTPException
+from fastapi.responses import JSONResponse
+from typing import AsyncIterator, Iterable, List, Tuple
+import tempfile
+import asyncio
+import hashlib
+import os
+import logging
+import time
+from dotenv import load_dotenv
+from utils import storage
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# アップロードを書き出す際の1回あたりの読み込みサイズ（バイト）
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))  # 1MB
+# 1ファイルあたりの最大アップロードサイズ（バイト）
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", str(5 * 1024 * 1024 * 1024)))  # 5GB
+# アップロードファイルを一時保存するディレクトリ（未指定の場合はOSの一時ディレクトリ）
+UPLOAD_SCRATCH_DIR = os.getenv("UPLOAD_SCRATCH_DIR") or None
+# アップロードの一時ファイルの接頭辞（起動時の掃除で対象を見分けるため）
+UPLOAD_TEMP_PREFIX = "ai_minutes_upload_"
+# 起動時の掃除では、この時間（秒）以上更新されていない一時ファイルのみ削除する（書き込み中のファイルを消さない）
+UPLOAD_ORPHAN_MIN_AGE_SECONDS = int(os.getenv("UPLOAD_ORPHAN_MIN_AGE_SECONDS", "3600"))
+# multipart/form-dataのリクエストで、ファイル以外（境界・ヘッダー・他のフィールド）に許容するサイズ（バイト）
+UPLOAD_FORM_OVERHEAD_BYTES = 1024 * 1024  # 1MB
+# 分割アップロードの1パートあたりのサイズ（バイト）
+UPLOAD_PART_SIZE = int(os.getenv("UPLOAD_PART_SIZE", str(8 * 1024 * 1024)))  # 8MB
+MIN_UPLOAD_PART_SIZE = 1024 * 1024  # 1MB
+MAX_UPLOAD_PART_SIZE = 256 * 1024 * 1024  # 256MB
+
+class UploadSizeLimitMiddleware:
+    """
+    指定したパスへのリクエストボディのサイズを検証するASGIミドルウェア
+
+    UploadFileを受け取るエンドポイントは、ルーターが呼ばれる前にボディ全体が一時ファイルに保存されるため、
+    ルーター内の検証では上限を超えるアップロードも最後まで受信してしまう。
+    Content-Lengthが上限を超える場合は本文を読まずに413を返し、
+    Content-Lengthがない（chunked）場合も受信したバイト数が上限を超えた時点で413にする。
+    """
+
+    def __init__(self, app, paths: Iterable[str], max_bytes: int = MAX_UPLOAD_SIZE + UPLOAD_FORM_OVERHEAD_BYTES):
+        self.app = app
+        self.paths = set(paths)
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        detail = f"ファイルサイズが上限（{MAX_UPLOAD_SIZE}バイト）を超えています"
+        content_length = dict(scope["headers"]).get(b"content-length")
+        try:
+            too_large = content_length is not None and int(content_length) > self.max_bytes
+        except ValueError:
+            too_large = False
+        if too_large:
+            response = JSONResponse({"detail": detail}, status_code=413)
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+async def iter_upload_file(file: UploadFile, chunk_size: int = UPLOAD_CHUNK_SIZE) -> AsyncIterator[bytes]:
+    """
+    UploadFileを固定サイズのチャンクごとに読み出す
+
+    Args:
+        file (UploadFile): アップロードされたファイル
+        chunk_size (int): 1回あたりの読み込みサイズ（バイト）
+
+    Yields:
+        bytes: ファイルの一部
+    """
+    while True:
+        data = await file.read(chunk_size)
+        if not data:
+            break
+        yield data
+
+async def stream_to_file(chunks: AsyncIterator[bytes], file_path: str, max_bytes: int = MAX_UPLOAD_SIZE, hasher=None) -> int:
+    """
+    チャンクのストリームをファイルに書き出す。書き込み中にサイズ上限を検証する
+
+    Args:
+        chunks (AsyncIterator[bytes]): 書き出すデータのストリーム
+        file_path (str): 書き出し先のパス
+        max_bytes (int): 許容する最大バイト数
+        hasher: 指定した場合、書き出すデータでハッシュを更新する（hashlibのオブジェクト）
+
+    Returns:
+        int: 書き込んだバイト数
+
+    Raises:
+        HTTPException: サイズ上限を超えた場合（413）
+    """
+    total = 0
+    with open(file_path, 'wb') as f:
+        async for data in chunks:
+            total += len(data)
+            if total > max_bytes:
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"ファイルサイズが上限（{max_bytes}バイト）を超えています"
+                )
+            if hasher is not None:
+                hasher.update(data)
+            # ディスク書き込みでイベントループを止めないようにスレッドで実行
+            await asyncio.to_thread(f.write, data)
+    return total
+
+async def save_upload_to_temp(file: UploadFile, max_bytes: int = MAX_UPLOAD_SIZE) -> Tuple[str, str]:
+    """
+    アップロードされたファイルを一定サイズずつ一時ファイルに保存する
+
+    ファイル全体をメモリに載せないため、アップロードサイズに関係なく
+    1リクエストあたりのメモリ使用量はUPLOAD_CHUNK_SIZE程度に抑えられる。
+    書き込みと同時にSHA-256を計算する。
+
+    Args:
+        file (UploadFile): アップロードされたファイル
+        max_bytes (int): 許容する最大バイト数
+
+    Returns:
+        Tuple[str, str]: 保存した一時ファイルのパスとSHA-256（16進数）
+    """
+    suffix = os.path.splitext(file.filename)[1]
+    fd, temp_path = tempfile.mkstemp(suffix=suffix, prefix=UPLOAD_TEMP_PREFIX, dir=UPLOAD_SCRATCH_DIR)
+    os.close(fd)
+    try:
+        hasher = hashlib.sha256()
+        size = await stream_to_file(iter_upload_file(file), temp_path, max_bytes, hasher)
+        logger.info(f"アップロードファイルを一時保存しました: path={temp_path}, size={size}")
+        return temp_path, hasher.hexdigest()
+    except Exception:
+        # 途中で失敗した場合は書きかけのファイルを削除
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
+
+def get_block_id(part_number: int) -> str:
+    """パート番号に対応するブロックIDを返す（同じブロブのブロックIDは同じ長さにする必要がある）"""
+    return f"part_{part_number:05d}"
+
+def expected_part_size(total_size: int, part_size: int, total_parts: int, part_number: int) -> int:
+    """
+    パート番号に対応する想定サイズを返す（最後のパートのみ端数）
+
+    Args:
+        total_size (int): ファイル全体のサイズ
+        part_size (int): 1パートあたりのサイズ
+        total_parts (int): パート数
+        part_number (int): パート番号（1始まり）
+
+    Returns:
+        int: 想定サイズ（バイト）
+    """
+    if part_number < total_parts:
+        return part_size
+    return total_size - part_size * (total_parts - 1)
+
+async def stage_upload_part(blob_name: str, part_number: int, chunks: AsyncIterator[bytes], expected_size: int) -> int:
+    """
+    パートを一時ファイルに書き出し、サイズが正しい場合のみ動画のブロブのブロックとして書き込む
+    （再送が途中で切れても受信済みのパートを壊さない）
+
+    パートはAPIのノードに残さずBlobに書き込むため、同じセッションのパートを別のノードで受信してもよい。
+    全パートの受信後にstorage.commit_video_blocksで結合する。
+
+    Args:
+        blob_name (str): 動画のブロブ名
+        part_number (int): パート番号
+        chunks (AsyncIterator[bytes]): パートのデータ
+        expected_size (int): パートの想定サイズ（バイト）
+
+    Returns:
+        int: 書き込んだバイト数
+
+    Raises:
+        HTTPException: サイズが想定と異なる場合
+    """
+    fd, temp_path = tempfile.mkstemp(prefix=UPLOAD_TEMP_PREFIX, dir=UPLOAD_SCRATCH_DIR)
+    os.close(fd)
+    try:
+        size = await stream_to_file(chunks, temp_path, expected_size)
+        if size != expected_size:
+            raise HTTPException(
+                status_code=400,
+                detail=f"パートのサイズが不正です: expected={expected_size}, actual={size}"
+            )
+        await storage.stage_video_block(blob_name, get_block_id(part_number), temp_path)
+        return size
+    finally:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+
+def sweep_orphaned_temp_files(active_file_paths: List[str]) -> int:
+    """
+    処理中・処理待ちのジョブが参照していないアップロードの一時ファイルを削除する（起動時に呼ぶ）
+
+    Args:
+        active_file_paths (List[str]): 処理中・処理待ちのジョブが参照するファイルのパス
+
+    Returns:
+        int: 削除したファイル数
+    """
+    base_dir = UPLOAD_SCRATCH_DIR or tempfile.gettempdir()
+    active_paths = {os.path.abspath(path) for path in active_file_paths if path}
+    expired_before = time.time() - UPLOAD_ORPHAN_MIN_AGE_SECONDS
+    removed = 0
+    for name in os.listdir(base_dir):
+        path = os.path.abspath(os.path.join(base_dir, name))
+        if not name.startswith(UPLOAD_TEMP_PREFIX) or path in active_paths:
+            continue
+        try:
+            if os.path.isfile(path) and os.path.getmtime(path) < expired_before:
+                os.unlink(path)
+                removed += 1
+        except OSError:
+            pass
+    return removed
@@ -0,0 +1,197 @@
+from db_control import crud
+from db_control.connect import SessionLocal
+from utils.pipeline import process_video
+from utils import scratch, transcription, upload
+from dotenv import load_dotenv
+import asyncio
+import logging
+import os
+import signal
+import socket
+import uuid
+
+# ロギングの設定
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# 同時に処理するジョブ数
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "2"))
+# ジョブのリース期間（秒）。この間ハートビートがなければ他のワーカーが再取得する
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "300"))
+# ハートビートの送信間隔（秒）
+JOB_HEARTBEAT_SECONDS = int(os.getenv("JOB_HEARTBEAT_SECONDS", "30"))
+# キューが空のときのポーリング間隔（秒）
+JOB_POLL_INTERVAL_SECONDS = float(os.getenv("JOB_POLL_INTERVAL_SECONDS", "2"))
+# 失敗したジョブを再試行するまでの待機時間（秒）
+JOB_RETRY_DELAY_SECONDS = int(os.getenv("JOB_RETRY_DELAY_SECONDS", "60"))
+
+def _remove_file(file_path: str) -> None:
+    if not file_path:
+        return
+    try:
+        os.unlink(file_path)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.error(f"一時ファイルの削除に失敗: {str(e)}")
+
+async def _heartbeat(job_id: int, worker_id: str, job_task: asyncio.Task) -> None:
+    """
+    ジョブのリースを定期的に延長する。リースを失った場合はジョブを中断する
+    """
+    while not job_task.done():
+        await asyncio.sleep(JOB_HEARTBEAT_SECONDS)
+        db = SessionLocal()
+        try:
+            if not crud.heartbeat_processing_job(db, job_id, worker_id, JOB_LEASE_SECONDS):
+                logger.error(f"ジョブのリースを失ったため処理を中断します: job_id={job_id}")
+                job_task.cancel()
+                return
+        except Exception as e:
+            logger.error(f"ハートビートの送信に失敗: job_id={job_id}, error={str(e)}")
+        finally:
+            db.close()
+
+async def run_job(job_id: int, minutes_id: int, file_path: str, worker_id: str) -> None:
+    """
+    ジョブを1件実行し、結果をジョブテーブルに記録する
+
+    Args:
+        job_id (int): ジョブID
+        minutes_id (int): 議事録ID
+        file_path (str): アップロードされた一時ファイルのパス
+        worker_id (str): ワーカーID
+    """
+    logger.info(f"ジョブを開始: job_id={job_id}, minutes_id={minutes_id}, worker_id={worker_id}")
+    # リクエストのセッションは使わず、ジョブごとにセッションを作成
+    db = SessionLocal()
+    job_task = asyncio.create_task(process_video(file_path, minutes_id, db))
+    heartbeat_task = asyncio.create_task(_heartbeat(job_id, worker_id, job_task))
+    try:
+        await job_task
+        result_db = SessionLocal()
+        try:
+            crud.complete_processing_job(result_db, job_id, worker_id)
+        finally:
+            result_db.close()
+        _remove_file(file_path)
+        logger.info(f"ジョブが完了しました: job_id={job_id}")
+    except asyncio.CancelledError:
+        if not asyncio.current_task().cancelling():
+            # リースを失った場合はジョブが他のワーカーに移っているため何もしない
+            logger.warning(f"リース喪失によりジョブを中断しました: job_id={job_id}")
+            return
+        # ワーカーの停止による中断はキューに戻す
+        result_db = SessionLocal()
+        try:
+            crud.release_processing_job(result_db, job_id, worker_id)
+        finally:
+            result_db.close()
+        logger.warning(f"ワーカー停止のためジョブをキューに戻しました: job_id={job_id}")
+        raise
+    except Exception as e:
+        result_db = SessionLocal()
+        try:
+            # 音声トラックがない動画は、再試行しても文字起こしできないため1回で失敗とする
+            will_retry = crud.fail_processing_job(
+                result_db, job_id, worker_id, str(e), JOB_RETRY_DELAY_SECONDS,
+                retry=not isinstance(e, transcription.NoAudioError)
+            )
+        finally:
+            result_db.close()
+        if will_retry:
+            logger.warning(f"ジョブが失敗したため再試行します: job_id={job_id}, error={str(e)}")
+        else:
+            _remove_file(file_path)
+            scratch.manager.remove_work_dir(minutes_id)
+            logger.error(f"ジョブが失敗しました: job_id={job_id}, error={str(e)}")
+    finally:
+        heartbeat_task.cancel()
+        if not job_task.done():
+            job_task.cancel()
+        db.close()
+
+async def _worker_slot(slot: int, worker_id: str, stop_event: asyncio.Event) -> None:
+    while not stop_event.is_set():
+        db = SessionLocal()
+        try:
+            job = crud.claim_processing_job(db, worker_id, JOB_LEASE_SECONDS)
+            job_args = (job.id, job.minutes_id, job.file_path) if job else None
+        except Exception as e:
+            logger.error(f"ジョブの取得に失敗: {str(e)}")
+            job_args = None
+        finally:
+            db.close()
+
+        if not job_args:
+            try:
+                await asyncio.wait_for(stop_event.wait(), timeout=JOB_POLL_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            continue
+
+        await run_job(*job_args, worker_id)
+
+async def run_worker(stop_event: asyncio.Event, concurrency: int = WORKER_CONCURRENCY) -> None:
+    """
+    ジョブワーカーを起動し、stop_eventがセットされるまでジョブを処理する
+
+    停止時に実行中のジョブは中断してキューに戻すため、他のワーカーがすぐに再開できる。
+
+    Args:
+        stop_event (asyncio.Event): 停止要求
+        concurrency (int): 同時に処理するジョブ数
+    """
+    worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+    logger.info(f"ジョブワーカーを起動: worker_id={worker_id}, concurrency={concurrency}")
+
+    # "processing"のまま取り残された動画を再開する
+    db = SessionLocal()
+    try:
+        requeued = crud.requeue_orphaned_videos(db)
+        if requeued:
+            logger.warning(f"中断された動画処理を{requeued}件再登録しました")
+    except Exception as e:
+        logger.error(f"中断された動画処理の確認に失敗: {str(e)}")
+    finally:
+        db.close()
+
+    # 処理中・処理待ちのジョブに属さない中間ファイル（異常終了したプロセスの残り）を削除する
+    db = SessionLocal()
+    try:
+        active_jobs = crud.get_active_jobs(db)
+        removed = scratch.manager.sweep(minutes_id for minutes_id, _ in active_jobs)
+        removed += upload.sweep_orphaned_temp_files([file_path for _, file_path in active_jobs])
+        if removed:
+            logger.warning(f"不要になった中間ファイルを{removed}件削除しました")
+    except Exception as e:
+        logger.error(f"不要な中間ファイルの削除に失敗: {str(e)}")
+    finally:
+        db.close()
+    slots = [
+        asyncio.create_task(_worker_slot(i, worker_id, stop_event))
+        for i in range(concurrency)
+    ]
+    try:
+        await stop_event.wait()
+    finally:
+        for slot in slots:
+            slot.cancel()
+        await asyncio.gather(*slots, return_exceptions=True)
+        logger.info(f"ジョブワーカーを停止しました: worker_id={worker_id}")
+
+async def main() -> None:
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+    await run_worker(stop_event)
+
+# python worker.py でAPIとは別プロセスのワーカーとして起動する
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -7,6 +7,7 @@ export type HistoryItem = {
   minutes_id: number | string;
   title: string;
   image_url: string;
+  placeholder_url?: string | null;
   created_at: string;
 };
 